@@ -0,0 +1,176 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# (minimum amount, seconds on screen); the highest tier an amount reaches wins
+DEFAULT_TIERS = ((0, 5), (100, 8), (1000, 12), (10000, 20))
+# Small donations queued behind each other are shown as one alert
+DEFAULT_MERGE_BELOW = 25
+MAX_MERGED = 20
+# Pause between two alerts so overlays can play their exit animation
+GAP_SECONDS = 0.5
+MAX_QUEUE = 200
+HISTORY_SIZE = 50
+
+
+class AlertScheduler:
+    # Queues donation alerts for one tracked user and dispatches them one at
+    # a time, each for a duration based on its amount. During a rush, small
+    # donations waiting in the queue are merged instead of flooding overlays.
+    def __init__(self, user_id, publish=None, tiers=DEFAULT_TIERS, merge_below=DEFAULT_MERGE_BELOW):
+        self.user_id = user_id
+        self.publish = publish  # async def publish(message)
+        self.tiers = tiers
+        self.merge_below = merge_below
+        self.queue = deque()
+        self.history = deque(maxlen=HISTORY_SIZE)
+        self.current = None
+        self.current_ends = None  # monotonic
+        self.next_id = 1
+        self.dispatched = 0
+        self.merged = 0
+        self.skipped = 0
+        self.dropped = 0
+        self._wakeup = asyncio.Event()
+        self._skip = asyncio.Event()
+        self._task = None
+
+    def configure(self, tiers=None, merge_below=None):
+        if tiers:
+            self.tiers = tuple(sorted(tuple(tier) for tier in tiers))
+        if merge_below is not None:
+            self.merge_below = merge_below
+
+    def duration(self, amount):
+        seconds = self.tiers[0][1] if self.tiers else 5
+        for minimum, tier_seconds in self.tiers:
+            if amount >= minimum:
+                seconds = tier_seconds
+        return seconds
+
+    def push(self, event):
+        amount = event.get("amount", 0)
+        donation = {
+            "sender_name": event.get("sender_name"),
+            "sender_user": event.get("sender_user"),
+            "amount": amount,
+            "message": event.get("message"),
+        }
+
+        # Only merge into an alert that is still waiting, never the one on screen
+        tail = self.queue[-1] if self.queue else None
+        if (amount < self.merge_below and tail is not None and tail["mergeable"]
+                and not tail["replay"] and len(tail["donations"]) < MAX_MERGED):
+            tail["donations"].append(donation)
+            tail["amount"] += amount
+            tail["count"] += 1
+            tail["duration"] = self.duration(tail["amount"])
+            self.merged += 1
+        else:
+            if len(self.queue) >= MAX_QUEUE:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append({
+                "type": "alert",
+                "id": self.next_id,
+                "user_id": self.user_id,
+                "amount": amount,
+                "count": 1,
+                "duration": self.duration(amount),
+                "donations": [donation],
+                "mergeable": amount < self.merge_below,
+                "replay": False,
+            })
+            self.next_id += 1
+
+        self._ensure_running()
+        self._wakeup.set()
+
+    def skip(self):
+        if self.current is None:
+            return False
+        self._skip.set()
+        return True
+
+    def replay(self, alert_id=None):
+        # Show a past alert again, ahead of anything queued
+        for alert in reversed(self.history):
+            if alert_id is None or alert["id"] == alert_id:
+                again = dict(alert, replay=True)
+                self.queue.appendleft(again)
+                self._ensure_running()
+                self._wakeup.set()
+                return again
+        return None
+
+    def clear(self):
+        cleared = len(self.queue)
+        self.dropped += cleared
+        self.queue.clear()
+        return cleared
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name=f"alerts-{self.user_id}")
+
+    async def _run(self):
+        while True:
+            if not self.queue:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            alert = self.queue.popleft()
+            self.current = alert
+            self.current_ends = time.monotonic() + alert["duration"]
+            self._skip.clear()
+            if not alert["replay"]:
+                self.history.append(alert)
+            self.dispatched += 1
+            await self._publish(alert)
+
+            skipped = False
+            try:
+                await asyncio.wait_for(self._skip.wait(), alert["duration"])
+                skipped = True
+                self.skipped += 1
+            except asyncio.TimeoutError:
+                pass
+
+            self.current = None
+            self.current_ends = None
+            await self._publish({"type": "alert_end", "user_id": self.user_id, "id": alert["id"], "skipped": skipped})
+            await asyncio.sleep(GAP_SECONDS)
+
+    async def _publish(self, message):
+        if self.publish is None:
+            return
+        try:
+            await self.publish(message)
+        except Exception as e:
+            logger.error(f"Failed to publish alert for {self.user_id}: {e}")
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def state(self):
+        current = None
+        if self.current is not None:
+            current = dict(self.current, remaining_s=round(max(self.current_ends - time.monotonic(), 0), 3))
+        return {
+            "user_id": self.user_id,
+            "current": current,
+            "queue": list(self.queue),
+            "history": list(self.history),
+            "tiers": [list(tier) for tier in self.tiers],
+            "merge_below": self.merge_below,
+            "dispatched": self.dispatched,
+            "merged": self.merged,
+            "skipped": self.skipped,
+            "dropped": self.dropped,
+        }
@@ -0,0 +1,185 @@
+import heapq
+import time
+from operator import itemgetter
+
+# name -> (span, bucket width) in seconds. Rolling values move in steps of
+# one bucket, which is plenty for overlay goals and "last hour" widgets.
+WINDOWS = {
+    "5m": (300, 10),
+    "1h": (3600, 60),
+}
+TOP_DONORS = 5
+
+
+class _Bucket:
+    __slots__ = ("total", "count", "largest", "largest_user", "donors")
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self.total = 0
+        self.count = 0
+        self.largest = 0
+        self.largest_user = None
+        self.donors = {}  # donor key -> amount within this bucket
+
+
+class RollingWindow:
+    # Ring of fixed-width time buckets with running totals. add() touches one
+    # bucket; buckets that fall out of the window are subtracted as the ring
+    # advances, so nothing is ever recomputed from history.
+    def __init__(self, span, width):
+        self.span = span
+        self.width = width
+        self.size = span // width
+        self.buckets = [_Bucket() for _ in range(self.size)]
+        self.current = None  # index (ts // width) of the newest bucket
+        self.total = 0
+        self.count = 0
+        self.donors = {}  # donor key -> amount within the window
+
+    def advance(self, now):
+        index = int(now // self.width)
+        if self.current is None:
+            self.current = index
+            return
+        if index <= self.current:
+            return
+        # Only the last `size` indexes map to distinct slots
+        for i in range(max(self.current + 1, index - self.size + 1), index + 1):
+            self._expire(self.buckets[i % self.size])
+        self.current = index
+
+    def _expire(self, bucket):
+        if bucket.count:
+            self.total -= bucket.total
+            self.count -= bucket.count
+            for username, amount in bucket.donors.items():
+                remaining = self.donors[username] - amount
+                if remaining > 0:
+                    self.donors[username] = remaining
+                else:
+                    del self.donors[username]
+            bucket.clear()
+
+    def add(self, ts, username, amount):
+        index = int(ts // self.width)
+        self.advance(ts)
+        if index <= self.current - self.size:
+            return  # Older than the window (e.g. replayed on startup)
+        bucket = self.buckets[index % self.size]
+        bucket.total += amount
+        bucket.count += 1
+        bucket.donors[username] = bucket.donors.get(username, 0) + amount
+        if amount > bucket.largest:
+            bucket.largest = amount
+            bucket.largest_user = username
+        self.total += amount
+        self.count += 1
+        self.donors[username] = self.donors.get(username, 0) + amount
+
+    def largest(self):
+        best = max(self.buckets, key=lambda b: b.largest)
+        return (best.largest_user, best.largest) if best.count else None
+
+
+class Analytics:
+    # Session and rolling-window aggregates for one tracked user, fed one
+    # donation at a time. Reads are cheap enough to serve on every request.
+    def __init__(self, top=TOP_DONORS):
+        self.top = top
+        self.started = None
+        self.total = 0
+        self.count = 0
+        self.largest_amount = 0
+        self.largest_user = None
+        self.donors = {}  # donor key -> session total
+        self.names = {}   # donor key -> (username, display name)
+        self.windows = {name: RollingWindow(span, width) for name, (span, width) in WINDOWS.items()}
+        self.version = 0
+
+    def add(self, username, name, amount, ts=None, key=None):
+        # `key` is the donor registry's key (defaults to the username)
+        if key is None:
+            key = username
+        if ts is None:
+            ts = time.time()
+        if self.started is None or ts < self.started:
+            self.started = ts
+        self.total += amount
+        self.count += 1
+        self.donors[key] = self.donors.get(key, 0) + amount
+        self.names[key] = (username, name)
+        if amount > self.largest_amount:
+            self.largest_amount = amount
+            self.largest_user = key
+        for window in self.windows.values():
+            window.add(ts, key, amount)
+        self.version += 1
+
+    def trim(self, max_donors):
+        # Keep session totals for the `max_donors` biggest donors only, and
+        # names for those plus whoever the rolling windows still hold.
+        # Totals and counts are unaffected. Returns how many were dropped.
+        dropped = len(self.donors) - max_donors
+        if dropped <= 0:
+            return 0
+        self.donors = dict(heapq.nlargest(max_donors, self.donors.items(), key=itemgetter(1)))
+        named = set(self.donors)
+        named.add(self.largest_user)
+        for window in self.windows.values():
+            named.update(window.donors)
+        self.names = {key: names for key, names in self.names.items() if key in named}
+        return dropped
+
+    def state_key(self, now=None):
+        # Changes whenever a snapshot would: on donations, and on bucket
+        # rollovers while a rolling window still holds anything
+        now = time.time() if now is None else now
+        key = [self.version]
+        for window in self.windows.values():
+            window.advance(now)
+            if window.count:
+                key.append(window.current)
+        return tuple(key)
+
+    def _donor(self, key, amount):
+        username, name = self.names.get(key, (key, key))
+        return {"username": username, "name": name, "amount": amount}
+
+    def _summary(self, total, count, largest, donors, minutes, top):
+        return {
+            "total": total,
+            "count": count,
+            "per_min": round(count / minutes, 2) if minutes else 0.0,
+            "largest": self._donor(*largest) if largest else None,
+            "top": [self._donor(u, a) for u, a in heapq.nlargest(top, donors.items(), key=itemgetter(1))],
+        }
+
+    def snapshot(self, top=None, now=None):
+        now = time.time() if now is None else now
+        top = self.top if top is None else top
+        # Rates are per minute of the window, or of the session if it's shorter
+        elapsed = now - self.started if self.started else 0
+        minutes = max(elapsed / 60, 1) if self.started else 0
+
+        largest = (self.largest_user, self.largest_amount) if self.count else None
+        windows = {"session": self._summary(self.total, self.count, largest, self.donors, minutes, top)}
+        for name, window in self.windows.items():
+            window.advance(now)
+            window_minutes = min(window.span / 60, minutes)
+            windows[name] = self._summary(window.total, window.count, window.largest(),
+                                          window.donors, window_minutes, top)
+        return {
+            "version": self.version,
+            "started": self.started,
+            "windows": windows,
+        }
+
+    def update(self, user_id):
+        # Pushed over /ws; replaces the previous stats message for the user
+        message = self.snapshot()
+        message["type"] = "stats"
+        message["user_id"] = user_id
+        return message
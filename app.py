@@ -1,11 +1,17 @@
+import time
+IMPORT_STARTED = time.perf_counter()
+
+import argparse
 import asyncio
-import json
+import atexit
 import logging
+import socket
+import subprocess
 import sys
 import os
+import signal
 import threading
 import traceback
-import time
 from datetime import datetime
 
 VERSION = "v1.0.1"
@@ -20,34 +26,43 @@ def exception_hook(exctype, value, tb):
 
 sys.excepthook = exception_hook
 
-try:
-    import pyperclip
-except ImportError:
-    print("Warning: pyperclip not found. Clipboard features will be disabled.")
-    pyperclip = None
-
-from quart import Quart, render_template, websocket, request, jsonify
+from quart import Quart, Response, render_template, websocket, request, jsonify
 import websockets
 from chat_manager import ChatManager
+from broadcaster import Broadcaster, TOPICS, parse_topics, parse_min_amount
+from event_store import EventStore
+from donors import DonorRegistry
+from bus import LocalBus, BusHub, BusClient
+import logbuffer
+from assets import StaticAssets, PageCache, respond, IMMUTABLE, REVALIDATE
+from streams import Stream, ListenerSupervisor
+from sinks import Pipeline, Envelope, LogSink, OverlaySink, ChatSink, WebhookSink, FileSink, ObsSink, export_path
+from analytics import Analytics
+from metrics import Registry, RateMeter, resident_memory_bytes
+import codec
+import wire
+from codec import Donation
+from config_store import ConfigStore, SCHEMA, ALERT_KEYS, CHAT_KEYS, SINK_KEYS, USER_KEYS
 
-# Try to import PyQt6 for GUI
-try:
-    from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QTextEdit, QProgressBar, QMessageBox
-    from PyQt6.QtWebEngineWidgets import QWebEngineView
-    from PyQt6.QtWebEngineCore import QWebEnginePage
-    from PyQt6.QtGui import QDesktopServices
-    from PyQt6.QtCore import QUrl, QTimer, pyqtSignal, QObject
-    GUI_AVAILABLE = True
-except ImportError:
-    GUI_AVAILABLE = False
+# PyQt6, twitchio, the Google API client and pyperclip are imported only
+# when they're used, so --headless servers start without them
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
 
-# Determine paths for PyInstaller
+# Determine paths for PyInstaller. Static files are served from memory by
+# static_file() below, so Quart's own static route is turned off.
 if getattr(sys, 'frozen', False):
     template_folder = os.path.join(sys._MEIPASS, 'templates')
     static_folder = os.path.join(sys._MEIPASS, 'static')
-    app = Quart(__name__, template_folder=template_folder, static_folder=static_folder)
+    app = Quart(__name__, template_folder=template_folder, static_folder=None)
 else:
-    app = Quart(__name__)
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    app = Quart(__name__, static_folder=None)
+
+# Rendered pages and static files are kept compressed in memory with
+# ETags, so OBS reloading many sources at once costs one render
+static_assets = StaticAssets(static_folder)
+page_cache = PageCache()
+app.jinja_env.globals["static_url"] = static_assets.url
 
 # Configuration
 if getattr(sys, 'frozen', False):
@@ -60,164 +75,761 @@ else:
     # If running from source, save to current directory
     config_file = "config.json"
 
-config = {
-    "user_id": None,
-    "min_amount": 0,
-    "chat_template": "Thanks for the {amount}R$ donation by @{username}",
-    "twitch_enabled": False,
-    "twitch_token": "",
-    "twitch_channel": "",
-    "youtube_enabled": False,
-    "youtube_token": "",
-    "youtube_chat_id": ""
-}
-
-# Load config
-try:
-    with open(config_file, "r") as f:
-        saved_config = json.load(f)
-        config.update(saved_config)
-except FileNotFoundError:
-    pass
+# Donation log lives next to the config file
+data_dir = os.path.dirname(os.path.abspath(config_file))
+
+# Validated on load; saves are atomic, debounced and run off the event loop
+config_store = ConfigStore(config_file)
+config = config_store.load()
 
 # State
-connected_clients = set()
-BASE_WS = "wss://stream.plsdonate.com/api/user/{}/websocket"
-donation_history = []  # Store session history
+broadcaster = Broadcaster()
+connected_clients = broadcaster.clients
+# Overridable so the app can be pointed at bench/fake_upstream.py
+BASE_WS = os.environ.get("PLSDONATE_BASE_WS", "wss://stream.plsdonate.com/api/user/{}/websocket")
+event_store = EventStore(os.path.join(data_dir, "donations.db"))  # Persistent session history
+donor_registry = DonorRegistry(store=event_store)  # One leaderboard row per person, see donors.py
+STATS_INTERVAL = 1
+HOUSEKEEPING_INTERVAL = 60
+WORKER_STOP_TIMEOUT = 5  # seconds workers get to shut down before they're killed
+WS_PING_INTERVAL = 20
+# Users nobody tracks or watches any more are dropped after this long
+STREAM_IDLE = 600  # seconds
+# --bounded-memory, for streams running many hours: per-user donor totals are capped
+BOUNDED_MAX_DONORS = 5000
+streams = {}  # user_id -> Stream (per-user leaderboard and /ws/<user_id> clients)
 chat_manager = ChatManager()
+# One process by default. With --workers the main process also serves the
+# event bus (bus.py) and worker processes serve overlays from its events.
+deployment = {"role": "main", "bus": None, "bounded": False}
+bus = LocalBus()  # replaced in startup() when a bus address is set
+bus_backlog = None  # worker: donations received while resyncing from the store
+worker_processes = []  # main: the --workers children
+# Called (from the server thread) once startup has finished; the listening
+# socket is already open by then
+ready_callbacks = []
+startup_times = {"imports": IMPORT_SECONDS}
+
+def all_clients():
+    clients = list(broadcaster.clients)
+    for stream in streams.values():
+        clients.extend(stream.broadcaster.clients)
+    return clients
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
-)
+# Metrics, served at /metrics. Hot-path instruments are bound once here so
+# each observation is just a perf_counter delta and a bisect.
+metrics = Registry(prefix="plsdonate_")
+UPSTREAM_MESSAGES = metrics.counter("upstream_messages_total", "Frames received from PLS DONATE, including pings", ("user_id",))
+upstream_rate = RateMeter()
+metrics.gauge("upstream_messages_per_second", "Upstream frames per second (10s average)", fn=upstream_rate.rate)
+DONATIONS = metrics.counter("donations_total", "Donations processed", ("user_id",))
+DUPLICATES = metrics.counter("upstream_duplicates_total", "Replayed donations suppressed after reconnects", ("user_id",))
+RECONNECTS = metrics.counter("upstream_reconnects_total", "Upstream connections lost or failed", ("user_id",))
+STAGE_SECONDS = metrics.histogram("stage_seconds", "Time spent in each donation pipeline stage", ("stage",))
+DECODE_TIME = STAGE_SECONDS.labels("decode")
+PARSE_TIME = STAGE_SECONDS.labels("parse")
+LEADERBOARD_TIME = STAGE_SECONDS.labels("leaderboard")
+DISPATCH_TIME = STAGE_SECONDS.labels("dispatch")
+TOTAL_TIME = STAGE_SECONDS.labels("total")
+# Outputs (overlays, chat, log, webhook, ...) each drain their own queue
+SINK_SECONDS = metrics.histogram("sink_seconds", "Time from a donation arriving until each output handled it", ("sink",))
+pipeline = Pipeline(latency=SINK_SECONDS)
+metrics.gauge("connected_clients", "Open /ws connections", fn=lambda: len(all_clients()))
+metrics.gauge("client_send_lag_seconds", "Worst enqueue-to-send delay across /ws clients",
+              fn=lambda: max((max(c.lag, c.oldest_age()) for c in all_clients()), default=0.0))
+metrics.gauge("client_queue_depth", "Messages waiting in /ws client send queues",
+              fn=lambda: sum(len(c.queue) for c in all_clients()))
+metrics.gauge("client_dropped_messages", "Messages dropped for slow clients that are still connected",
+              fn=lambda: sum(c.dropped for c in all_clients()))
+metrics.gauge("startup_seconds", "Time spent importing, in startup and until ready to serve", ("phase",),
+              fn=lambda: {(phase,): seconds for phase, seconds in startup_times.items()})
+metrics.gauge("sink_queue_depth", "Donations waiting in each output's queue", ("sink",),
+              fn=lambda: {(name,): stats["queued"] for name, stats in pipeline.stats().items()})
+metrics.gauge("sink_failures", "Donations an output gave up on after retries", ("sink",),
+              fn=lambda: {(name,): stats["failed"] for name, stats in pipeline.stats().items()})
+metrics.gauge("resident_memory_bytes", "Resident set size of this process", fn=resident_memory_bytes)
+EVICTIONS = metrics.counter("evictions_total", "Stale clients, idle untracked streams and, with --bounded-memory, donors dropped",
+                            ("kind",))
+metrics.gauge("donor_cache_size", "Donor aliases held in memory", fn=lambda: len(donor_registry.cache))
+metrics.gauge("donor_cache_misses", "Donor lookups that went to the store", fn=lambda: donor_registry.misses)
+metrics.gauge("chat_queue_depth", "Chat messages waiting to be sent", ("platform",),
+              fn=lambda: {(name,): stats["queued"] for name, stats in chat_manager.stats().items()})
+
+# Logging only enqueues records; a listener thread formats them for the
+# console and the ring buffer behind the GUI log view and /api/logs
+log_ring = logbuffer.LogRing()
+logbuffer.install(log_ring, '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 # Silence annoying google cache warning
 logging.getLogger('googleapiclient.discovery_cache').setLevel(logging.ERROR)
 logger = logging.getLogger(__name__)
 
-def save_config():
-    with open(config_file, "w") as f:
-        json.dump(config, f)
+def get_stream(user_id):
+    user_id = str(user_id)
+    stream = streams.get(user_id)
+    if stream is None:
+        stream = streams[user_id] = Stream(user_id)
+        stream.alerts.publish = lambda message: publish_message(message, stream)
+        stream.alerts.configure(config.get("alert_tiers"), config.get("alert_merge_below"))
+    stream.last_used = time.monotonic()
+    return stream
 
-async def broadcast(message):
-    for client in connected_clients:
-        try:
-            await client.send(json.dumps(message))
-        except Exception:
-            pass
+def find_stream(user_id):
+    # For requests: a Stream is only created for tracked users, so asking
+    # about arbitrary ids can't grow memory. None for anyone else.
+    user_id = str(user_id)
+    if user_id in streams or user_id in tracked_user_ids():
+        return get_stream(user_id)
+    return None
+
+def tracked_user_ids():
+    user_ids = [config.get("user_id")] + list(config.get("extra_user_ids") or [])
+    # Keep order, drop blanks and duplicates
+    return list(dict.fromkeys(str(u).strip() for u in user_ids if u and str(u).strip()))
+
+def event_time(event):
+    # Stored events carry a local wall-clock timestamp string
+    try:
+        return datetime.strptime(event["timestamp"], "%Y-%m-%d %H:%M:%S").timestamp()
+    except (KeyError, TypeError, ValueError):
+        return None
+
+def primary_user_id():
+    user_ids = tracked_user_ids()
+    return user_ids[0] if user_ids else None
+
+def wants(topic, stream=None):
+    # True if any /ws or /ws/<user_id> client is subscribed to the topic
+    return broadcaster.wants(topic) or (stream is not None and stream.broadcaster.wants(topic))
+
+async def broadcast(message, stream=None, coalesce_key=None):
+    send_to_clients(message, stream, coalesce_key)
+
+def send_to_clients(message, stream=None, coalesce_key=None):
+    # Non-blocking: each client drains its own bounded queue concurrently,
+    # and clients whose sends fail are evicted by their writer task.
+    # /ws gets every stream, /ws/<user_id> only its own.
+    payloads = {}
+    broadcaster.publish(message, coalesce_key=coalesce_key, payloads=payloads)
+    if stream:
+        stream.broadcaster.publish(message, coalesce_key=coalesce_key, payloads=payloads)
 
-async def plsdonate_listener():
-    current_user_id = None
+async def publish_message(message, stream):
+    # Messages only the main process makes (alerts) also go to workers
+    send_to_clients(message, stream)
+    bus.publish("message", message)
+
+async def plsdonate_listener(user_id):
+    # One of these runs per tracked user; the supervisor cancels it when the
+    # user is removed from the config
+    stream = get_stream(user_id)
+    monitor = stream.monitor
+    url = BASE_WS.format(user_id)
+    upstream_messages = UPSTREAM_MESSAGES.labels(user_id)
+    donations = DONATIONS.labels(user_id)
     
     while True:
-        target_user_id = config.get("user_id")
-        
-        if not target_user_id:
-            await asyncio.sleep(1)
-            continue
-            
-        url = BASE_WS.format(target_user_id)
         logger.info(f"Connecting to {url}...")
+        monitor.connecting()
+        reason = "closed by server"
         
         try:
             # Add ping_interval to keep connection alive (every 10s)
             async with websockets.connect(url, ping_interval=10, ping_timeout=10) as ws:
-                logger.info(f"Connected to stream for user {target_user_id}")
-                current_user_id = target_user_id
+                logger.info(f"Connected to stream for user {user_id}")
+                monitor.connected()
+                # Reconnects if upstream stops sending frames (pings included)
+                watchdog = asyncio.create_task(monitor.watch(ws))
                 
-                async for msg in ws:
-                    # If user ID changed, break to reconnect
-                    if config.get("user_id") != current_user_id:
-                        logger.info("User ID changed, reconnecting...")
-                        break
-                        
-                    try:
-                        data = json.loads(msg)
-                        if "ping_interval" in data:
-                             # It's a ping message, ignore
-                             continue
-                        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        # Process donation
-                        if "sender" in data and "amount" in data:
-                            sender_name = data["sender"].get("displayName", "Unknown")
-                            sender_user = data["sender"].get("username", "Unknown")
-                            amount = data.get("amount", 0)
-                            message = data.get("message", "")
-                            
-                            event = {
-                                "type": "donation",
-                                "timestamp": timestamp,
-                                "sender_name": sender_name,
-                                "sender_user": sender_user,
-                                "amount": amount,
-                                "message": message,
-                                "raw": data
-                            }
-                            
-                            # Add to history
-                            donation_history.append(event)
-                            # Keep history reasonable
-                            if len(donation_history) > 100:
-                                donation_history.pop(0)
-                                
-                            logger.info(f"Donation: {sender_name} - {amount}")
-                            await broadcast(event)
-                            
-                            # Send chat message if amount meets threshold
-                            if amount >= config.get("min_amount", 0):
-                                await chat_manager.send_message(event)
-                        else:
-                            # Forward other events if needed
-                            pass
-                            
-                    except json.JSONDecodeError:
-                        logger.error(f"Received non-JSON message: {msg}")
-                    except Exception as e:
-                        logger.error(f"Error processing message: {e}")
+                try:
+                    async for msg in ws:
+                        monitor.frame()
+                        upstream_messages.inc()
+                        upstream_rate.mark()
+                        if codec.is_ping(msg):
+                            # It's a ping message; only parsed once to learn the interval
+                            if monitor.ping_interval is None:
+                                monitor.ping(codec.loads(msg))
+                            continue
+                        await handle_frame(msg, user_id, stream, donations)
+                finally:
+                    watchdog.cancel()
                         
+        except asyncio.CancelledError:
+            monitor.stopped()
+            raise
+        except Exception as e:
+            reason = str(e) or type(e).__name__
+            logger.error(f"Connection error ({user_id}): {e}")
+        
+        RECONNECTS.labels(user_id).inc()
+        delay = monitor.disconnected(reason)
+        logger.info(f"Reconnecting to stream for user {user_id} in {delay:.1f}s")
+        await asyncio.sleep(delay) # Wait before retry
+
+async def handle_frame(msg, user_id, stream, donations):
+    # Process one non-ping upstream frame
+    perf_counter = time.perf_counter
+    try:
+        t_start = perf_counter()
+        data = codec.loads(msg)
+        t_decoded = perf_counter()
+        DECODE_TIME.observe(t_decoded - t_start)
+        
+        # Process donation
+        donation = Donation.from_payload(data)
+        if donation and stream.monitor.is_duplicate(data):
+            # Replayed by upstream after a reconnect, already counted
+            DUPLICATES.labels(user_id).inc()
+            logger.info(f"Skipping duplicate donation for {user_id}: {donation.sender_name} - {donation.amount}")
+        elif donation:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            event = donation.to_event(user_id, timestamp)
+            donor = await donor_registry.resolve(donation.sender_id, donation.sender_user, donation.sender_name)
+            event["donor"] = donor.key
+            # After any wait above, so ids are handed out in publish order
+            event_store.assign_id(event)
+            t_parsed = perf_counter()
+            PARSE_TIME.observe(t_parsed - t_decoded)
+
+            logger.info(f"Donation for {user_id}: {donation.sender_name} - {donation.amount}")
+            # apply_donation() picks it up here and in every worker process
+            bus.publish("donation", event)
+            TOTAL_TIME.observe(perf_counter() - t_start)
+            donations.inc()
+        else:
+            # Forward other events if needed
+            pass
+            
+    except codec.DecodeError:
+        logger.error(f"Received non-JSON message: {msg}")
+    except Exception as e:
+        logger.error(f"Error processing message: {e}")
+
+def apply_donation(event):
+    # Bus subscriber: update this process' leaderboard and stats, then hand
+    # the donation to its outputs
+    perf_counter = time.perf_counter
+    t_start = perf_counter()
+    user_id = event["user_id"]
+    stream = get_stream(user_id)
+
+    # Update ranks incrementally; overlays only repaint changed rows
+    key = donor_registry.key_for(event)
+    changed_rows = stream.leaderboard.add(event["sender_user"], event["sender_name"], event["amount"], key)
+    stream.analytics.add(event["sender_user"], event["sender_name"], event["amount"], key=key)  # Pushed by stats_loop
+    delta = None
+    if changed_rows and wants("leaderboard", stream):
+        delta = stream.leaderboard.delta(changed_rows)
+        delta["user_id"] = user_id
+    t_leaderboard = perf_counter()
+    LEADERBOARD_TIME.observe(t_leaderboard - t_start)
+
+    # Overlays, chat, the log and any other outputs run on their own workers
+    pipeline.publish(Envelope(event, stream, delta, t_start))
+    DISPATCH_TIME.observe(perf_counter() - t_leaderboard)
+
+def restore_session(events):
+    # Rebuild session totals from the log, so a restart mid-stream doesn't
+    # lose the leaderboard
+    for event in events:
+        user_id = event.get("user_id") or primary_user_id()
+        if user_id:
+            stream = get_stream(user_id)
+            key = donor_registry.key_for(event)
+            stream.leaderboard.add(event["sender_user"], event["sender_name"], event["amount"], key)
+            stream.analytics.add(event["sender_user"], event["sender_name"], event["amount"], event_time(event), key)
+
+def bus_greeting():
+    # Sent by the main process to every worker that (re)connects
+    return [("hello", {"session": event_store.session_state(), "config": dict(config)})]
+
+def on_bus_hello(hello):
+    global bus_backlog
+    on_bus_config(hello["config"])
+    if bus_backlog is None:
+        bus_backlog = []
+        asyncio.create_task(resync(hello["session"]))
+
+def on_bus_donation(event):
+    if bus_backlog is not None:
+        bus_backlog.append(event)
+    else:
+        apply_donation(event)
+
+def on_bus_message(message):
+    user_id = message.get("user_id")
+    send_to_clients(message, get_stream(user_id) if user_id else None)
+
+async def resync(session):
+    # Worker: rebuild state from the shared store up to the hub's last id,
+    # then apply what arrived on the bus in the meantime
+    global bus_backlog
+    try:
+        events = await event_store.attach(session)
+        versions = {user_id: stream.leaderboard.version for user_id, stream in streams.items()}
+        for stream in streams.values():
+            stream.reset()
+        restore_session(events)
+        last_id = session["last_id"] or 0
+        backlog, bus_backlog = bus_backlog, None
+        for event in backlog:
+            if event["id"] > last_id:
+                apply_donation(event)
+        logger.info(f"Synced {len(events)} events of session {session['session_id']} from the store")
+
+        # Overlays that were already connected get the rebuilt rows, under a
+        # version newer than anything they've seen
+        for user_id, version in versions.items():
+            leaderboard = get_stream(user_id).leaderboard
+            leaderboard.version = max(leaderboard.version, version + 1)
+            delta = leaderboard.delta(leaderboard.top(leaderboard.window))
+            delta["user_id"] = user_id
+            send_to_clients(delta, get_stream(user_id))
+    except Exception as e:
+        bus_backlog = None
+        logger.error(f"Failed to sync from the event store: {e}")
+
+async def start_bus():
+    global bus
+    if deployment["role"] == "worker":
+        bus = BusClient(deployment["bus"])
+        bus.subscribe("hello", on_bus_hello)
+        bus.subscribe("config", on_bus_config)
+        bus.subscribe("message", on_bus_message)
+        bus.subscribe("donation", on_bus_donation)
+    else:
+        bus = BusHub(deployment["bus"], bus_greeting) if deployment["bus"] else LocalBus()
+        bus.subscribe("donation", apply_donation)
+    await bus.start()
+
+supervisor = ListenerSupervisor(plsdonate_listener)
+stats_task = None
+housekeeping_task = None
+
+async def stats_loop():
+    # Push stats after donations and as rolling windows move, at most once a
+    # second per user; slow clients only ever get the latest message
+    while True:
+        await asyncio.sleep(STATS_INTERVAL)
+        for user_id, stream in list(streams.items()):
+            if not wants("stats", stream):
+                continue
+            key = stream.analytics.state_key()
+            if key != stream.stats_key:
+                stream.stats_key = key
+                await broadcast(stream.analytics.update(user_id), stream, coalesce_key=f"stats:{user_id}")
+
+async def housekeeping_loop():
+    # Drop /ws clients that went away unnoticed and streams of users no
+    # longer tracked; with --bounded-memory, trim whatever grows with the session
+    while True:
+        await asyncio.sleep(HOUSEKEEPING_INTERVAL)
+        try:
+            housekeeping()
         except Exception as e:
-            logger.error(f"Connection error: {e}")
-            await asyncio.sleep(5) # Wait before retry
+            logger.error(f"Housekeeping failed: {e}")
+
+def housekeeping(now=None):
+    now = time.monotonic() if now is None else now
+    stale = broadcaster.sweep() + sum(stream.broadcaster.sweep() for stream in streams.values())
+    if stale:
+        EVICTIONS.labels("client").inc(stale)
+        logger.info(f"Dropped {stale} stale websocket client(s)")
+
+    tracked = set(tracked_user_ids())
+    for user_id, stream in list(streams.items()):
+        if (user_id not in tracked and not stream.broadcaster.clients
+                and now - stream.last_used > STREAM_IDLE):
+            stream.alerts.stop()
+            del streams[user_id]
+            EVICTIONS.labels("stream").inc()
+            logger.info(f"Dropped idle stream for untracked user {user_id}")
+
+    if deployment["bounded"]:
+        donors = 0
+        for stream in streams.values():
+            donors += stream.leaderboard.trim(BOUNDED_MAX_DONORS)
+            donors += stream.analytics.trim(BOUNDED_MAX_DONORS)
+        if donors:
+            EVICTIONS.labels("donor").inc(donors)
 
 @app.before_serving
 async def startup():
+    startup_began = time.perf_counter()
+    global stats_task, housekeeping_task
+    static_assets.load()
+    if deployment["role"] == "worker":
+        # Overlays only: the main process owns upstream, chat, the log and config
+        event_store.readonly = True
+        donor_registry.store = None  # Events arrive with their donor key
+        pipeline.register(LogSink(event_store))
+        pipeline.register(OverlaySink(broadcast, alerts=False))
+        await start_bus()
+        asyncio.create_task(watch_parent(os.getppid()))
+    else:
+        restore_session(await event_store.start())
+        await donor_registry.load()
+        await chat_manager.update_config(config)
+        pipeline.register(LogSink(event_store))
+        pipeline.register(OverlaySink(broadcast))
+        pipeline.register(ChatSink(chat_manager, config))
+        sync_sinks()
+        await start_bus()
+        # Use app.add_background_task is not reliable for long running task in some Quart versions/servers
+        # The supervisor creates proper asyncio tasks, one per tracked user
+        supervisor.sync(tracked_user_ids())
+    stats_task = asyncio.create_task(stats_loop())
+    housekeeping_task = asyncio.create_task(housekeeping_loop())
+
+    startup_times["startup"] = time.perf_counter() - startup_began
+    startup_times["ready"] = time.perf_counter() - IMPORT_STARTED
+    logger.info(f"Server ready in {startup_times['ready'] * 1000:.0f}ms "
+                f"(imports {startup_times['imports'] * 1000:.0f}ms, startup {startup_times['startup'] * 1000:.0f}ms)")
+    for callback in ready_callbacks:
+        callback()
+
+async def on_users_changed(change):
+    # Cancel/start listeners right away instead of waiting for the next upstream message
+    supervisor.sync(tracked_user_ids())
+
+async def on_chat_changed(change):
     await chat_manager.update_config(config)
-    # Use app.add_background_task is not reliable for long running task in some Quart versions/servers
-    # Create a proper asyncio task
-    asyncio.create_task(plsdonate_listener())
+
+async def on_alerts_changed(change):
+    # Applies to alerts queued from now on
+    for stream in list(streams.values()):
+        stream.alerts.configure(config.get("alert_tiers"), config.get("alert_merge_below"))
+
+sink_settings = {}  # optional sink name -> settings it was created with
+
+def sync_sinks():
+    # Register the optional outputs the config asks for; unchanged ones keep
+    # their queue and connection
+    wanted = {}
+    if config.get("webhook_url"):
+        wanted["webhook"] = (WebhookSink, config["webhook_url"])
+    if config.get("export_path"):
+        wanted["file"] = (FileSink, export_path(config["export_path"], data_dir))
+    if config.get("obs_enabled") and config.get("obs_scene"):
+        wanted["obs"] = (ObsSink, config["obs_url"], config["obs_password"], config["obs_scene"],
+                         config.get("obs_min_amount", 0), config.get("obs_scene_seconds", 10))
+    for name in ("webhook", "file", "obs"):
+        settings = wanted.get(name)
+        if settings == sink_settings.get(name):
+            continue
+        if settings is None:
+            sink_settings.pop(name)
+            asyncio.create_task(pipeline.unregister(name))
+        else:
+            sink_settings[name] = settings
+            pipeline.register(settings[0](*settings[1:]))
+
+async def on_sinks_changed(change):
+    sync_sinks()
+
+async def on_config_changed(change):
+    page_cache.invalidate(change.keys)
+    bus.publish("config", dict(config))
+
+def on_bus_config(new_config):
+    # Worker: settings saved in the main process
+    changed = [key for key, value in new_config.items() if config.get(key) != value]
+    config.update(new_config)
+    if changed:
+        page_cache.invalidate(changed)
+
+config_store.subscribe(USER_KEYS, on_users_changed)
+config_store.subscribe(CHAT_KEYS, on_chat_changed)
+config_store.subscribe(ALERT_KEYS, on_alerts_changed)
+config_store.subscribe(SINK_KEYS, on_sinks_changed)
+config_store.subscribe(SCHEMA, on_config_changed)
+
+async def watch_parent(parent):
+    # Worker: the main process normally stops its workers on shutdown, but
+    # if it was killed this process is re-parented; shut down instead of
+    # reconnecting to a bus that's gone
+    while os.getppid() == parent:
+        await asyncio.sleep(1)
+    logger.info("Main process exited, stopping overlay worker")
+    os.kill(os.getpid(), signal.SIGTERM)  # Hypercorn's graceful shutdown
+
+@app.after_serving
+async def shutdown():
+    if worker_processes:
+        # Before the bus closes, so they don't try to reconnect to it
+        await asyncio.get_running_loop().run_in_executor(None, stop_workers, worker_processes)
+    if stats_task:
+        stats_task.cancel()
+    if housekeeping_task:
+        housekeeping_task.cancel()
+    await supervisor.stop()
+    # Lets queued donations reach the log (and the other outputs) first
+    await pipeline.close()
+    await bus.close()
+    for stream in list(streams.values()):
+        stream.alerts.stop()
+    await chat_manager.close()
+    await config_store.flush()
+    await event_store.close()
 
 @app.route("/")
 async def index():
-    return await render_template("index.html", config=config, version=VERSION)
+    # The dashboard shows every setting
+    page = await page_cache.get("index", SCHEMA, lambda: render_template("index.html", config=config, version=VERSION))
+    return respond(page, request.headers, REVALIDATE)
 
 @app.route("/leaderboard")
 async def leaderboard():
-    return await render_template("leaderboard.html")
+    page = await page_cache.get("leaderboard", USER_KEYS,
+                                lambda: render_template("leaderboard.html", user_id=primary_user_id()))
+    return respond(page, request.headers, REVALIDATE)
+
+@app.route("/leaderboard/<user_id>")
+async def user_leaderboard(user_id):
+    page = await page_cache.get(f"leaderboard/{user_id}", (),
+                                lambda: render_template("leaderboard.html", user_id=user_id))
+    return respond(page, request.headers, REVALIDATE)
+
+@app.route("/static/<path:filename>")
+async def static_file(filename):
+    asset = static_assets.get(filename)
+    if asset is None:
+        return "Not Found", 404
+    # Links made by static_url() carry the content hash
+    return respond(asset, request.headers, IMMUTABLE if request.args.get("v") == asset.etag else REVALIDATE)
+
+def main_process_only():
+    # Settings and alerts are owned by the main process; workers get them over the bus
+    if deployment["role"] == "worker":
+        return jsonify({"status": "error", "message": "This is an overlay worker, use the main dashboard"}), 409
+    return None
 
 @app.route("/api/settings", methods=["POST"])
 async def update_settings():
+    error = main_process_only()
+    if error:
+        return error
     data = await request.get_json()
-    
-    # Update config with all known keys
-    for key in config.keys():
-        if key in data:
-            if key == "min_amount":
-                config[key] = int(data[key])
-            else:
-                config[key] = data[key]
-    
-    save_config() # Save to file
-    await chat_manager.update_config(config)
-    
+    if not isinstance(data, dict):
+        return jsonify({"status": "error", "message": "Expected a JSON object"}), 400
+
+    try:
+        # Subscribers below react only to the keys that actually changed
+        await config_store.update(data)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
     return jsonify({"status": "ok", "config": config})
 
 @app.route("/api/history")
-async def get_history():
-    return jsonify(donation_history)
+@app.route("/api/history/<user_id>")
+async def get_history(user_id=None):
+    # Use the last event's id as `since` to fetch only newer events
+    since = request.args.get("since", type=int)
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(await event_store.query(since=since, before=before, limit=limit, user_id=user_id))
+
+def parse_time(value, end=False):
+    # Unix seconds, an ISO date/time, or a plain date (a whole day for `end`)
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        return parsed.timestamp() + 86400
+    return parsed.timestamp()
+
+def archive_filters():
+    # ?from= / ?to= (dates, ISO times or unix seconds), ?donor=, ?session=,
+    # ?min_amount= and ?user_id=; raises ValueError for bad values
+    args = request.args
+    return {
+        "start": parse_time(args["from"]) if args.get("from") else None,
+        "end": parse_time(args["to"], end=True) if args.get("to") else None,
+        "donor": args.get("donor") or None,
+        "session_id": int(args["session"]) if args.get("session") else None,
+        "min_amount": int(args["min_amount"]) if args.get("min_amount") else None,
+        "user_id": args.get("user_id") or None,
+    }
+
+def archive_unavailable():
+    # Workers open the shared log once the main process' hello arrives over the bus
+    if event_store.available:
+        return None
+    return jsonify({"status": "error", "message": "The archive isn't available yet, try again shortly"}), 503
+
+@app.route("/api/archive/sessions")
+async def get_archive_sessions():
+    # Every recorded session, newest first; ?before=<id> for older ones
+    unavailable = archive_unavailable()
+    if unavailable:
+        return unavailable
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(await event_store.sessions(limit=limit, before=before))
+
+@app.route("/api/archive/events")
+async def get_archive_events():
+    # Donations across all sessions, newest first; ?before=<id> pages back
+    unavailable = archive_unavailable()
+    if unavailable:
+        return unavailable
+    try:
+        filters = archive_filters()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    before = request.args.get("before", type=int)
+    limit = request.args.get("limit", 100, type=int)
+    return jsonify(await event_store.search(filters, before=before, limit=limit))
+
+@app.route("/api/archive/leaderboard")
+@app.route("/api/archive/leaderboard/<user_id>")
+async def get_archive_leaderboard(user_id=None):
+    # All-time top donors
+    unavailable = archive_unavailable()
+    if unavailable:
+        return unavailable
+    limit = request.args.get("limit", 10, type=int)
+    return jsonify(await event_store.top_donors(limit=limit, user_id=user_id))
+
+@app.route("/api/archive/export")
+async def export_archive():
+    # Streams the matching donations (?format=csv or jsonl) in chunks
+    unavailable = archive_unavailable()
+    if unavailable:
+        return unavailable
+    try:
+        filters = archive_filters()
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    fmt = "csv" if request.args.get("format") == "csv" else "jsonl"
+    mimetype = "text/csv" if fmt == "csv" else "application/x-ndjson"
+    return Response(event_store.export(filters, fmt), mimetype=mimetype, headers={
+        "Content-Disposition": f'attachment; filename="donations.{fmt}"'
+    })
+
+@app.route("/api/leaderboard")
+@app.route("/api/leaderboard/<user_id>")
+async def get_leaderboard(user_id=None):
+    user_id = user_id or primary_user_id()
+    limit = request.args.get("limit", 10, type=int)
+    stream = find_stream(user_id) if user_id else None
+    if stream is None:
+        return jsonify({"version": 0, "size": 0, "rows": []})
+    return jsonify(stream.leaderboard.snapshot(limit))
+
+@app.route("/api/stats")
+@app.route("/api/stats/<user_id>")
+async def get_stats(user_id=None):
+    # Totals, rates, largest donation and top donors for 5m / 1h / session
+    user_id = user_id or primary_user_id()
+    top = request.args.get("top", 5, type=int)
+    stream = find_stream(user_id) if user_id else None
+    if stream is None:
+        return jsonify(Analytics().snapshot(top))
+    return jsonify(stream.analytics.snapshot(top))
+
+@app.route("/api/alerts")
+@app.route("/api/alerts/<user_id>")
+async def get_alerts(user_id=None):
+    # Alert on screen, queued alerts and recent history for replay
+    user_id = user_id or primary_user_id()
+    stream = find_stream(user_id) if user_id else None
+    if stream is None:
+        return jsonify({"current": None, "queue": [], "history": []})
+    return jsonify(stream.alerts.state())
+
+@app.route("/api/alerts/skip", methods=["POST"])
+@app.route("/api/alerts/<user_id>/skip", methods=["POST"])
+async def skip_alert(user_id=None):
+    error = main_process_only()
+    if error:
+        return error
+    user_id = user_id or primary_user_id()
+    stream = find_stream(user_id) if user_id else None
+    if stream is None or not stream.alerts.skip():
+        return jsonify({"status": "error", "message": "No alert is showing"}), 409
+    return jsonify({"status": "ok"})
+
+@app.route("/api/alerts/replay", methods=["POST"])
+@app.route("/api/alerts/<user_id>/replay", methods=["POST"])
+async def replay_alert(user_id=None):
+    error = main_process_only()
+    if error:
+        return error
+    # {"id": N} replays that alert, an empty body the most recent one
+    user_id = user_id or primary_user_id()
+    data = await request.get_json(silent=True) or {}
+    alert_id = data.get("id") if isinstance(data, dict) else None
+    stream = find_stream(user_id) if user_id else None
+    alert = stream.alerts.replay(alert_id) if stream else None
+    if alert is None:
+        return jsonify({"status": "error", "message": "No such alert in history"}), 404
+    return jsonify({"status": "ok", "alert": alert})
+
+@app.route("/api/alerts/clear", methods=["POST"])
+@app.route("/api/alerts/<user_id>/clear", methods=["POST"])
+async def clear_alerts(user_id=None):
+    error = main_process_only()
+    if error:
+        return error
+    user_id = user_id or primary_user_id()
+    stream = find_stream(user_id) if user_id else None
+    cleared = stream.alerts.clear() if stream else 0
+    return jsonify({"status": "ok", "cleared": cleared})
+
+@app.route("/metrics")
+async def get_metrics():
+    # Prometheus text format by default, ?format=json for a readable view
+    if request.args.get("format") == "json":
+        data = metrics.to_json()
+        data["clients"] = [client.stats() for client in all_clients()]
+        data["bus"] = bus.stats()
+        data["donors"] = donor_registry.stats()
+        return jsonify(data)
+    return metrics.render_prometheus(), 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+@app.route("/api/connection")
+@app.route("/api/connection/<user_id>")
+async def get_connection(user_id=None):
+    # Upstream state and disconnect windows (when donations may have been missed)
+    if user_id:
+        stream = find_stream(user_id)
+        if stream is None:
+            return jsonify({"status": "error", "message": "Not a tracked user"}), 404
+        return jsonify(stream.monitor.status())
+    return jsonify({uid: get_stream(uid).monitor.status() for uid in tracked_user_ids()})
+
+@app.route("/api/sinks")
+async def get_sinks():
+    # Queue depth, retries, failures and the last error of every output
+    stats = pipeline.stats()
+    for name, entry in stats.items():
+        latency = SINK_SECONDS.labels(name)
+        entry["p50_ms"] = latency.quantile(0.5) * 1000 if latency.count else None
+        entry["p99_ms"] = latency.quantile(0.99) * 1000 if latency.count else None
+    return jsonify(stats)
+
+@app.route("/api/logs")
+async def get_logs():
+    # ?since=<next from the previous call> returns only newer lines;
+    # ?level=WARNING filters
+    since = request.args.get("since", type=int)
+    limit = max(1, min(request.args.get("limit", 200, type=int), 2000))
+    level = logging.getLevelName(request.args.get("level", "NOTSET").upper())
+    return jsonify(log_ring.tail(since, limit, level if isinstance(level, int) else logging.NOTSET))
+
+@app.route("/api/chat/stats")
+async def get_chat_stats():
+    return jsonify(chat_manager.stats())
 
 @app.route("/api/copy_to_clipboard", methods=["POST"])
 async def copy_to_clipboard():
-    if not pyperclip:
+    try:
+        import pyperclip
+    except ImportError:
         return jsonify({"status": "error", "message": "Clipboard module not available"}), 500
         
     data = await request.get_json()
@@ -229,47 +841,211 @@ async def copy_to_clipboard():
         logger.error(f"Clipboard copy failed: {e}")
         return jsonify({"status": "error", "message": str(e)}), 500
 
+def refresh_stats(user_id=None):
+    # New stats subscribers get the current stats on the next push
+    for uid, stream in list(streams.items()):
+        if user_id is None or uid == user_id:
+            stream.stats_key = None
+
 @app.websocket("/ws")
-async def ws():
-    connected_clients.add(websocket._get_current_object())
+@app.websocket("/ws/<user_id>")
+async def ws(user_id=None):
+    # /ws receives events for every tracked user, /ws/<user_id> just one.
+    # ?raw=0 leaves the upstream payload out of donation events.
+    # ?topics=donations,leaderboard,stats,alerts (default: all) and
+    # ?min_amount=N pick what the client gets; both can be changed later by
+    # sending {"type": "subscribe", "topics": [...], "min_amount": N}.
+    # Clients speaking the compact v2 protocol (wire.py) get a snapshot or
+    # the messages they missed (?resume=<epoch>:<seq>) first.
+    stream = find_stream(user_id) if user_id else None
+    if user_id and stream is None:
+        return "Not a tracked user", 404
+    target = stream.broadcaster if stream else broadcaster
+    include_raw = websocket.args.get("raw", "1") not in ("0", "false")
+    topics = parse_topics(websocket.args["topics"]) if "topics" in websocket.args else frozenset(TOPICS)
+    min_amount = parse_min_amount(websocket.args.get("min_amount"))
+    fmt, subprotocol = wire.negotiate(websocket.requested_subprotocols, websocket.args.get("proto"))
+    await websocket.accept(subprotocol=subprotocol)
+    client = None
     try:
+        client = target.register(websocket._get_current_object(), include_raw=include_raw,
+                                 topics=topics, min_amount=min_amount, fmt=fmt)
+        client.handler = asyncio.current_task()  # Cancelled if housekeeping finds the client stale
+        if fmt:
+            resume = wire.parse_resume(websocket.args.get("resume"))
+            if not (resume and target.resume(client, *resume)):
+                # Taken right after registering, so every later delta is newer
+                user_ids = [user_id] if user_id else tracked_user_ids()
+                leaderboards = {uid: get_stream(uid).leaderboard.snapshot(get_stream(uid).leaderboard.window)
+                                for uid in user_ids}
+                sequencer = target.sequencer
+                client.enqueue(wire.encode(fmt, wire.snapshot(sequencer.seq, sequencer.epoch, leaderboards)),
+                               resync=True)
+        if "stats" in topics:
+            refresh_stats(user_id)
         while True:
-            await websocket.receive() # Keep connection open
-    except asyncio.CancelledError:
-        connected_clients.remove(websocket._get_current_object())
-    except Exception:
-        connected_clients.remove(websocket._get_current_object())
+            msg = await websocket.receive() # Also keeps the connection open
+            try:
+                data = wire.decode(client.fmt, msg)
+            except (codec.DecodeError, ValueError):
+                continue
+            if isinstance(data, dict) and data.get("type") == "subscribe":
+                new_topics = parse_topics(data["topics"]) if "topics" in data else None
+                new_min = parse_min_amount(data["min_amount"]) if "min_amount" in data else None
+                target.subscribe(client, new_topics, new_min)
+                if new_topics and "stats" in new_topics:
+                    refresh_stats(user_id)
+                client.enqueue(wire.encode(client.fmt, {
+                    "type": "subscribed",
+                    "topics": sorted(client.topics),
+                    "min_amount": client.min_amount
+                }))
+    finally:
+        if client is not None:
+            target.unregister(client)
 
-if __name__ == "__main__":
-    PORT = 5000
-    HOST = "127.0.0.1"
-    URL = f"http://{HOST}:{PORT}"
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="PLS DONATE Overlay Manager")
+    parser.add_argument("--headless", action="store_true",
+                        help="run only the server: no window, no browser, no prompts")
+    parser.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    parser.add_argument("--port", type=int, default=5000, help="port to listen on (default: 5000)")
+    parser.add_argument("--config", help="path to config.json; donations.db is kept next to it")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="also start N overlay worker processes sharing --worker-port (Linux/macOS)")
+    parser.add_argument("--worker-port", type=int, help="port the workers share (default: --port + 1)")
+    parser.add_argument("--bus", help="event bus address, unix:<path> or tcp://127.0.0.1:<port> "
+                                      "(default: bus.sock next to the config, or --port + 2 on Windows)")
+    parser.add_argument("--bounded-memory", action="store_true",
+                        help="cap per-session memory for streams running many hours (see README)")
+    parser.add_argument("--role", choices=("main", "worker"), default="main", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+def default_bus_address(port):
+    if hasattr(socket, "AF_UNIX") and sys.platform != "win32":
+        return f"unix:{os.path.join(data_dir, 'bus.sock')}"
+    return f"tcp://127.0.0.1:{port + 2}"
 
-    def run_server():
+def spawn_workers(count, host, port, bus_address):
+    # Each worker binds the same port with SO_REUSEPORT, so the kernel
+    # spreads overlay connections across them
+    command = [sys.executable] if getattr(sys, 'frozen', False) else [sys.executable, os.path.abspath(__file__)]
+    command += ["--headless", "--role", "worker", "--bus", bus_address, "--host", host,
+                "--port", str(port), "--config", os.path.abspath(config_file)]
+    if deployment["bounded"]:
+        command.append("--bounded-memory")
+    workers = [subprocess.Popen(command) for _ in range(count)]
+    worker_processes.extend(workers)
+    # Stopped from shutdown(); this covers exits that never get there
+    atexit.register(stop_workers, workers)
+    logger.info(f"Started {count} overlay workers on port {port}")
+    return workers
+
+def stop_workers(workers):
+    for worker in workers:
+        if worker.poll() is None:
+            worker.terminate()
+    deadline = time.monotonic() + WORKER_STOP_TIMEOUT
+    for worker in workers:
         try:
-            # Run Hypercorn directly to avoid signal handler issues in background thread
-            from hypercorn.config import Config
-            from hypercorn.asyncio import serve
-            
-            config = Config()
-            config.bind = [f"{HOST}:{PORT}"]
-            config.use_reloader = False
-            
-            # Create a new loop for this thread
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-            
-            # Custom shutdown trigger to prevent Hypercorn from registering signal handlers
-            shutdown_event = asyncio.Event()
-            
-            # Run the server
-            loop.run_until_complete(serve(app, config, shutdown_trigger=shutdown_event.wait))
-        except Exception as e:
-            logger.error(f"Server error: {e}")
+            worker.wait(max(0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Overlay worker {worker.pid} didn't stop, killing it")
+            worker.kill()
+            worker.wait()
+
+def use_config_file(path):
+    global config_file, data_dir
+    config_file = path
+    data_dir = os.path.dirname(os.path.abspath(config_file))
+    config_store.load(config_file)
+    event_store.path = os.path.join(data_dir, "donations.db")
+
+def listen(host, port, reuse_port=False):
+    # Bind and listen before Hypercorn starts: connections made while the
+    # app is still starting wait in the backlog instead of being refused,
+    # so startup() can announce readiness directly
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.create_server((host, port), family=family, backlog=100, reuse_port=reuse_port)
+    return f"fd://{sock.detach()}"
+
+def run_server(host, port, handle_signals=False, reuse_port=False):
+    try:
+        # Run Hypercorn directly to avoid signal handler issues in background thread
+        from hypercorn.config import Config
+        from hypercorn.asyncio import serve
+        
+        config = Config()
+        config.bind = [listen(host, port, reuse_port)]
+        config.use_reloader = False
+        # Pings make the OS notice overlays that vanished without closing
+        # their socket, so their handlers end instead of waiting forever
+        config.websocket_ping_interval = WS_PING_INTERVAL
+        
+        # Create a new loop for this thread
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        
+        # Custom shutdown trigger to prevent Hypercorn from registering signal
+        # handlers, unless we own the main thread (headless/console mode)
+        shutdown_trigger = None if handle_signals else asyncio.Event().wait
+        
+        # Run the server
+        loop.run_until_complete(serve(app, config, shutdown_trigger=shutdown_trigger))
+        return True
+    except Exception as e:
+        logger.error(f"Server error: {e}")
+        return False
+
+if __name__ == "__main__":
+    args = parse_args()
+    HOST = args.host
+    PORT = args.port
+    URL = f"http://{'127.0.0.1' if HOST in ('0.0.0.0', '::') else HOST}:{PORT}"
+    if args.config:
+        use_config_file(args.config)
+    deployment["bounded"] = args.bounded_memory
+    # The log keeps the upstream payload; the recent history in memory doesn't need it
+    event_store.keep_raw = not args.bounded_memory
+
+    if args.role == "worker":
+        if not args.bus:
+            sys.exit("--role worker needs --bus")
+        sys.excepthook = sys.__excepthook__
+        deployment.update(role="worker", bus=args.bus)
+        logger.info(f"Overlay worker {os.getpid()} on http://{HOST}:{PORT}, bus {args.bus}")
+        sys.exit(0 if run_server(HOST, PORT, handle_signals=True, reuse_port=True) else 1)
+    if args.workers > 0 or args.bus:
+        deployment["bus"] = args.bus or default_bus_address(PORT)
+    if args.workers > 0:
+        spawn_workers(args.workers, HOST, args.worker_port or PORT + 1, deployment["bus"])
+
+    GUI_AVAILABLE = False
+    GUI_LOG_LINES = 1000
+    GUI_LOG_INTERVAL_MS = 100
+    if args.headless:
+        # No console to keep open on a server
+        sys.excepthook = sys.__excepthook__
+        logger.info(f"Running headless on http://{HOST}:{PORT} (config: {os.path.abspath(config_file)})")
+        sys.exit(0 if run_server(HOST, PORT, handle_signals=True) else 1)
+
+    try:
+        from PyQt6.QtWidgets import QApplication, QMainWindow, QVBoxLayout, QWidget, QLabel, QPlainTextEdit, QProgressBar, QMessageBox
+        from PyQt6.QtWebEngineWidgets import QWebEngineView
+        from PyQt6.QtWebEngineCore import QWebEnginePage
+        from PyQt6.QtGui import QDesktopServices
+        from PyQt6.QtCore import QUrl, pyqtSignal, QObject, QTimer
+        GUI_AVAILABLE = True
+    except ImportError:
+        pass
 
     if GUI_AVAILABLE:
         # Custom WebEnginePage to open links in system browser
         class CustomWebEnginePage(QWebEnginePage):
+            # target="_blank" pages waiting for their first navigation; a
+            # page that never navigates is dropped once there are more
+            MAX_EXTRA_PAGES = 5
+
             def acceptNavigationRequest(self, url,  _type, isMainFrame):
                 url_str = url.toString()
                 logger.info(f"Navigation Request: {url_str} (Type: {_type})")
@@ -279,12 +1055,14 @@ if __name__ == "__main__":
                 if host and host != "127.0.0.1" and host != "localhost":
                     logger.info(f"External link detected: {url_str}")
                     QDesktopServices.openUrl(url)
+                    self._release()
                     return False
                 
                 # Also handle explicit link clicks just in case
                 if _type == QWebEnginePage.NavigationType.NavigationTypeLinkClicked:
                     logger.info(f"Link Click detected: {url_str}")
                     QDesktopServices.openUrl(url)
+                    self._release()
                     return False
                     
                 return super().acceptNavigationRequest(url, _type, isMainFrame)
@@ -294,29 +1072,30 @@ if __name__ == "__main__":
                 # We return a new dummy page to handle the navigation request off-screen.
                 # This prevents the main window from navigating away or becoming blank.
                 # The dummy page will trigger its own acceptNavigationRequest, 
-                # which opens the system browser and returns False.
+                # which opens the system browser, returns False and releases the page.
                 # QWebEnginePage expects a QObject parent (optional) or QWebEngineProfile
                 # Here we pass None as parent to avoid type errors, but we need to keep a reference
                 # so it doesn't get garbage collected immediately.
                 new_page = CustomWebEnginePage(parent=None)
+                new_page._opener = self
                 # Keep a reference to prevent garbage collection
                 if not hasattr(self, '_extra_pages'):
                     self._extra_pages = []
                 self._extra_pages.append(new_page)
+                while len(self._extra_pages) > self.MAX_EXTRA_PAGES:
+                    self._extra_pages.pop(0).deleteLater()
                 return new_page
 
-        # Define Log Signals/Handler for GUI
-        class LogSignal(QObject):
-            write = pyqtSignal(str)
-            
-        class GuiLogHandler(logging.Handler):
-            def __init__(self, sig):
-                super().__init__()
-                self.sig = sig
-                
-            def emit(self, record):
-                msg = self.format(record)
-                self.sig.write.emit(msg)
+            def _release(self):
+                # A dummy page is done after handing its link to the browser
+                opener = getattr(self, '_opener', None)
+                if opener is None:
+                    return
+                self._opener = None
+                if self in opener._extra_pages:
+                    opener._extra_pages.remove(self)
+                    # Not deleted right away: we're inside its navigation callback
+                    self.deleteLater()
 
         # Start GUI First
         try:
@@ -354,8 +1133,10 @@ if __name__ == "__main__":
             progress_bar.setValue(0)
             layout.addWidget(progress_bar)
             
-            log_view = QTextEdit()
+            # Capped like the ring buffer it shows, so it never grows
+            log_view = QPlainTextEdit()
             log_view.setReadOnly(True)
+            log_view.setMaximumBlockCount(GUI_LOG_LINES)
             log_view.setStyleSheet("background-color: #1e1e1e; color: #d4d4d4; font-family: Consolas, monospace; font-size: 12px; padding: 10px;")
             layout.addWidget(log_view)
             
@@ -363,53 +1144,49 @@ if __name__ == "__main__":
             window.setCentralWidget(loading_widget)
             window.show()
             
-            # Connect Logging
-            log_signal = LogSignal()
-            log_signal.write.connect(log_view.append)
-            gui_handler = GuiLogHandler(log_signal)
-            gui_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
-            logging.getLogger().addHandler(gui_handler)
+            # Show new log lines in batches from the GUI thread's own timer;
+            # logging never waits on Qt
+            log_cursor = {"next": None}
+            def show_new_logs():
+                tail = log_ring.tail(log_cursor["next"], limit=GUI_LOG_LINES)
+                log_cursor["next"] = tail["next"]
+                if tail["lines"]:
+                    log_view.appendPlainText("\n".join(tail["lines"]))
+            log_timer = QTimer()
+            log_timer.timeout.connect(show_new_logs)
+            log_timer.start(GUI_LOG_INTERVAL_MS)
             logger.info("Initializing application...")
 
-            # Start server in background thread
-            server_thread = threading.Thread(target=run_server, daemon=True)
-            server_thread.start()
-            
-            # Non-blocking Check for Server
-            import urllib.request
+            # Switch to the dashboard as soon as the server says it's ready
+            class ServerSignal(QObject):
+                ready = pyqtSignal()
             
-            start_time = time.time()
-            
-            def check_connection():
-                elapsed = time.time() - start_time
-                # Update progress (0-90% based on time, last 10% on success)
-                progress = min(int((elapsed / 3.0) * 90), 90)
-                progress_bar.setValue(progress)
+            def show_dashboard():
+                progress_bar.setValue(100)
+                logger.info("Server is ready! Loading dashboard...")
+                
+                # Switch to Browser
+                browser = QWebEngineView()
+                page = CustomWebEnginePage(browser)
+                browser.setPage(page)
+                browser.setUrl(QUrl(URL))
+                window.setCentralWidget(browser)
                 
-                if elapsed < 3:
-                    return # Wait at least 3 seconds
+                # The log view is gone
+                log_timer.stop()
+                
+                # Check for updates in background
+                threading.Thread(target=check_for_updates, args=(window,), daemon=True).start()
+            
+            # Qt queues the emit onto the GUI thread
+            server_signal = ServerSignal()
+            server_signal.ready.connect(show_dashboard)
+            ready_callbacks.append(server_signal.ready.emit)
+            progress_bar.setValue(50)
 
-                try:
-                    urllib.request.urlopen(URL, timeout=0.2)
-                    # Server is ready!
-                    progress_bar.setValue(100)
-                    logger.info("Server is ready! Loading dashboard...")
-                    timer.stop()
-                    
-                    # Switch to Browser
-                    browser = QWebEngineView()
-                    page = CustomWebEnginePage(browser)
-                    browser.setPage(page)
-                    browser.setUrl(QUrl(URL))
-                    window.setCentralWidget(browser)
-                    
-                    # Cleanup logger
-                    logging.getLogger().removeHandler(gui_handler)
-                    
-                    # Check for updates in background
-                    threading.Thread(target=check_for_updates, args=(window,), daemon=True).start()
-                except Exception:
-                    pass # Keep waiting
+            # Start server in background thread
+            server_thread = threading.Thread(target=run_server, args=(HOST, PORT), daemon=True)
+            server_thread.start()
             
             def check_for_updates(parent_window):
                 try:
@@ -461,10 +1238,6 @@ if __name__ == "__main__":
             
             update_signal.show_update.connect(on_show_update)
 
-            timer = QTimer()
-            timer.timeout.connect(check_connection)
-            timer.start(100) # Check more frequently for smooth progress bar
-            
             sys.exit(qt_app.exec())
         except Exception as e:
             logger.exception("GUI crashed")
@@ -473,8 +1246,8 @@ if __name__ == "__main__":
         logger.warning("PyQt6 not found. Running in console mode.")
         try:
             import webbrowser
-            threading.Timer(1.5, lambda: webbrowser.open(URL)).start()
-            app.run(host=HOST, port=PORT)
+            ready_callbacks.append(lambda: threading.Thread(target=webbrowser.open, args=(URL,), daemon=True).start())
+            run_server(HOST, PORT, handle_signals=True)
         except Exception:
             logger.exception("Program crashed")
             input("Press Enter to exit...")
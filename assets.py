@@ -0,0 +1,171 @@
+import asyncio
+import gzip
+import hashlib
+import mimetypes
+import os
+from collections import OrderedDict
+
+# Brotli is optional, like orjson: without it clients get gzip
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Smaller bodies aren't worth compressing
+COMPRESS_MIN_SIZE = 512
+# Versioned URLs (?v=<hash>) never change content; everything else is
+# revalidated, which is a cheap 304 while nothing changed
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+MAX_PAGES = 64
+
+
+class Asset:
+    # A response body with its precompressed variants and ETag
+    __slots__ = ("body", "variants", "etag", "mimetype")
+
+    def __init__(self, body, mimetype):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.sha1(body).hexdigest()[:16]
+        self.variants = {}  # content-encoding -> body
+        if len(body) >= COMPRESS_MIN_SIZE:
+            if brotli is not None:
+                self.variants["br"] = brotli.compress(body, quality=11)
+            self.variants["gzip"] = gzip.compress(body, compresslevel=9, mtime=0)
+
+    def encoded(self, accept_encoding):
+        # (body, content-encoding or None), smallest the client accepts
+        accepted = accepted_encodings(accept_encoding)
+        for encoding in ("br", "gzip"):
+            if encoding in accepted and encoding in self.variants:
+                return self.variants[encoding], encoding
+        return self.body, None
+
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in (header or "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+def etag_matches(header, etag):
+    if not header:
+        return False
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        # Weak or per-encoding forms of the same tag all match
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag.strip('"').split("-")[0] == etag:
+            return True
+    return False
+
+
+def respond(asset, request_headers, cache_control):
+    # (body, status, headers) for a Quart route, honouring If-None-Match
+    # and Accept-Encoding
+    headers = {"Cache-Control": cache_control, "Vary": "Accept-Encoding"}
+    if etag_matches(request_headers.get("If-None-Match"), asset.etag):
+        headers["ETag"] = f'"{asset.etag}"'
+        return b"", 304, headers
+    body, encoding = asset.encoded(request_headers.get("Accept-Encoding"))
+    headers["Content-Type"] = asset.mimetype
+    if encoding:
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'"{asset.etag}-{encoding}"'
+    else:
+        headers["ETag"] = f'"{asset.etag}"'
+    return body, 200, headers
+
+
+class StaticAssets:
+    # Files under static/, read and compressed once on first use. They only
+    # change with a new release, so url() versions them by content hash.
+    def __init__(self, folder):
+        self.folder = folder
+        self.assets = None
+
+    def load(self):
+        assets = {}
+        for root, _, files in os.walk(self.folder):
+            for name in files:
+                path = os.path.join(root, name)
+                filename = os.path.relpath(path, self.folder).replace(os.sep, "/")
+                with open(path, "rb") as f:
+                    body = f.read()
+                mimetype = mimetypes.guess_type(name)[0] or "application/octet-stream"
+                if mimetype.startswith("text/") or mimetype in ("application/javascript", "application/json"):
+                    mimetype += "; charset=utf-8"
+                assets[filename] = Asset(body, mimetype)
+        self.assets = assets
+        return assets
+
+    def get(self, filename):
+        if self.assets is None:
+            self.load()
+        return self.assets.get(filename)
+
+    def url(self, filename):
+        asset = self.get(filename)
+        return f"/static/{filename}?v={asset.etag}" if asset else f"/static/{filename}"
+
+
+class PageCache:
+    # Rendered pages by key, each tagged with the config keys it depends on.
+    # Concurrent requests for a page that isn't cached yet share one render
+    # (OBS reloads every browser source at once on a scene switch).
+    def __init__(self, max_pages=MAX_PAGES):
+        self.max_pages = max_pages
+        self.pages = OrderedDict()  # key -> (Asset, config keys)
+        self.renders = 0
+        self.generation = 0  # bumped by invalidate(), so an older render isn't cached
+        self._inflight = {}
+
+    async def get(self, key, depends_on, render):
+        # render: async () -> html
+        entry = self.pages.get(key)
+        if entry is not None:
+            self.pages.move_to_end(key)
+            return entry[0]
+        future = self._inflight.get(key)
+        if future is not None:
+            return await asyncio.shield(future)
+
+        future = self._inflight[key] = asyncio.get_running_loop().create_future()
+        generation = self.generation
+        try:
+            asset = Asset(await render(), "text/html; charset=utf-8")
+            self.renders += 1
+            if generation == self.generation:
+                self.pages[key] = (asset, frozenset(depends_on))
+                if len(self.pages) > self.max_pages:
+                    self.pages.popitem(last=False)
+            future.set_result(asset)
+            return asset
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()  # Retrieved here so a render nobody else awaited doesn't warn
+            raise
+        finally:
+            del self._inflight[key]
+
+    def invalidate(self, keys=None):
+        # Drop pages using any of the changed config keys (all for None)
+        self.generation += 1
+        if keys is None:
+            self.pages.clear()
+            return
+        keys = frozenset(keys)
+        for key in [key for key, (_, depends_on) in self.pages.items() if depends_on & keys]:
+            del self.pages[key]
@@ -0,0 +1,208 @@
+# Local stand-in for the PLS DONATE stream socket
+# (wss://stream.plsdonate.com/api/user/{id}/websocket).
+#
+# Replays recorded or synthetic donations at a fixed rate with optional
+# bursts. Point the app at it with:
+#
+#   PLSDONATE_BASE_WS=ws://127.0.0.1:8765/api/user/{}/websocket python app.py
+#   python bench/fake_upstream.py --rate 50 --burst 200 --burst-every 10
+#
+# Recordings are JSONL files with one upstream message (as sent by PLS
+# DONATE) per line.
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import time
+
+import websockets
+
+logger = logging.getLogger("fake_upstream")
+
+# Typical PLS DONATE gamepass prices
+AMOUNTS = [1, 2, 5, 5, 10, 10, 10, 25, 25, 50, 50, 100, 100, 250, 500, 1000, 5000]
+
+
+def synthetic_donations(seed=0, donors=500):
+    # Deterministic for a given seed: a few donors give often, most rarely
+    rng = random.Random(seed)
+    names = [f"Donor{i}" for i in range(donors)]
+    weights = [1 / (i + 1) for i in range(donors)]
+    while True:
+        name = rng.choices(names, weights)[0]
+        yield {
+            "sender": {"username": name, "displayName": name},
+            "amount": rng.choice(AMOUNTS),
+            "message": rng.choice(["", "", "gg", "love the stream", "hi!"]),
+        }
+
+
+def load_recording(path, loop_forever=False):
+    with open(path) as f:
+        messages = [json.loads(line) for line in f if line.strip()]
+    if not messages:
+        return iter(())
+    return itertools.cycle(messages) if loop_forever else iter(messages)
+
+
+class FakeUpstream:
+    def __init__(self, host="127.0.0.1", port=0, ping_interval=10):
+        self.host = host
+        self.port = port
+        self.ping_interval = ping_interval
+        self.subscribers = {}  # user_id -> set of sockets
+        self.server = None
+        self._joined = asyncio.Event()
+
+    @property
+    def base_ws(self):
+        return f"ws://{self.host}:{self.port}/api/user/{{}}/websocket"
+
+    async def start(self):
+        self.server = await websockets.serve(self._handler, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def _handler(self, ws):
+        # Path: /api/user/<id>/websocket
+        parts = ws.request.path.strip("/").split("/")
+        user_id = parts[2] if len(parts) >= 3 else ""
+        subscribers = self.subscribers.setdefault(user_id, set())
+        subscribers.add(ws)
+        self._joined.set()
+        try:
+            # Same greeting the real socket sends
+            await ws.send(json.dumps({"ping_interval": self.ping_interval}))
+            while True:
+                await asyncio.sleep(self.ping_interval)
+                await ws.send(json.dumps({"ping_interval": self.ping_interval}))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            subscribers.discard(ws)
+
+    async def wait_for_listener(self, user_id, timeout=10):
+        deadline = time.monotonic() + timeout
+        while not self.subscribers.get(str(user_id)):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No listener connected for user {user_id}")
+            self._joined.clear()
+            try:
+                await asyncio.wait_for(self._joined.wait(), 0.1)
+            except asyncio.TimeoutError:
+                pass
+
+    async def send(self, user_id, message):
+        payload = message if isinstance(message, str) else json.dumps(message)
+        for ws in list(self.subscribers.get(str(user_id), ())):
+            try:
+                await ws.send(payload)
+            except websockets.ConnectionClosed:
+                pass
+
+    async def replay(self, user_id, messages, rate=None, count=None, duration=None,
+                     burst=0, burst_every=0, stamp=False):
+        # Send `messages` at `rate` per second (None = as fast as possible).
+        # Every `burst_every` seconds an extra `burst` messages go out at once.
+        # With stamp=True each message gets a "bench_ts" perf_counter value.
+        # Returns the number of messages sent.
+        start = time.perf_counter()
+        next_burst = burst_every if burst and burst_every else None
+        sent = 0
+        paced = 0  # messages sent on the rate schedule (bursts are extra)
+
+        def take(n):
+            nonlocal sent
+            batch = []
+            for message in itertools.islice(messages, n):
+                message = dict(message)
+                if stamp:
+                    message["bench_ts"] = time.perf_counter()
+                batch.append(message)
+            sent += len(batch)
+            return batch
+
+        while True:
+            elapsed = time.perf_counter() - start
+            if duration is not None and elapsed >= duration:
+                break
+            if count is not None and sent >= count:
+                break
+
+            if rate is None:
+                n = 1000
+            else:
+                n = max(0, int(elapsed * rate) + 1 - paced)
+            paced += n
+            if next_burst is not None and elapsed >= next_burst:
+                n += burst
+                next_burst += burst_every
+            if count is not None:
+                n = min(n, count - sent)
+
+            batch = take(n) if n > 0 else []
+            if n > 0 and not batch:
+                break  # Recording exhausted
+            for message in batch:
+                await self.send(user_id, message)
+
+            # Tick at ~1ms; messages due in the meantime go out together
+            await asyncio.sleep(0 if rate is None else 0.001)
+        return sent
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Fake PLS DONATE upstream socket")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--user-id", help="Only replay to this user id (default: whoever connects first)")
+    parser.add_argument("--rate", type=float, default=1.0, help="Donations per second")
+    parser.add_argument("--burst", type=int, default=0, help="Extra donations sent at once every --burst-every seconds")
+    parser.add_argument("--burst-every", type=float, default=0)
+    parser.add_argument("--duration", type=float, help="Stop after this many seconds")
+    parser.add_argument("--count", type=int, help="Stop after this many donations")
+    parser.add_argument("--replay", help="JSONL recording to replay instead of synthetic donations")
+    parser.add_argument("--loop", action="store_true", help="Loop the recording")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    upstream = await FakeUpstream(args.host, args.port).start()
+    logger.info(f"Listening, set PLSDONATE_BASE_WS={upstream.base_ws}")
+
+    while True:
+        if args.user_id:
+            await upstream.wait_for_listener(args.user_id, timeout=float("inf"))
+            user_id = args.user_id
+        else:
+            while not any(upstream.subscribers.values()):
+                await asyncio.sleep(0.1)
+            user_id = next(u for u, subs in upstream.subscribers.items() if subs)
+
+        if args.replay:
+            messages = load_recording(args.replay, args.loop)
+        else:
+            messages = synthetic_donations(args.seed)
+        logger.info(f"Replaying to user {user_id} at {args.rate}/s")
+        sent = await upstream.replay(user_id, messages, rate=args.rate, count=args.count,
+                                     duration=args.duration, burst=args.burst,
+                                     burst_every=args.burst_every)
+        logger.info(f"Sent {sent} donations")
+        if args.duration or args.count or (args.replay and not args.loop):
+            break
+
+    await upstream.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
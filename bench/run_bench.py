@@ -0,0 +1,340 @@
+# Headless end-to-end benchmark for the donation pipeline.
+#
+# Starts bench/fake_upstream.py and the Quart app (served by Hypercorn, no
+# PyQt6 needed) in one process, then measures:
+#   * latency   - upstream send -> /ws client receipt at fixed donation rates
+#   * fanout    - delivery throughput and latency vs. number of /ws clients
+#   * leaderboard - cost of one Leaderboard.add() vs. number of donors
+#
+#   python bench/run_bench.py --output bench_output.json
+#   python bench/run_bench.py --compare bench_output.json   # after a change
+#
+# Everything shares one event loop, so absolute numbers include the client
+# side; they are meant to be compared between commits on the same machine.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import websockets
+
+import codec
+from fake_upstream import FakeUpstream, synthetic_donations
+
+USER_ID = "1"
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def summarize(latencies):
+    ms = [v * 1000 for v in latencies]
+    return {
+        "p50_ms": percentile(ms, 50),
+        "p95_ms": percentile(ms, 95),
+        "p99_ms": percentile(ms, 99),
+        "max_ms": max(ms) if ms else None,
+    }
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def git_commit():
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, text=True).strip()
+        dirty = subprocess.check_output(["git", "status", "--porcelain", "--untracked-files=no"], cwd=ROOT, text=True).strip()
+        return commit + ("-dirty" if dirty else "")
+    except Exception:
+        return None
+
+
+class Receiver:
+    # Reads one /ws client and records latency for every stamped donation
+    def __init__(self, ws):
+        self.ws = ws
+        self.latencies = []
+        self.expected = None
+        self.done = asyncio.Event()
+        self.last_receipt = None
+        self.task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        try:
+            async for msg in self.ws:
+                now = time.perf_counter()
+                data = json.loads(msg)
+                if data.get("type") != "donation":
+                    continue
+                sent_at = (data.get("raw") or {}).get("bench_ts")
+                if sent_at is None:
+                    continue
+                self.latencies.append(now - sent_at)
+                self.last_receipt = now
+                if self.expected is not None and len(self.latencies) >= self.expected:
+                    self.done.set()
+        except websockets.ConnectionClosed:
+            pass
+
+    def expect(self, count):
+        self.expected = count
+        if len(self.latencies) >= count:
+            self.done.set()
+
+    async def close(self):
+        await self.ws.close()
+        self.task.cancel()
+
+
+class Harness:
+    # configure(app) runs after importing the app and before it starts
+    def __init__(self, configure=None, log_level=logging.WARNING):
+        self.configure = configure
+        self.log_level = log_level
+        self.upstream = None
+        self.app = None
+        self.port = None
+        self.workdir = tempfile.mkdtemp(prefix="plsdonate-bench-")
+        self._shutdown = asyncio.Event()
+        self._serve_task = None
+
+    async def start(self):
+        self.upstream = await FakeUpstream().start()
+
+        # The app keeps config/history next to the working directory
+        os.chdir(self.workdir)
+        os.environ["PLSDONATE_BASE_WS"] = self.upstream.base_ws
+        import app
+        sys.excepthook = sys.__excepthook__  # app.py's hook waits for Enter
+        logging.getLogger().setLevel(self.log_level)  # app.py installs its own logging at INFO
+        app.config.update(user_id=USER_ID, extra_user_ids=[], twitch_enabled=False, youtube_enabled=False)
+        if self.configure:
+            self.configure(app)
+        self.app = app
+
+        from hypercorn.asyncio import serve
+        from hypercorn.config import Config
+        self.port = free_port()
+        config = Config()
+        config.bind = [f"127.0.0.1:{self.port}"]
+        config.use_reloader = False
+        config.accesslog = None
+        config.loglevel = "INFO" if logging.getLogger().level <= logging.INFO else "WARNING"
+        self._serve_task = asyncio.create_task(serve(app.app, config, shutdown_trigger=self._shutdown.wait))
+
+        await self.upstream.wait_for_listener(USER_ID)
+        return self
+
+    async def connect(self, n):
+        receivers = []
+        for _ in range(n):
+            for attempt in range(50):
+                try:
+                    ws = await websockets.connect(f"ws://127.0.0.1:{self.port}/ws", max_size=None)
+                    break
+                except OSError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise RuntimeError("App did not accept websocket connections")
+            receivers.append(Receiver(ws))
+        # Let the server register every client before sending
+        await asyncio.sleep(0.2)
+        return receivers
+
+    async def close(self):
+        self._shutdown.set()
+        if self._serve_task:
+            await asyncio.wait_for(self._serve_task, 10)
+        await self.upstream.close()
+
+
+async def wait_all(receivers, count, timeout, stall=3):
+    # Wait until every receiver saw `count` donations, giving up after
+    # `timeout` seconds or once nothing new arrived for `stall` seconds
+    # (dropped messages never show up)
+    for receiver in receivers:
+        receiver.expect(count)
+    deadline = time.monotonic() + timeout
+    last_total, last_progress = -1, time.monotonic()
+    while not all(r.done.is_set() for r in receivers):
+        now = time.monotonic()
+        total = sum(len(r.latencies) for r in receivers)
+        if total != last_total:
+            last_total, last_progress = total, now
+        if now >= deadline or now - last_progress >= stall:
+            break
+        await asyncio.sleep(0.05)
+
+
+async def bench_latency(harness, rate, duration, seed):
+    receivers = await harness.connect(1)
+    sent = await harness.upstream.replay(USER_ID, synthetic_donations(seed), rate=rate,
+                                         duration=duration, stamp=True)
+    await wait_all(receivers, sent, timeout=10)
+    latencies = receivers[0].latencies
+    for receiver in receivers:
+        await receiver.close()
+    return {"rate": rate, "sent": sent, "received": len(latencies), **summarize(latencies)}
+
+
+async def bench_fanout(harness, clients, messages, seed):
+    receivers = await harness.connect(clients)
+    start = time.perf_counter()
+    sent = await harness.upstream.replay(USER_ID, synthetic_donations(seed), count=messages, stamp=True)
+    await wait_all(receivers, sent, timeout=30)
+
+    latencies = [v for r in receivers for v in r.latencies]
+    last = max((r.last_receipt for r in receivers if r.last_receipt), default=None)
+    elapsed = (last - start) if last else None
+    for receiver in receivers:
+        await receiver.close()
+    return {
+        "clients": clients,
+        "sent": sent,
+        "delivered": len(latencies),
+        "expected": sent * clients,
+        "deliveries_per_s": len(latencies) / elapsed if elapsed else None,
+        **summarize(latencies),
+    }
+
+
+def bench_leaderboard(donors, ops, seed):
+    from leaderboard import Leaderboard
+    rng = random.Random(seed)
+    board = Leaderboard()
+    names = [f"Donor{i}" for i in range(donors)]
+    for name in names:
+        board.add(name, name, rng.randint(1, 1000))
+
+    updates = [(rng.choice(names), rng.randint(1, 1000)) for _ in range(ops)]
+    start = time.perf_counter()
+    for name, amount in updates:
+        board.add(name, name, amount)
+    elapsed = time.perf_counter() - start
+    return {"donors": donors, "ops": ops, "us_per_add": elapsed / ops * 1e6}
+
+
+async def run(args):
+    results = {}
+    app_metrics = None
+    harness = await Harness(log_level=logging.INFO if args.verbose else logging.WARNING).start()
+    try:
+        for rate in args.rates:
+            key = f"latency_rate_{rate:g}"
+            results[key] = await bench_latency(harness, rate, args.duration, args.seed)
+            print_result(key, results[key])
+        for clients in args.clients:
+            key = f"fanout_clients_{clients}"
+            results[key] = await bench_fanout(harness, clients, args.fanout_messages, args.seed)
+            print_result(key, results[key])
+        # Per-stage timings as seen by the app itself (/metrics)
+        app_metrics = harness.app.metrics.to_json()
+    finally:
+        await harness.close()
+
+    for donors in args.donors:
+        key = f"leaderboard_donors_{donors}"
+        results[key] = bench_leaderboard(donors, args.leaderboard_ops, args.seed)
+        print_result(key, results[key])
+    return results, app_metrics
+
+
+def print_result(key, result):
+    fields = ", ".join(f"{k}={v:.3f}" if isinstance(v, float) else f"{k}={v}" for k, v in result.items())
+    print(f"{key:28} {fields}", flush=True)
+
+
+# Metrics where smaller is better; everything else numeric is bigger-is-better
+LOWER_IS_BETTER = ("_ms", "us_per_add")
+COMPARED = ("p50_ms", "p99_ms", "max_ms", "deliveries_per_s", "us_per_add", "received", "delivered")
+
+
+def compare(previous, current):
+    print(f"\nComparison with {previous.get('commit')} -> {current.get('commit')}:")
+    for key, result in current["results"].items():
+        old = previous.get("results", {}).get(key)
+        if not old:
+            continue
+        for metric in COMPARED:
+            new_value, old_value = result.get(metric), old.get(metric)
+            if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)) or not old_value:
+                continue
+            change = (new_value - old_value) / old_value * 100
+            better = change < 0 if metric.endswith(LOWER_IS_BETTER) else change > 0
+            marker = "" if abs(change) < 5 else (" (better)" if better else " (worse)")
+            print(f"  {key:28} {metric:18} {old_value:12.3f} -> {new_value:12.3f}  {change:+7.1f}%{marker}")
+
+
+def parse_list(value, cast):
+    return [cast(v) for v in value.split(",") if v.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PLS DONATE Overlay pipeline benchmark")
+    parser.add_argument("--rates", default="1,100,1000,10000", help="Donations/s for the latency runs")
+    parser.add_argument("--duration", type=float, default=3, help="Seconds per latency run")
+    parser.add_argument("--clients", default="1,10,50", help="Client counts for the fan-out runs")
+    parser.add_argument("--fanout-messages", type=int, default=500)
+    parser.add_argument("--donors", default="100,10000,100000", help="Leaderboard sizes")
+    parser.add_argument("--leaderboard-ops", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="Small run for smoke testing")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--compare", help="Previous JSON report to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.rates, args.duration, args.clients = "10,1000", 1, "1,10"
+        args.fanout_messages, args.donors, args.leaderboard_ops = 200, "100,10000", 5000
+    args.rates = parse_list(args.rates, float)
+    args.clients = parse_list(args.clients, int)
+    args.donors = parse_list(args.donors, int)
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    if args.compare:
+        args.compare = os.path.abspath(args.compare)
+
+    # app.py adds the handlers; until it's imported only warnings are shown
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "json_codec": codec.NAME,
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k not in ("output", "compare")},
+    }
+    report["results"], report["app_metrics"] = asyncio.run(run(args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), report)
+
+
+if __name__ == "__main__":
+    main()
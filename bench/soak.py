@@ -0,0 +1,280 @@
+# Headless soak test: replays a long stream's worth of donations into the
+# app, compressed into seconds, while overlay clients keep connecting and
+# leaving (cleanly, by dropping the connection, or by going silent), and
+# reports how memory grew.
+#
+#   python bench/soak.py --hours 8 --output soak.json
+#   python bench/soak.py --hours 8 --bounded-memory --output soak-bounded.json
+#
+# RSS is sampled throughout. tracemalloc compares the heap after a warm-up
+# (the first --warmup fraction of the donations) with the end of the run and
+# lists the source lines that allocated the most in between, which is where
+# to look when RSS keeps climbing.
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import time
+import tracemalloc
+
+import websockets
+
+from fake_upstream import AMOUNTS
+from run_bench import Harness, USER_ID, git_commit, print_result
+
+import codec
+from metrics import resident_memory_bytes
+
+MB = 1024 * 1024
+
+
+def soak_donations(seed=0, returning=0.7, recent=2000):
+    # Unlike synthetic_donations() the donor pool keeps growing, like a long
+    # stream's: most donations are from one of the `recent` latest donors,
+    # the rest from someone new
+    rng = random.Random(seed)
+    donors = 0
+    while True:
+        if donors and rng.random() < returning:
+            donor = rng.randrange(max(0, donors - recent), donors)
+        else:
+            donor = donors
+            donors += 1
+        name = f"Donor{donor}"
+        yield {
+            "sender": {"username": name, "displayName": name.upper() if rng.random() < 0.1 else name,
+                       "userId": 100000 + donor},
+            "amount": rng.choice(AMOUNTS),
+            "message": rng.choice(["", "", "gg", "love the stream", "hi!"]),
+        }
+
+
+class Churn:
+    # Overlay clients coming and going for the whole run, closed in the
+    # three ways real ones go away: a clean close, a dropped connection, or
+    # going silent (stops reading, never closes)
+    def __init__(self, port, seed=0, per_tick=4, max_open=40, max_silent=10):
+        self.port = port
+        self.rng = random.Random(seed)
+        self.per_tick = per_tick
+        self.max_open = max_open
+        self.max_silent = max_silent
+        self.open = []    # (ws, reader task)
+        self.silent = []  # sockets that stopped reading
+        self.counts = {"opened": 0, "closed": 0, "aborted": 0, "silent": 0, "refused": 0, "failed": 0}
+
+    def _url(self):
+        # Mostly the tracked user; some clients ask for users nobody tracks,
+        # which the server must refuse without keeping any state for them
+        choice = self.rng.random()
+        if choice < 0.6:
+            path = f"/ws/{USER_ID}"
+        elif choice < 0.8:
+            path = "/ws"
+        else:
+            path = f"/ws/{self.rng.randrange(10 ** 6)}"
+        query = self.rng.choice(["", "?proto=v2", "?topics=stats", "?raw=0"])
+        return f"ws://127.0.0.1:{self.port}{path}{query}"
+
+    async def _drain(self, ws):
+        try:
+            async for _ in ws:
+                pass
+        except websockets.ConnectionClosed:
+            pass
+
+    async def tick(self):
+        for _ in range(self.per_tick):
+            try:
+                ws = await websockets.connect(self._url(), max_size=None, ping_interval=None)
+            except websockets.InvalidHandshake:
+                self.counts["refused"] += 1
+                continue
+            except (OSError, websockets.WebSocketException):
+                self.counts["failed"] += 1
+                continue
+            self.open.append((ws, asyncio.create_task(self._drain(ws))))
+            self.counts["opened"] += 1
+
+        while len(self.open) > self.max_open // 2:
+            ws, task = self.open.pop(self.rng.randrange(len(self.open)))
+            how = self.rng.random()
+            if how < 0.1 and len(self.silent) < self.max_silent:
+                # Keeps the TCP connection but never reads or answers again
+                task.cancel()
+                ws.transport.pause_reading()
+                self.silent.append(ws)
+                self.counts["silent"] += 1
+            elif how < 0.4:
+                task.cancel()
+                ws.transport.abort()
+                self.counts["aborted"] += 1
+            else:
+                await ws.close()
+                task.cancel()
+                self.counts["closed"] += 1
+
+    async def close(self):
+        for ws, task in self.open:
+            task.cancel()
+            ws.transport.abort()
+        for ws in self.silent:
+            ws.transport.abort()
+        self.open, self.silent = [], []
+
+
+def app_state(app):
+    streams = list(app.streams.values())
+    return {
+        "streams": len(streams),
+        "clients": len(app.all_clients()),
+        "leaderboard_donors": sum(len(s.leaderboard) for s in streams),
+        "analytics_donors": sum(len(s.analytics.donors) for s in streams),
+        "donor_cache": len(app.donor_registry.cache),
+        "recent_events": len(app.event_store.recent),
+        "evictions": {kind: child.value for (kind,), child in app.EVICTIONS.children()},
+    }
+
+
+def top_allocators(before, after, limit):
+    ignore = (tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+              tracemalloc.Filter(False, "<unknown>"))
+    before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+    top = []
+    for stat in after.compare_to(before, "lineno")[:limit]:
+        frame = stat.traceback[0]
+        top.append({
+            "where": f"{os.path.relpath(frame.filename) if frame.filename.startswith(os.getcwd()) else frame.filename}"
+                     f":{frame.lineno}",
+            "size_diff_kb": round(stat.size_diff / 1024, 1),
+            "size_kb": round(stat.size / 1024, 1),
+            "count_diff": stat.count_diff,
+        })
+    return top
+
+
+async def soak(args):
+    def configure(app):
+        app.deployment["bounded"] = args.bounded_memory
+        app.event_store.keep_raw = not args.bounded_memory
+        # Hours of stream pass in seconds here, so clean up as often
+        app.HOUSEKEEPING_INTERVAL = args.housekeeping
+        app.STREAM_IDLE = args.housekeeping * 2
+
+    tracemalloc.start(args.frames)
+    harness = await Harness(configure=configure,
+                            log_level=logging.INFO if args.verbose else logging.WARNING).start()
+    churn = Churn(harness.port, args.seed, args.churn_clients, args.max_clients)
+    total = int(args.hours * 60 * args.per_minute)
+    warmup = max(1, int(total * args.warmup))
+    donations = soak_donations(args.seed)
+    samples = []
+    start = time.perf_counter()
+    baseline = None
+
+    async def sample(sent):
+        samples.append({
+            "elapsed_s": round(time.perf_counter() - start, 2),
+            "donations": sent,
+            "stream_hours": round(sent / args.per_minute / 60, 2),
+            "rss_mb": round(resident_memory_bytes() / MB, 2),
+            "traced_mb": round(tracemalloc.get_traced_memory()[0] / MB, 2),
+            **{k: v for k, v in app_state(harness.app).items() if k != "evictions"},
+        })
+
+    try:
+        sent = 0
+        chunk = max(1, int(args.speed * args.churn_every))
+        next_sample = 0
+        while sent < total:
+            count = min(chunk, total - sent)
+            sent += await harness.upstream.replay(USER_ID, donations, rate=args.speed, count=count)
+            await churn.tick()
+            if baseline is None and sent >= warmup:
+                await asyncio.sleep(args.housekeeping)  # Let the backlog drain first
+                baseline = (tracemalloc.take_snapshot(), resident_memory_bytes())
+                await sample(sent)
+            elif time.perf_counter() - start >= next_sample:
+                await sample(sent)
+                next_sample = time.perf_counter() - start + args.sample_every
+        # Outputs and housekeeping catch up, then the final measurement
+        await asyncio.sleep(args.housekeeping * 2 + 1)
+        await sample(sent)
+        end = (tracemalloc.take_snapshot(), resident_memory_bytes())
+        state = app_state(harness.app)
+    finally:
+        await churn.close()
+        await harness.close()
+        tracemalloc.stop()
+
+    hours_measured = (total - warmup) / args.per_minute / 60
+    growth = (end[1] - baseline[1]) / MB
+    return {
+        "donations": total,
+        "stream_hours": args.hours,
+        "elapsed_s": round(time.perf_counter() - start, 2),
+        "rss_after_warmup_mb": round(baseline[1] / MB, 2),
+        "rss_end_mb": round(end[1] / MB, 2),
+        "rss_growth_mb": round(growth, 2),
+        "rss_growth_mb_per_stream_hour": round(growth / hours_measured, 3) if hours_measured else None,
+        "clients": churn.counts,
+        "app": state,
+        "top_allocators": top_allocators(baseline[0], end[0], args.top),
+    }, samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PLS DONATE Overlay soak test")
+    parser.add_argument("--hours", type=float, default=8, help="Length of the simulated stream")
+    parser.add_argument("--per-minute", type=float, default=30, help="Donations per minute of stream")
+    parser.add_argument("--speed", type=float, default=1000, help="Donations replayed per second")
+    parser.add_argument("--churn-every", type=float, default=0.5, help="Seconds of replay between client churn")
+    parser.add_argument("--churn-clients", type=int, default=4, help="Clients opened per churn")
+    parser.add_argument("--max-clients", type=int, default=40, help="Clients kept open at most")
+    parser.add_argument("--housekeeping", type=float, default=2, help="App housekeeping interval in seconds")
+    parser.add_argument("--bounded-memory", action="store_true", help="Run the app with --bounded-memory")
+    parser.add_argument("--warmup", type=float, default=0.1, help="Fraction of donations before the baseline")
+    parser.add_argument("--sample-every", type=float, default=2, help="Seconds between RSS samples")
+    parser.add_argument("--frames", type=int, default=1, help="tracemalloc frames per allocation")
+    parser.add_argument("--top", type=int, default=15, help="Allocators to list")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="Short run for smoke testing")
+    parser.add_argument("--output", help="Write the JSON report (with every sample) here")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's INFO logging")
+    args = parser.parse_args()
+
+    if args.quick:
+        args.hours, args.housekeeping = 0.5, 1
+    if args.output:
+        args.output = os.path.abspath(args.output)
+    logging.getLogger().setLevel(logging.INFO if args.verbose else logging.WARNING)
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "json_codec": codec.NAME,
+        "platform": platform.platform(),
+        "args": {k: v for k, v in vars(args).items() if k != "output"},
+    }
+    report["results"], report["samples"] = asyncio.run(soak(args))
+
+    results = report["results"]
+    print_result("soak", {k: v for k, v in results.items() if not isinstance(v, (dict, list))})
+    print_result("clients", results["clients"])
+    print_result("app", {k: v for k, v in results["app"].items() if k != "evictions"})
+    print_result("evictions", results["app"]["evictions"] or {"none": 0})
+    print("\nTop allocations since warm-up:")
+    for entry in results["top_allocators"]:
+        print(f"  {entry['size_diff_kb']:+10.1f} KiB {entry['count_diff']:+8d} blocks  {entry['where']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nReport written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
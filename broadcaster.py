@@ -0,0 +1,265 @@
+import asyncio
+import logging
+import time
+from collections import deque
+
+import codec
+import wire
+
+logger = logging.getLogger(__name__)
+
+# How many unsent messages a single client may have queued before we start
+# dropping the oldest ones. OBS browser sources that stall (hidden scene,
+# throttled tab) must never hold up the other overlays. Each donation is
+# usually two messages (event + leaderboard delta), so this covers a burst
+# of a few hundred donations arriving in one read.
+DEFAULT_MAX_QUEUE = 1024
+# A send that takes longer than this means the socket is effectively dead
+SEND_TIMEOUT = 10
+# sweep() drops clients that couldn't send anything for this long
+STALL_TIMEOUT = 60
+
+# What a client can subscribe to, and the topic each message type belongs to.
+# Messages of other types (e.g. "subscribed" acks) aren't topic-filtered.
+TOPICS = ("donations", "leaderboard", "stats", "alerts")
+MESSAGE_TOPICS = {
+    "donation": "donations",
+    "leaderboard_delta": "leaderboard",
+    "stats": "stats",
+    "alert": "alerts",
+    "alert_end": "alerts",
+}
+
+
+def parse_topics(value):
+    # "donations,stats" or ["donations", "stats"]; unknown names are ignored
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, (list, tuple)):
+        return frozenset(TOPICS)
+    return frozenset(t.strip() for t in value if isinstance(t, str) and t.strip() in TOPICS)
+
+
+def parse_min_amount(value):
+    try:
+        return max(float(value), 0) if value not in (None, "") else 0
+    except (TypeError, ValueError):
+        return 0
+
+
+class ClientConnection:
+    def __init__(self, ws, max_queue=DEFAULT_MAX_QUEUE, on_close=None, include_raw=True,
+                 topics=TOPICS, min_amount=0, fmt=None):
+        self.ws = ws
+        self.include_raw = include_raw  # False: donations are sent without the upstream "raw" payload
+        self.fmt = fmt                  # "json"/"msgpack": compact v2 protocol (see wire.py)
+        self.topics = frozenset(topics)
+        self.min_amount = min_amount    # Donations/alerts below this are not sent
+        self.max_queue = max_queue
+        self.on_close = on_close
+        self.queue = deque()  # entries are [coalesce_key, payload, enqueued_at, resync]
+        self.pending = {}     # coalesce_key -> queued entry
+        self.dropped = 0
+        self.sent = 0
+        self.lag = 0.0        # enqueue -> send completed, for the last message
+        self.closed = False
+        self.handler = None   # the /ws handler task, cancelled by abort()
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._writer())
+
+    def enqueue(self, payload, coalesce_key=None, resync=False):
+        # resync: losing this message leaves the client's state wrong
+        # (leaderboard deltas only carry the rows that changed)
+        if self.closed:
+            return
+
+        # Coalesce: a newer message with the same key replaces the queued one
+        # (e.g. state snapshots where only the latest value matters)
+        if coalesce_key is not None:
+            entry = self.pending.get(coalesce_key)
+            if entry is not None:
+                entry[1] = payload
+                return
+
+        # Drop oldest when the client can't keep up
+        if len(self.queue) >= self.max_queue:
+            old_key, _, _, old_resync = self.queue.popleft()
+            if old_key is not None:
+                self.pending.pop(old_key, None)
+            self.dropped += 1
+            if old_resync:
+                # Close instead: the overlay reconnects and resumes (or gets
+                # a snapshot), which sends the lost rows again
+                logger.info("Closing websocket client that fell behind on leaderboard deltas")
+                self.abort()
+                return
+
+        entry = [coalesce_key, payload, time.perf_counter(), resync]
+        self.queue.append(entry)
+        if coalesce_key is not None:
+            self.pending[coalesce_key] = entry
+        self._wakeup.set()
+
+    async def _writer(self):
+        try:
+            while True:
+                if not self.queue:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+
+                key, payload, enqueued_at, _ = self.queue.popleft()
+                if key is not None:
+                    self.pending.pop(key, None)
+
+                await asyncio.wait_for(self.ws.send(payload), SEND_TIMEOUT)
+                self.sent += 1
+                self.lag = time.perf_counter() - enqueued_at
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.info(f"Dropping websocket client after failed send: {e!r}")
+        finally:
+            self._mark_closed()
+
+    def _mark_closed(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.queue.clear()
+        self.pending.clear()
+        if self.on_close:
+            self.on_close(self)
+
+    def stalled(self, timeout=STALL_TIMEOUT):
+        # Gone (writer ended) or stuck with messages waiting, e.g. a socket
+        # that went away without the /ws handler ever noticing
+        return self.closed or self._task.done() or self.oldest_age() > timeout
+
+    def oldest_age(self):
+        # How long the head of the queue has been waiting
+        return time.perf_counter() - self.queue[0][2] if self.queue else 0.0
+
+    def stats(self):
+        return {
+            "protocol": f"v2.{self.fmt}" if self.fmt else "v1",
+            "topics": sorted(self.topics),
+            "min_amount": self.min_amount,
+            "queued": len(self.queue),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "lag_ms": self.lag * 1000,
+            "oldest_queued_ms": self.oldest_age() * 1000,
+        }
+
+    def close(self):
+        self._mark_closed()
+        if self._task and not self._task.done():
+            self._task.cancel()
+
+    def abort(self):
+        # close() plus the handler still waiting on the socket, whose
+        # cleanup then closes the connection
+        self.close()
+        if self.handler is not None and not self.handler.done() and self.handler is not asyncio.current_task():
+            self.handler.cancel()
+
+
+class Broadcaster:
+    def __init__(self, max_queue=DEFAULT_MAX_QUEUE):
+        self.max_queue = max_queue
+        self.clients = set()
+        self.subscribers = {topic: set() for topic in TOPICS}
+        self.sequencer = wire.Sequencer()
+
+    def register(self, ws, include_raw=True, topics=TOPICS, min_amount=0, fmt=None):
+        client = ClientConnection(ws, self.max_queue, on_close=self._discard, include_raw=include_raw,
+                                  topics=topics, min_amount=min_amount, fmt=fmt)
+        if fmt:
+            # From now on keep recent messages so v2 clients can resume
+            self.sequencer.activate()
+        self.clients.add(client)
+        for topic in client.topics:
+            self.subscribers[topic].add(client)
+        return client
+
+    def subscribe(self, client, topics=None, min_amount=None):
+        # Change what an already registered client receives
+        if topics is not None:
+            for topic in client.topics - topics:
+                self.subscribers[topic].discard(client)
+            for topic in topics - client.topics:
+                if not client.closed:
+                    self.subscribers[topic].add(client)
+            client.topics = frozenset(topics)
+        if min_amount is not None:
+            client.min_amount = min_amount
+
+    def unregister(self, client):
+        self._discard(client)
+        client.close()
+
+    def _discard(self, client):
+        self.clients.discard(client)
+        for topic in client.topics:
+            self.subscribers[topic].discard(client)
+
+    def sweep(self, timeout=STALL_TIMEOUT):
+        # Periodic cleanup (see housekeeping_loop in app.py); returns how
+        # many clients were dropped
+        stale = [client for client in self.clients if client.stalled(timeout)]
+        for client in stale:
+            self._discard(client)
+            client.abort()
+        for subscribers in self.subscribers.values():
+            subscribers.difference_update([client for client in subscribers if client.closed])
+        return len(stale)
+
+    def wants(self, topic):
+        # Lets callers skip building messages nobody will receive. Once v2
+        # clients are around, a disconnected one may still resume them.
+        return bool(self.subscribers[topic]) or self.sequencer.active
+
+    def resume(self, client, epoch, seq):
+        # Send a v2 client what it missed since `seq`; False if it needs a snapshot
+        entries = self.sequencer.since(epoch, seq)
+        if entries is None:
+            return False
+        for _, topic, amount, body in entries:
+            if topic in client.topics and not (isinstance(amount, (int, float)) and amount < client.min_amount):
+                client.enqueue(wire.encode(client.fmt, body), resync=topic == "leaderboard")
+        return True
+
+    def publish(self, message, coalesce_key=None, payloads=None):
+        # Serialize once per variant (with/without "raw") and hand the same
+        # payload to every subscribed client queue. Pass the same `payloads`
+        # dict to several broadcasters to share the serialization between them.
+        topic = MESSAGE_TOPICS.get(message.get("type"))
+        seq, body = self.sequencer.next(message, topic)
+        clients = self.subscribers[topic] if topic else self.clients
+        if not clients:
+            return
+        if payloads is None:
+            payloads = {}
+        # v2 payloads carry this broadcaster's sequence number, so they are never shared
+        compact_payloads = {}
+        resync = topic == "leaderboard"
+        amount = message.get("amount")
+        if not isinstance(amount, (int, float)):
+            amount = None
+        for client in list(clients):
+            if amount is not None and amount < client.min_amount:
+                continue
+            if client.fmt:
+                payload = compact_payloads.get(client.fmt)
+                if payload is None:
+                    if body is None:
+                        body = wire.compact(message, seq)
+                    payload = compact_payloads[client.fmt] = wire.encode(client.fmt, body)
+                client.enqueue(payload, coalesce_key, resync)
+                continue
+            full = client.include_raw or "raw" not in message
+            payload = payloads.get(full)
+            if payload is None:
+                payload = payloads[full] = codec.dumps(message if full else codec.without_raw(message))
+            client.enqueue(payload, coalesce_key, resync)
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import random
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# Messages are one JSON object per line: {"t": topic, "m": message}
+MAX_LINE = 1024 * 1024
+# A peer whose unsent data grows past this is disconnected; it resyncs
+# from the store when it reconnects instead of holding memory in the hub
+MAX_PEER_BUFFER = 8 * 1024 * 1024
+RECONNECT_DELAY = (0.5, 10)  # (first, max) seconds
+
+
+def parse_address(address):
+    # "unix:/path/to/bus.sock" or "tcp://127.0.0.1:5002" (also "127.0.0.1:5002")
+    if address.startswith("unix:"):
+        return "unix", address[len("unix:"):]
+    if address.startswith("tcp://"):
+        address = address[len("tcp://"):]
+    host, _, port = address.rpartition(":")
+    if not host or not port.isdigit():
+        raise ValueError(f"Invalid bus address {address!r}, expected unix:<path> or tcp://<host>:<port>")
+    return "tcp", (host.strip("[]"), int(port))
+
+
+def _encode(topic, message):
+    return (codec.dumps({"t": topic, "m": message}) + "\n").encode()
+
+
+def _decode(line):
+    data = codec.loads(line)
+    return data["t"], data["m"]
+
+
+class LocalBus:
+    # In-process bus: publish() calls every subscriber of the topic right
+    # away. Subscribers are plain callables and must not block.
+    def __init__(self):
+        self.subscribers = {}  # topic -> [callback(message)]
+
+    def subscribe(self, topic, callback):
+        self.subscribers.setdefault(topic, []).append(callback)
+
+    def publish(self, topic, message):
+        self._dispatch(topic, message)
+
+    def _dispatch(self, topic, message):
+        for callback in self.subscribers.get(topic, ()):
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Bus subscriber for {topic} failed: {e}")
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    def stats(self):
+        return {"kind": "local"}
+
+
+class BusHub(LocalBus):
+    # The ingest side of a multi-process deployment. Serves the bus on a unix
+    # socket or local TCP port; publish() delivers to local subscribers and
+    # writes one line to every connected peer without waiting on any of them.
+    # Lines from a peer are relayed to everyone else.
+    def __init__(self, address, greeting=None):
+        super().__init__()
+        self.address = address
+        self.greeting = greeting  # () -> [(topic, message)] sent to each new peer first
+        self.peers = set()
+        self.published = 0
+        self.disconnected = 0
+        self._server = None
+
+    async def start(self):
+        kind, where = parse_address(self.address)
+        if kind == "unix":
+            self._server = await asyncio.start_unix_server(self._serve, path=where, limit=MAX_LINE)
+        else:
+            self._server = await asyncio.start_server(self._serve, *where, limit=MAX_LINE)
+        logger.info(f"Event bus listening on {self.address}")
+
+    async def close(self):
+        if self._server:
+            self._server.close()
+        for writer in list(self.peers):
+            writer.close()
+        self.peers.clear()
+
+    async def _serve(self, reader, writer):
+        # Registering and greeting happen without an await in between, so
+        # the peer gets every message published after its greeting
+        self.peers.add(writer)
+        for topic, message in (self.greeting() if self.greeting else ()):
+            self._write(writer, _encode(topic, message))
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    topic, message = _decode(line)
+                except (codec.DecodeError, KeyError, TypeError):
+                    continue
+                self.publish(topic, message, exclude=writer)
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError) as e:
+            logger.info(f"Bus peer disconnected: {e!r}")
+        finally:
+            self.peers.discard(writer)
+            writer.close()
+
+    def publish(self, topic, message, exclude=None):
+        self._dispatch(topic, message)
+        if not self.peers:
+            return
+        self.published += 1
+        line = _encode(topic, message)
+        for writer in list(self.peers):
+            if writer is not exclude:
+                self._write(writer, line)
+
+    def _write(self, writer, line):
+        if writer.transport.get_write_buffer_size() > MAX_PEER_BUFFER:
+            logger.warning("Disconnecting bus peer that stopped reading")
+            self.peers.discard(writer)
+            self.disconnected += 1
+            writer.close()
+            return
+        writer.write(line)
+
+    def stats(self):
+        return {
+            "kind": "hub",
+            "address": self.address,
+            "peers": len(self.peers),
+            "published": self.published,
+            "disconnected": self.disconnected,
+        }
+
+
+class BusClient(LocalBus):
+    # A worker's connection to the hub, reconnecting with jittered backoff.
+    # The hub greets every (re)connection, which is where a worker resyncs.
+    def __init__(self, address):
+        super().__init__()
+        self.address = address
+        self.connected = False
+        self.received = 0
+        self.reconnects = 0
+        self._writer = None
+        self._task = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run(), name="bus-client")
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        if self._writer:
+            self._writer.close()
+
+    async def _connect(self):
+        kind, where = parse_address(self.address)
+        if kind == "unix":
+            return await asyncio.open_unix_connection(where, limit=MAX_LINE)
+        return await asyncio.open_connection(*where, limit=MAX_LINE)
+
+    async def _run(self):
+        delay = RECONNECT_DELAY[0]
+        while True:
+            try:
+                reader, self._writer = await self._connect()
+                self.connected = True
+                delay = RECONNECT_DELAY[0]
+                logger.info(f"Connected to event bus at {self.address}")
+                while True:
+                    line = await reader.readline()
+                    if not line:
+                        break
+                    try:
+                        topic, message = _decode(line)
+                    except (codec.DecodeError, KeyError, TypeError):
+                        continue
+                    self.received += 1
+                    self._dispatch(topic, message)
+            except (OSError, asyncio.IncompleteReadError, ValueError) as e:
+                logger.warning(f"Event bus connection failed: {e!r}")
+            finally:
+                self.connected = False
+                if self._writer:
+                    self._writer.close()
+                    self._writer = None
+            self.reconnects += 1
+            await asyncio.sleep(delay * random.uniform(0.5, 1.5))
+            delay = min(delay * 2, RECONNECT_DELAY[1])
+
+    def publish(self, topic, message):
+        # Sent to the hub, which relays it to the other processes
+        self._dispatch(topic, message)
+        if self._writer is not None:
+            self._writer.write(_encode(topic, message))
+
+    def stats(self):
+        return {
+            "kind": "client",
+            "address": self.address,
+            "connected": self.connected,
+            "received": self.received,
+            "reconnects": self.reconnects,
+        }
@@ -1,41 +1,206 @@
 import asyncio
 import logging
-from twitchio.ext import commands
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
-from functools import partial
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from string import Formatter
 
 logger = logging.getLogger(__name__)
 
-class TwitchBot(commands.Bot):
-    def __init__(self, token, channel):
-        # Clean token if it includes "oauth:"
-        if token.startswith("oauth:"):
-            token = token.replace("oauth:", "")
-        super().__init__(token=token, prefix='!', initial_channels=[channel])
-        self.target_channel = channel
-
-    async def event_ready(self):
-        logger.info(f'Twitch Bot connected as {self.nick}')
-
-    async def send_to_channel(self, message):
-        # Get channel from cache or wait for it
-        channel = self.get_channel(self.target_channel)
-        if channel:
-            await channel.send(message)
-        else:
-            logger.warning(f"Twitch channel {self.target_channel} not found in cache yet.")
+DEFAULT_TEMPLATE = 'Thanks for the {amount}R$ donation by @{username}'
+# Used when several queued donations are merged into one chat message
+MERGED_TEMPLATE = 'Thanks {usernames} for {amount}R$'
+
+# Twitch allows 20 messages per 30s for regular users. YouTube has no hard
+# rate limit but every insert costs quota, so we keep it slow and merge more.
+TWITCH_RATE = (20 / 30, 3)      # (tokens per second, burst)
+YOUTUBE_RATE = (1 / 5, 2)
+TWITCH_MAX_LENGTH = 500
+YOUTUBE_MAX_LENGTH = 200
+MAX_QUEUE = 100
+
+# Resolves fields exactly like str.format: {username.upper}, {amount:,},
+# {message!r}, nested specs ({amount:>{width}}) and the errors they raise
+FORMATTER = Formatter()
+
+@lru_cache(maxsize=32)
+def compile_template(template):
+    # Parse a str.format template once into (literal, field, spec, conversion)
+    # parts; raises ValueError for malformed templates
+    return tuple(FORMATTER.parse(template))
+
+def render_template(parts, values):
+    # Same result as template.format(**values), without parsing it again
+    out = []
+    for literal, field, spec, conversion in parts:
+        if literal:
+            out.append(literal)
+        if field is not None:
+            # '{}' is positional, like '{0}'
+            value = values[field] if field in values else FORMATTER.get_field(field or '0', (), values)[0]
+            value = FORMATTER.convert_field(value, conversion)
+            if spec and '{' in spec:
+                spec = FORMATTER.vformat(spec, (), values)
+            out.append(FORMATTER.format_field(value, spec or ''))
+    return ''.join(out)
+
+class TokenBucket:
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class ChatChannel:
+    # Outbound queue + worker for one platform. Donations that pile up while
+    # we wait for a rate limit token are merged into a single message.
+    def __init__(self, name, send, rate, max_length, max_queue=MAX_QUEUE):
+        self.name = name
+        self.send = send  # async def send(message)
+        self.bucket = TokenBucket(*rate)
+        self.max_length = max_length
+        self.template = compile_template(DEFAULT_TEMPLATE)
+        self.queue = asyncio.Queue(maxsize=max_queue)
+        self.sent = 0
+        self.merged = 0
+        self.dropped = 0
+        self.errors = 0
+        self.task = asyncio.create_task(self._worker())
+
+    def put(self, event):
+        if self.queue.full():
+            # Drop the oldest, a late thank-you is worth less than a new one
+            self.queue.get_nowait()
+            self.dropped += 1
+        self.queue.put_nowait(event)
+
+    async def _worker(self):
+        while True:
+            event = await self.queue.get()
+            await self.bucket.acquire()
+
+            # Anything that arrived while we were rate limited goes out together
+            batch = [event]
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            self.merged += len(batch) - 1
+
+            try:
+                messages = self.format(batch)
+            except Exception as e:
+                # e.g. a typo'd {placeholder} in the chat template
+                self.errors += 1
+                logger.error(f"{self.name} message format error: {e}")
+                continue
+
+            for i, message in enumerate(messages):
+                if i:
+                    await self.bucket.acquire()
+                try:
+                    await self.send(message)
+                    self.sent += 1
+                except Exception as e:
+                    self.errors += 1
+                    logger.error(f"{self.name} send error: {e}")
+
+    def format(self, batch):
+        if len(batch) == 1:
+            return [self.format_single(batch[0])]
+
+        # Merge into as few messages as fit the platform's length limit
+        # Donors are told apart by their registry key (see donors.py), so a
+        # donor whose name casing changed mid-batch is only mentioned once
+        messages = []
+        names, seen, total = [], set(), 0
+        for event in batch:
+            key = event.get('donor') or event.get('sender_user')
+            amount = event.get('amount') or 0
+            if key not in seen:
+                name = f"@{event.get('sender_user')}"
+                if names and len(self.format_merged(names + [name], total + amount)) > self.max_length:
+                    messages.append(self.format_merged(names, total))
+                    names, seen, total = [], set(), 0
+                names.append(name)
+                seen.add(key)
+            total += amount
+        messages.append(self.format_merged(names, total))
+        return [message[:self.max_length] for message in messages]
+
+    def format_single(self, event):
+        return render_template(self.template, {
+            'amount': event.get('amount'),
+            'username': event.get('sender_user'),
+            'message': event.get('message', '')
+        })[:self.max_length]
+
+    def format_merged(self, names, total):
+        return MERGED_TEMPLATE.format(usernames=", ".join(names), amount=f"{total:,}")
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "sent": self.sent,
+            "merged": self.merged,
+            "dropped": self.dropped,
+            "errors": self.errors,
+        }
 
 class ChatManager:
     def __init__(self):
         self.config = {}
         self.twitch_bot = None
         self.twitch_task = None
+        self.twitch_settings = None  # (token, channel) the running bot was started with
+        self.channels = {}  # platform -> ChatChannel, created on first update_config
+        # The YouTube client (and its HTTP connection) is not thread safe, so it
+        # lives on a single dedicated thread and is reused for every message
+        self.youtube_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="youtube")
+        self.youtube = None  # (token, client)
     
     async def update_config(self, config):
         self.config = config
+        if not self.channels:
+            self.channels = {
+                "twitch": ChatChannel("Twitch", self._send_twitch, TWITCH_RATE, TWITCH_MAX_LENGTH),
+                "youtube": ChatChannel("YouTube", self._send_youtube, YOUTUBE_RATE, YOUTUBE_MAX_LENGTH),
+            }
+        try:
+            template = compile_template(config.get('chat_template') or DEFAULT_TEMPLATE)
+        except ValueError as e:
+            logger.error(f"Invalid chat template, using default: {e}")
+            template = compile_template(DEFAULT_TEMPLATE)
+        for channel in self.channels.values():
+            channel.template = template
+
+        # Build the YouTube client ahead of the first donation; it is only
+        # rebuilt when the token changes
+        if config.get('youtube_enabled') and config.get('youtube_token'):
+            loop = asyncio.get_event_loop()
+            loop.run_in_executor(self.youtube_executor, self._prewarm_youtube, config['youtube_token'])
         
+        await self._update_twitch(config)
+
+    async def _update_twitch(self, config):
+        # Only reconnect Twitch when its own settings changed, so saving
+        # e.g. min_amount or the template keeps the connection warm
+        twitch_settings = None
+        if config.get('twitch_enabled') and config.get('twitch_token') and config.get('twitch_channel'):
+            twitch_settings = (config['twitch_token'], config['twitch_channel'])
+        running = self.twitch_task is not None and not self.twitch_task.done()
+        if twitch_settings == self.twitch_settings and (running or not twitch_settings):
+            return
+        self.twitch_settings = twitch_settings
+
         # Handle Twitch Reconnect
         if self.twitch_bot:
             try:
@@ -44,9 +209,11 @@ class ChatManager:
                 pass
             self.twitch_bot = None
             
-        if config.get('twitch_enabled') and config.get('twitch_token') and config.get('twitch_channel'):
+        if twitch_settings:
             try:
-                self.twitch_bot = TwitchBot(config['twitch_token'], config['twitch_channel'])
+                # twitchio is slow to import, so it's only loaded once Twitch is enabled
+                from twitch_bot import TwitchBot
+                self.twitch_bot = TwitchBot(*twitch_settings)
                 # Start bot in background
                 self.twitch_task = asyncio.create_task(self._run_twitch_safely())
             except Exception as e:
@@ -62,31 +229,66 @@ class ChatManager:
             else:
                 logger.error(f"Twitch Bot crashed: {e}")
 
-    async def send_message(self, donation_data):
-        template = self.config.get('chat_template')
-        if not template:
-            template = 'Thanks for the {amount}R$ donation by @{username}'
-            
-        message = template.format(
-            amount=donation_data.get('amount'),
-            username=donation_data.get('sender_user'),
-            message=donation_data.get('message', '')
-        )
+    def send_message(self, donation_data):
+        # Never blocks: the per-platform workers format, rate limit and send
+        if not self.channels:
+            return
         
         # Twitch
         if self.twitch_bot and self.config.get('twitch_enabled'):
-            try:
-                await self.twitch_bot.send_to_channel(message)
-            except Exception as e:
-                logger.error(f"Twitch send error: {e}")
+            self.channels["twitch"].put(donation_data)
                 
         # YouTube
         if self.config.get('youtube_enabled') and self.config.get('youtube_token'):
-            # Run blocking YouTube API in executor
+            self.channels["youtube"].put(donation_data)
+
+    def stats(self):
+        stats = {name: channel.stats() for name, channel in self.channels.items()}
+        if "twitch" in stats:
+            stats["twitch"]["ready"] = bool(self.twitch_bot and self.twitch_bot.is_ready)
+        return stats
+
+    async def close(self):
+        for channel in self.channels.values():
+            channel.task.cancel()
+        if self.twitch_bot:
+            try:
+                await self.twitch_bot.close()
+            except Exception:
+                pass
+            self.twitch_bot = None
+        self.youtube_executor.shutdown(wait=False)
+
+    async def _send_twitch(self, message):
+        if self.twitch_bot and self.config.get('twitch_enabled'):
+            await self.twitch_bot.send_to_channel(message)
+
+    async def _send_youtube(self, message):
+        if self.config.get('youtube_enabled') and self.config.get('youtube_token'):
+            # Run blocking YouTube API on its own thread
             loop = asyncio.get_event_loop()
-            await loop.run_in_executor(None, partial(self.send_youtube_sync, message))
+            await loop.run_in_executor(self.youtube_executor, partial(self.send_youtube_sync, message))
+
+    def _youtube_client(self, token):
+        # Only called from the YouTube thread
+        if self.youtube is None or self.youtube[0] != token:
+            # The Google API client is slow to import, so it's only loaded once YouTube is enabled
+            from google.oauth2.credentials import Credentials
+            from googleapiclient.discovery import build
+            creds = Credentials(token)
+            # Bundled discovery document: no network fetch or cache lookup
+            client = build('youtube', 'v3', credentials=creds, static_discovery=True, cache_discovery=False)
+            self.youtube = (token, client)
+        return self.youtube[1]
+
+    def _prewarm_youtube(self, token):
+        try:
+            self._youtube_client(token)
+        except Exception as e:
+            logger.error(f"Failed to create YouTube client: {e}")
 
     def send_youtube_sync(self, message):
+        from googleapiclient.errors import HttpError
         token = self.config.get('youtube_token')
         chat_id = self.config.get('youtube_chat_id')
         
@@ -95,10 +297,9 @@ class ChatManager:
             return
 
         try:
-            creds = Credentials(token)
-            youtube = build('youtube', 'v3', credentials=creds)
+            youtube = self._youtube_client(token)
             
-            # 2. Insert message directly using provided ID
+            # Insert message directly using provided ID
             youtube.liveChatMessages().insert(
                 part="snippet",
                 body={
@@ -124,5 +325,6 @@ class ChatManager:
             if "refresh the access token" in error_msg or "401" in error_msg:
                  logger.warning("YouTube Access Token expired. Please generate a new one in the dashboard.")
                  self.config['youtube_enabled'] = False
+                 self.youtube = None
             else:
                 logger.error(f"YouTube send error: {e}")
@@ -0,0 +1,106 @@
+import json
+import os
+
+# Fastest available JSON library: orjson, then msgspec, then the stdlib.
+# PLSDONATE_JSON=json forces the stdlib (handy for benchmark comparisons).
+_preferred = os.environ.get("PLSDONATE_JSON", "").lower()
+
+orjson = msgspec = None
+if _preferred in ("", "orjson"):
+    try:
+        import orjson
+    except ImportError:
+        pass
+if orjson is None and _preferred in ("", "msgspec"):
+    try:
+        import msgspec
+    except ImportError:
+        pass
+
+if orjson is not None:
+    NAME = "orjson"
+    DecodeError = orjson.JSONDecodeError  # also a json.JSONDecodeError
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode()
+elif msgspec is not None:
+    NAME = "msgspec"
+    DecodeError = (msgspec.DecodeError, UnicodeDecodeError)
+    _encoder = msgspec.json.Encoder()
+    loads = msgspec.json.Decoder().decode
+
+    def dumps(obj):
+        return _encoder.encode(obj).decode()
+else:
+    NAME = "json"
+    DecodeError = json.JSONDecodeError
+    loads = json.loads
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+    dumps = _encoder.encode
+
+
+def is_ping(msg):
+    # Upstream keep-alives are tiny frames like {"ping_interval": 10}, so a
+    # substring check lets us skip them without a full parse
+    if len(msg) > 64:
+        return False
+    if isinstance(msg, bytes):
+        return b"ping_interval" in msg and b"sender" not in msg
+    return "ping_interval" in msg and "sender" not in msg
+
+
+# Sender fields that hold a stable account id, when upstream sends one
+SENDER_ID_FIELDS = ("userId", "id")
+
+
+def sender_id(sender):
+    for field in SENDER_ID_FIELDS:
+        value = sender.get(field)
+        if value not in (None, ""):
+            return str(value)
+    return None
+
+
+class Donation:
+    __slots__ = ("sender_name", "sender_user", "sender_id", "amount", "message", "raw")
+
+    def __init__(self, sender_name, sender_user, amount, message, raw, sender_id=None):
+        self.sender_name = sender_name
+        self.sender_user = sender_user
+        self.sender_id = sender_id
+        self.amount = amount
+        self.message = message
+        self.raw = raw
+
+    @classmethod
+    def from_payload(cls, data):
+        # None for anything that isn't a donation frame
+        if not isinstance(data, dict) or "sender" not in data or "amount" not in data:
+            return None
+        sender = data["sender"] or {}
+        return cls(
+            sender.get("displayName", "Unknown"),
+            sender.get("username", "Unknown"),
+            data.get("amount", 0),
+            data.get("message", ""),
+            data,
+            sender_id(sender),
+        )
+
+    def to_event(self, user_id, timestamp):
+        return {
+            "type": "donation",
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "sender_name": self.sender_name,
+            "sender_user": self.sender_user,
+            "sender_id": self.sender_id,
+            "amount": self.amount,
+            "message": self.message,
+            "raw": self.raw
+        }
+
+
+def without_raw(message):
+    return {k: v for k, v in message.items() if k != "raw"}
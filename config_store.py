@@ -0,0 +1,266 @@
+import asyncio
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "user_id": None,
+    "extra_user_ids": [],  # Additional creators tracked by this same process
+    "min_amount": 0,
+    "chat_template": "Thanks for the {amount}R$ donation by @{username}",
+    "twitch_enabled": False,
+    "twitch_token": "",
+    "twitch_channel": "",
+    "youtube_enabled": False,
+    "youtube_token": "",
+    "youtube_chat_id": "",
+    "alert_tiers": [[0, 5], [100, 8], [1000, 12], [10000, 20]],  # [min amount, seconds]
+    "alert_merge_below": 25,
+    # Optional outputs (see sinks.py); blank disables them
+    "webhook_url": "",
+    "export_path": "",      # JSON Lines file, relative paths are next to config.json
+    "obs_enabled": False,
+    "obs_url": "ws://127.0.0.1:4455",
+    "obs_password": "",
+    "obs_scene": "",
+    "obs_min_amount": 0,
+    "obs_scene_seconds": 10
+}
+
+# Which subsystems care about which keys; min_amount is read per donation
+USER_KEYS = ("user_id", "extra_user_ids")
+ALERT_KEYS = ("alert_tiers", "alert_merge_below")
+SINK_KEYS = ("webhook_url", "export_path", "obs_enabled", "obs_url", "obs_password", "obs_scene",
+             "obs_min_amount", "obs_scene_seconds")
+CHAT_KEYS = ("chat_template", "twitch_enabled", "twitch_token", "twitch_channel",
+             "youtube_enabled", "youtube_token", "youtube_chat_id")
+
+# Rapid saves (e.g. several dashboard tabs) collapse into one write
+DEBOUNCE_SECONDS = 0.5
+
+
+def _str(value):
+    if value is None:
+        return ""
+    if isinstance(value, bool) or not isinstance(value, (str, int)):
+        raise ValueError(f"expected text, got {type(value).__name__}")
+    return str(value).strip()
+
+
+def _optional_id(value):
+    return _str(value) or None
+
+
+def _id_list(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        # Dashboard sends a comma separated list
+        value = value.split(",")
+    if not isinstance(value, list):
+        raise ValueError(f"expected a list, got {type(value).__name__}")
+    return [v for v in (_str(v) for v in value) if v]
+
+
+def _amount(value):
+    if value is None or value == "":
+        return 0
+    if isinstance(value, bool):
+        raise ValueError("expected a number")
+    try:
+        value = int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"expected a whole number, got {value!r}")
+    if value < 0:
+        raise ValueError("must not be negative")
+    return value
+
+
+def _tiers(value):
+    # [[min amount, seconds], ...] or "0:5, 100:8" from the dashboard
+    if isinstance(value, str):
+        value = [part.split(":") for part in value.split(",") if part.strip()]
+    if not isinstance(value, list) or not value:
+        raise ValueError("expected a list of [amount, seconds] pairs")
+    tiers = []
+    for tier in value:
+        if not isinstance(tier, (list, tuple)) or len(tier) != 2:
+            raise ValueError(f"expected [amount, seconds], got {tier!r}")
+        amount = _amount(tier[0].strip() if isinstance(tier[0], str) else tier[0])
+        seconds = _amount(tier[1].strip() if isinstance(tier[1], str) else tier[1])
+        if not seconds:
+            raise ValueError("alert duration must be at least 1 second")
+        tiers.append([amount, seconds])
+    return sorted(tiers)
+
+
+def _bool(value):
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in ("true", "1", "yes", "on"):
+        return True
+    if value is None or (isinstance(value, str) and value.strip().lower() in ("false", "0", "no", "off", "")):
+        return False
+    raise ValueError(f"expected true/false, got {value!r}")
+
+
+SCHEMA = {
+    "user_id": _optional_id,
+    "extra_user_ids": _id_list,
+    "min_amount": _amount,
+    "chat_template": _str,
+    "twitch_enabled": _bool,
+    "twitch_token": _str,
+    "twitch_channel": _str,
+    "youtube_enabled": _bool,
+    "youtube_token": _str,
+    "youtube_chat_id": _str,
+    "alert_tiers": _tiers,
+    "alert_merge_below": _amount,
+    "webhook_url": _str,
+    "export_path": _str,
+    "obs_enabled": _bool,
+    "obs_url": _str,
+    "obs_password": _str,
+    "obs_scene": _str,
+    "obs_min_amount": _amount,
+    "obs_scene_seconds": _amount,
+}
+
+
+class ConfigChange:
+    __slots__ = ("keys", "old", "new")
+
+    def __init__(self, keys, old, new):
+        self.keys = frozenset(keys)
+        self.old = old  # key -> previous value, changed keys only
+        self.new = new  # key -> new value, changed keys only
+
+    def __contains__(self, key):
+        return key in self.keys
+
+
+class ConfigStore:
+    # Validated config dict with atomic, debounced, off-loop persistence.
+    # `data` is updated in place so existing references (e.g. ChatManager's)
+    # always see the current values.
+    def __init__(self, path, debounce=DEBOUNCE_SECONDS):
+        self.path = path
+        self.debounce = debounce
+        self.data = dict(DEFAULTS)
+        self._subscribers = []  # (keys, async callback(change))
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="config")
+        self._save_task = None
+        self._dirty = False
+
+    def load(self, path=None):
+        # Synchronous: runs before the event loop exists. Passing a path
+        # switches to that file and starts over from the defaults.
+        if path is not None:
+            self.path = path
+            self.data.clear()
+            self.data.update(DEFAULTS)
+        try:
+            with open(self.path, "r") as f:
+                saved = json.load(f)
+        except FileNotFoundError:
+            return self.data
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not read {self.path}, using defaults: {e}")
+            return self.data
+
+        if not isinstance(saved, dict):
+            logger.error(f"Ignoring {self.path}: expected a JSON object")
+            return self.data
+
+        for key, value in saved.items():
+            coerce = SCHEMA.get(key)
+            if coerce is None:
+                # Unknown keys are kept so newer/older versions don't lose settings
+                self.data[key] = value
+                continue
+            try:
+                self.data[key] = coerce(value)
+            except ValueError as e:
+                logger.warning(f"Invalid config value for {key} ({e}), using default")
+        return self.data
+
+    def validate(self, updates):
+        # Coerce known keys, raising ValueError naming the bad key; unknown keys are ignored
+        validated = {}
+        for key, value in updates.items():
+            coerce = SCHEMA.get(key)
+            if coerce is None:
+                continue
+            try:
+                validated[key] = coerce(value)
+            except ValueError as e:
+                raise ValueError(f"{key}: {e}")
+        return validated
+
+    def subscribe(self, keys, callback):
+        self._subscribers.append((frozenset(keys), callback))
+
+    async def update(self, updates):
+        validated = self.validate(updates)
+        old, new = {}, {}
+        for key, value in validated.items():
+            if self.data.get(key) != value:
+                old[key] = self.data.get(key)
+                new[key] = value
+        if not new:
+            return ConfigChange((), {}, {})
+
+        self.data.update(new)
+        self.schedule_save()
+
+        change = ConfigChange(new.keys(), old, new)
+        for keys, callback in self._subscribers:
+            if keys & change.keys:
+                try:
+                    await callback(change)
+                except Exception as e:
+                    logger.error(f"Config subscriber failed: {e}")
+        return change
+
+    def schedule_save(self):
+        self._dirty = True
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+        self._save_task = asyncio.create_task(self._save_later())
+
+    async def _save_later(self):
+        await asyncio.sleep(self.debounce)
+        await self._save()
+
+    async def flush(self):
+        # Write any pending change now (called on shutdown)
+        if self._save_task and not self._save_task.done():
+            self._save_task.cancel()
+        await self._save()
+
+    async def _save(self):
+        if not self._dirty:
+            return
+        self._dirty = False
+        snapshot = json.dumps(self.data)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._write, snapshot)
+
+    def _write(self, snapshot):
+        # Write to a temp file and rename over the old one, so a crash
+        # mid-write never leaves a truncated config.json behind
+        tmp_path = self.path + ".tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                f.write(snapshot)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save config: {e}")
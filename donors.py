@@ -0,0 +1,161 @@
+import unicodedata
+import weakref
+from collections import OrderedDict
+
+# Donors kept in memory; the rest are looked up in the store on demand
+DEFAULT_CAPACITY = 10000
+
+
+def normalize(username):
+    # Roblox usernames are case-insensitive; NFKC folds look-alike forms
+    return unicodedata.normalize("NFKC", username or "").strip().casefold()
+
+
+def event_key(event):
+    # Donor key of a logged donation; ones logged before the registry
+    # only have a username
+    return event.get("donor") or user_alias(event.get("sender_user") or "Unknown")
+
+
+def id_alias(sender_id):
+    return f"id:{sender_id}"
+
+
+def user_alias(username):
+    return f"user:{normalize(username)}"
+
+
+class Donor:
+    # One person, whatever their display name or username casing. `key` is
+    # the account id alias when it's known, else the normalized username.
+    # `account` is the id alias once one is known; it only differs from
+    # `key` for donors who donated without an id first.
+    __slots__ = ("key", "username", "name", "account", "__weakref__")
+
+    def __init__(self, key, username, name, account=None):
+        self.key = key
+        self.username = username
+        self.name = name
+        self.account = account
+
+
+class DonorRegistry:
+    # Resolves each donation's sender to one Donor. Every alias (the account
+    # id and each normalized username it has donated under) maps to the same
+    # Donor in an LRU cache, filled with the most recent donors by load() at
+    # startup; misses are looked up in the store's donor tables off the
+    # event loop, and new donors and aliases are written back with the next
+    # event batch. Without a store (worker processes) it only normalizes.
+    def __init__(self, capacity=DEFAULT_CAPACITY, store=None):
+        self.capacity = capacity
+        self.store = store
+        self.cache = OrderedDict()  # alias -> Donor
+        # key -> Donor while any alias of it is cached, so a donor found
+        # again under another alias stays the same object
+        self.donors = weakref.WeakValueDictionary()
+        self.hits = 0
+        self.misses = 0
+        self.loaded = 0
+        # True while every donor in the store is also cached (load() found
+        # room for all of them and nothing was evicted since): a miss is
+        # then a new donor, with nothing to look up
+        self.complete = False
+
+    async def load(self):
+        # Warm the cache so returning donors never wait on a lookup
+        if self.store is None:
+            return
+        donors = {}
+        rows = await self.store.recent_donors(self.capacity)
+        for alias, key, username, name, account in reversed(rows):  # Newest end up most recently used
+            donor = donors.get(key)
+            if donor is None:
+                donor = donors[key] = Donor(key, username, name, account)
+            self._put(alias, donor)
+        self.loaded += len(rows)
+        self.complete = len(rows) < self.capacity
+
+    async def resolve(self, sender_id, username, name):
+        username = username or "Unknown"
+        name = name or username
+        alias = user_alias(username)
+        primary = id_alias(sender_id) if sender_id is not None else alias
+
+        if primary in self.cache:
+            self.hits += 1
+        elif self.store is not None and not self.complete:
+            # Only someone the cache doesn't know waits, on the store's
+            # lookup thread
+            self.misses += 1
+            await self._fetch([a for a in dict.fromkeys((primary, alias)) if a not in self.cache])
+
+        donor = self._get(primary)
+        if donor is None and primary != alias:
+            # First donation with an id from someone who donated without
+            # one before: the id becomes another alias of that donor
+            donor = self._get(alias)
+            if donor is not None and donor.account is not None:
+                donor = None  # The username belonged to another account
+            if donor is not None:
+                donor.account = primary
+                self._save(donor, primary)
+        if donor is None:
+            donor = Donor(primary, username, name, primary if primary != alias else None)
+            self._save(donor, primary)
+        elif donor.username != username or donor.name != name:
+            donor.username, donor.name = username, name
+            self._save(donor)
+        self._put(primary, donor)
+
+        if alias != primary and self.cache.get(alias) is not donor:
+            # Same account under a new (or differently cased) username;
+            # donations sent without an id under that name count for it too
+            self._put(alias, donor)
+            self._save(donor, alias)
+        return donor
+
+    def key_for(self, event):
+        return event_key(event)
+
+    async def _fetch(self, aliases):
+        found = {}
+        rows = await self.store.find_donors(aliases)
+        for alias, (key, username, name, account) in rows.items():
+            if alias in self.cache:
+                continue  # Resolved by another donation while we waited
+            # Another alias of the same donor may still be cached
+            donor = found.get(key) or self.donors.get(key)
+            if donor is None:
+                donor = Donor(key, username, name, account)
+            found[key] = donor
+            self._put(alias, donor)
+            self.loaded += 1
+
+    def _get(self, alias):
+        donor = self.cache.get(alias)
+        if donor is not None:
+            self.cache.move_to_end(alias)
+        return donor
+
+    def _put(self, alias, donor):
+        self.cache[alias] = donor
+        self.donors[donor.key] = donor
+        self.cache.move_to_end(alias)
+        while len(self.cache) > self.capacity:
+            self.cache.popitem(last=False)
+            self.complete = False
+
+    def _save(self, donor, alias=None):
+        if self.store is not None:
+            self.store.save_donor(donor.key, donor.username, donor.name, donor.account, alias)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "cached": len(self.cache),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "loaded": self.loaded,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+        }
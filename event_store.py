@@ -0,0 +1,680 @@
+import asyncio
+import csv
+import io
+import logging
+import sqlite3
+import time
+from collections import deque
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+import codec
+import donors
+
+logger = logging.getLogger(__name__)
+
+# If the app restarts within this many seconds of the last donation we keep
+# adding to the same session (crash / quick restart mid-stream)
+SESSION_RESUME_WINDOW = 30 * 60
+MAX_PAGE_SIZE = 1000
+EXPORT_CHUNK = 1000  # rows read per executor call while exporting
+# Failed writes of a batch before it's written one event at a time, so an
+# event that can never be stored doesn't hold up the ones behind it
+MAX_WRITE_ATTEMPTS = 3
+REJECTED_SIZE = 1000  # events that couldn't be stored, kept for inspection
+EXPORT_FIELDS = ("id", "session_id", "user_id", "timestamp", "donor", "username", "name", "amount", "message")
+# PRAGMA user_version; 2: events and rollups keyed by donor registry key,
+# 3: donors.account
+SCHEMA_VERSION = 3
+
+# donor (the registry key, see donors.py)/username/name/amount are copied
+# out of `data` so archive queries can use indexes; sessions and
+# donor_totals are rollups kept up to date by _write()
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY,
+    session_id INTEGER NOT NULL,
+    user_id TEXT,
+    ts REAL NOT NULL,
+    data TEXT NOT NULL,
+    donor TEXT COLLATE NOCASE,
+    name TEXT,
+    amount INTEGER,
+    username TEXT
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    ended_at REAL,
+    total INTEGER NOT NULL DEFAULT 0,
+    count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS donor_totals (
+    user_id TEXT NOT NULL,
+    donor TEXT NOT NULL COLLATE NOCASE,
+    name TEXT,
+    username TEXT,
+    total INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    first_ts REAL NOT NULL,
+    last_ts REAL NOT NULL,
+    PRIMARY KEY (user_id, donor)
+);
+CREATE TABLE IF NOT EXISTS donors (
+    key TEXT PRIMARY KEY,
+    username TEXT,
+    name TEXT,
+    updated_at REAL NOT NULL,
+    account TEXT
+);
+CREATE TABLE IF NOT EXISTS donor_aliases (
+    alias TEXT PRIMARY KEY,
+    key TEXT NOT NULL
+);
+"""
+INDEXES = """
+CREATE INDEX IF NOT EXISTS events_session ON events(session_id, id);
+CREATE INDEX IF NOT EXISTS events_user ON events(session_id, user_id, id);
+CREATE INDEX IF NOT EXISTS events_ts ON events(ts);
+CREATE INDEX IF NOT EXISTS events_donor ON events(donor, ts);
+CREATE INDEX IF NOT EXISTS donor_totals_rank ON donor_totals(user_id, total DESC);
+"""
+
+
+class EventStore:
+    # Append-only donation log backed by SQLite (WAL mode).
+    # Writes are buffered and flushed in batches on a dedicated thread so the
+    # listener never blocks on disk; the most recent events are also kept in
+    # a ring buffer so the common /api/history reads never touch SQLite.
+    # A read-only store (see attach()) never writes: in multi-process
+    # deployments the ingest process owns the log and workers only read it.
+    def __init__(self, path, recent_size=100, flush_interval=0.5, batch_size=200):
+        self.path = path
+        self.readonly = False
+        self.recent = deque(maxlen=recent_size)
+        self.keep_raw = True  # False: events in `recent` leave out the upstream payload
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.session_id = None
+        self._session_first_id = None
+        self._next_id = 1
+        self._pending = []
+        self._pending_donors = {}  # key -> (username, name, account, ts), written with the next batch
+        self._pending_aliases = {}  # alias -> key
+        self._writing_donors = None  # (donor rows, aliases) of the batch being written
+        self._failed_writes = 0
+        self.rejected = deque(maxlen=REJECTED_SIZE)
+        self._conn = None
+        self._reader = None  # donor lookups, see find_donors()
+        # SQLite connections are bound to their thread, so all DB work goes
+        # through this single worker, except donor lookups: they get their
+        # own so they never queue behind a batch write
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-store")
+        self._lookups = ThreadPoolExecutor(max_workers=1, thread_name_prefix="event-store-lookup")
+        self._wakeup = None
+        self._flush_task = None
+        self._flush_lock = None  # One flush at a time, see flush()
+
+    async def start(self):
+        # Open the database and return the events of the resumed session
+        loop = asyncio.get_running_loop()
+        session_events = await loop.run_in_executor(self._executor, self._open)
+        self._wakeup = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        return session_events
+
+    @property
+    def available(self):
+        # False on a worker until attach() has opened the shared database
+        return self._conn is not None
+
+    async def close(self):
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()
+        async with self._flush_lock:
+            # Never cancelled halfway through a write
+            if self._flush_task:
+                self._flush_task.cancel()
+                self._flush_task = None
+            await self._flush()
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._lookups, self._close_reader)
+        await loop.run_in_executor(self._executor, self._close)
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._conn.executescript(INDEXES)
+
+        now = time.time()
+        row = self._conn.execute("SELECT id, session_id, ts FROM events ORDER BY id DESC LIMIT 1").fetchone()
+        last_session = self._conn.execute("SELECT MAX(id) FROM sessions").fetchone()[0] or 0
+        if row is None:
+            self._next_id = 1
+        else:
+            self._next_id = row[0] + 1
+        with self._conn:
+            if row is not None and now - row[2] <= SESSION_RESUME_WINDOW:
+                self.session_id = row[1]
+                self._conn.execute("UPDATE sessions SET ended_at = NULL WHERE id = ?", (self.session_id,))
+            else:
+                # Sessions left open by a crash end at their last donation
+                self._conn.execute(
+                    "UPDATE sessions SET ended_at = COALESCE("
+                    "(SELECT MAX(ts) FROM events WHERE session_id = sessions.id), started_at) "
+                    "WHERE ended_at IS NULL")
+                self.session_id = max(last_session, row[1] if row else 0) + 1
+                self._conn.execute("INSERT INTO sessions (id, started_at) VALUES (?, ?)", (self.session_id, now))
+
+        rows = self._conn.execute(
+            "SELECT data FROM events WHERE session_id = ? ORDER BY id", (self.session_id,)
+        ).fetchall()
+        session_events = [codec.loads(data) for (data,) in rows]
+        self._remember(session_events)
+        self._session_first_id = session_events[0]["id"] if session_events else self._next_id
+        if session_events:
+            logger.info(f"Resumed session {self.session_id} with {len(session_events)} events")
+        return session_events
+
+    async def attach(self, state, timeout=5):
+        # Read-only: load the session described by another process'
+        # session_state(). Its newest events may still be waiting in that
+        # process' write buffer, so keep reading until they show up.
+        session_id, first_id, last_id = state["session_id"], state["first_id"], state["last_id"]
+        self.readonly = True
+        loop = asyncio.get_running_loop()
+        deadline = time.monotonic() + timeout
+        while True:
+            events = await loop.run_in_executor(self._executor, self._attach, session_id, last_id)
+            if last_id is None or (events and events[-1]["id"] >= last_id) or time.monotonic() >= deadline:
+                break
+            await asyncio.sleep(self.flush_interval)
+        if last_id is not None and (not events or events[-1]["id"] < last_id):
+            logger.warning(f"Session {session_id} is missing events up to {last_id} in the store")
+
+        self.session_id = session_id
+        self.recent.clear()
+        self._remember(events)
+        self._session_first_id = first_id
+        self._next_id = last_id + 1 if last_id is not None else first_id
+        return events
+
+    def _attach(self, session_id, last_id):
+        if self._conn is None:
+            # The main process created and migrated the database already
+            self._conn = sqlite3.connect(self.path)
+        rows = self._conn.execute(
+            "SELECT data FROM events WHERE session_id = ? AND id <= ? ORDER BY id",
+            (session_id, last_id if last_id is not None else -1)
+        ).fetchall()
+        return [codec.loads(data) for (data,) in rows]
+
+    def session_state(self):
+        # What a read-only store needs to attach() to this session
+        return {
+            "session_id": self.session_id,
+            "first_id": self._session_first_id,
+            "last_id": self._next_id - 1 if self._next_id > self._session_first_id else None,
+        }
+
+    def _migrate(self):
+        # Older logs: add the indexed columns, then (re)build them and the
+        # rollups once from the stored JSON, keyed by donor registry key
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(events)")}
+        total_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(donor_totals)")}
+        donor_columns = {row[1] for row in self._conn.execute("PRAGMA table_info(donors)")}
+        has_events = version < 2 and self._conn.execute("SELECT 1 FROM events LIMIT 1").fetchone() is not None
+        if has_events:
+            logger.info("Upgrading the donation log for archive queries...")
+        with self._conn:
+            for column, kind in (("donor", "TEXT COLLATE NOCASE"), ("name", "TEXT"), ("amount", "INTEGER"),
+                                 ("username", "TEXT")):
+                if column not in columns:
+                    self._conn.execute(f"ALTER TABLE events ADD COLUMN {column} {kind}")
+            if "username" not in total_columns:
+                self._conn.execute("ALTER TABLE donor_totals ADD COLUMN username TEXT")
+            if "account" not in donor_columns:
+                self._conn.execute("ALTER TABLE donors ADD COLUMN account TEXT")
+                self._conn.execute("UPDATE donors SET account = key WHERE key LIKE 'id:%'")
+            if has_events:
+                self._backfill()
+            self._conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+    def _backfill(self):
+        after = 0
+        while True:
+            rows = self._conn.execute(
+                "SELECT id, data FROM events WHERE id > ? ORDER BY id LIMIT ?", (after, EXPORT_CHUNK)).fetchall()
+            if not rows:
+                break
+            after = rows[-1][0]
+            updates = []
+            for id_, data in rows:
+                event = codec.loads(data)
+                updates.append((donors.event_key(event), event.get("sender_user"), event.get("sender_name"),
+                                event.get("amount") or 0, id_))
+            self._conn.executemany(
+                "UPDATE events SET donor = ?, username = ?, name = ?, amount = ? WHERE id = ?", updates)
+        self._conn.execute(
+            "INSERT OR IGNORE INTO sessions (id, started_at, ended_at, total, count) "
+            "SELECT session_id, MIN(ts), MAX(ts), SUM(amount), COUNT(*) FROM events GROUP BY session_id")
+        self._conn.execute("DELETE FROM donor_totals")
+        # Names come from each donor's latest donation
+        self._conn.execute(
+            "INSERT INTO donor_totals (user_id, donor, username, name, total, count, first_ts, last_ts) "
+            "SELECT g.user_id, g.donor, latest.username, latest.name, g.total, g.count, g.first_ts, g.last_ts "
+            "FROM (SELECT COALESCE(user_id, '') AS user_id, donor, SUM(amount) AS total, COUNT(*) AS count, "
+            "MIN(ts) AS first_ts, MAX(id) AS last_id, MAX(ts) AS last_ts "
+            "FROM events WHERE donor IS NOT NULL GROUP BY COALESCE(user_id, ''), donor) g "
+            "JOIN events latest ON latest.id = g.last_id")
+
+    def _close(self):
+        if self._conn:
+            if not self.readonly and self.session_id is not None:
+                # End marker; a later restart within the resume window reopens it
+                with self._conn:
+                    self._conn.execute("UPDATE sessions SET ended_at = ? WHERE id = ?", (time.time(), self.session_id))
+            self._conn.close()
+            self._conn = None
+
+    def _close_reader(self):
+        if self._reader:
+            self._reader.close()
+            self._reader = None
+
+    def assign_id(self, event):
+        # Ids are handed out when a donation arrives so every output sees
+        # the same one, even if the log sink writes it a little later
+        event["id"] = self._next_id
+        self._next_id += 1
+        return event["id"]
+
+    def append(self, event, user_id=None):
+        # Non-blocking: assigns an id unless it has one, updates the ring
+        # buffer and queues the write
+        if "id" not in event:
+            self.assign_id(event)
+        self._remember((event,))
+        if self.readonly:
+            # Written by the ingest process; ids come from there too
+            self._next_id = max(self._next_id, event["id"] + 1)
+            return event["id"]
+        self._pending.append((event["id"], self.session_id, user_id, time.time(), event))
+        if len(self._pending) >= self.batch_size and self._wakeup:
+            self._wakeup.set()
+        return event["id"]
+
+    def _remember(self, events):
+        # Only the ring buffer drops "raw"; the log always stores it
+        if not self.keep_raw:
+            events = [codec.without_raw(event) for event in events]
+        self.recent.extend(events)
+
+    async def find_donors(self, aliases):
+        # {alias: (key, username, name, account)} for the aliases the store
+        # knows. Called on registry cache misses; the lookup thread reads
+        # on its own connection (WAL readers never wait on the writer), and
+        # donor rows that haven't been written yet take precedence.
+        unwritten = self._unwritten()
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(self._lookups, self._find_donors, aliases)
+        # Anything saved while the lookup ran is still unwritten, or written
+        for rows, keys in (unwritten, self._unwritten()):
+            for alias in aliases:
+                key = keys.get(alias)
+                if key in rows:
+                    username, name, account, _ = rows[key]
+                    found[alias] = (key, username, name, account)
+        return found
+
+    def _find_donors(self, aliases):
+        if self._reader is None:
+            self._reader = sqlite3.connect(self.path)
+            self._reader.execute("PRAGMA query_only=ON")
+        found = {}
+        for alias in aliases:
+            row = self._reader.execute(
+                "SELECT d.key, d.username, d.name, d.account FROM donor_aliases a "
+                "JOIN donors d ON d.key = a.key WHERE a.alias = ?", (alias,)).fetchone()
+            if row is not None:
+                found[alias] = row
+        return found
+
+    async def recent_donors(self, limit):
+        # (alias, key, username, name, account) of the most recently seen
+        # donors, newest first, up to `limit` aliases
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._recent_donors, limit)
+
+    def _recent_donors(self, limit):
+        return self._conn.execute(
+            "SELECT a.alias, d.key, d.username, d.name, d.account FROM donors d "
+            "JOIN donor_aliases a ON a.key = d.key ORDER BY d.updated_at DESC LIMIT ?", (limit,)).fetchall()
+
+    def _unwritten(self):
+        # Pending donor rows merged with the batch currently being written
+        rows, aliases = self._pending_donors, self._pending_aliases
+        if self._writing_donors:
+            rows = {**self._writing_donors[0], **rows}
+            aliases = {**self._writing_donors[1], **aliases}
+        return rows, aliases
+
+    def save_donor(self, key, username, name, account=None, alias=None):
+        # Non-blocking, like append()
+        if self.readonly:
+            return
+        self._pending_donors[key] = (username, name, account, time.time())
+        if alias is not None:
+            self._pending_aliases[alias] = key
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            if not await self.flush():
+                # Don't hammer a database that just failed, even when a
+                # full batch is waiting
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        # False if the write failed; the events stay queued. Queries, exports
+        # and close() flush too: they wait for a flush already in progress,
+        # so batches are written (and retried) in order and only one is ever
+        # in _writing_donors.
+        if self._flush_lock is None:
+            self._flush_lock = asyncio.Lock()  # Created on the loop that uses it
+        async with self._flush_lock:
+            return await self._flush()
+
+    async def _flush(self):
+        if not self._pending and not self._pending_donors and not self._pending_aliases:
+            return True
+        batch, self._pending = self._pending, []
+        donor_rows, self._pending_donors = self._pending_donors, {}
+        aliases, self._pending_aliases = self._pending_aliases, {}
+        self._writing_donors = (donor_rows, aliases)
+        loop = asyncio.get_running_loop()
+        try:
+            if self._failed_writes < MAX_WRITE_ATTEMPTS:
+                await loop.run_in_executor(self._executor, self._write, batch, donor_rows, aliases)
+            else:
+                batch, donor_rows, aliases = await loop.run_in_executor(
+                    self._executor, self._write_each, batch, donor_rows, aliases)
+                if batch or donor_rows or aliases:
+                    return self._requeue(batch, donor_rows, aliases)
+        except Exception as e:
+            # The transaction rolled back; retry it with the next flush
+            self._failed_writes += 1
+            logger.error(f"Failed to write {len(batch)} events to store (attempt {self._failed_writes}), "
+                         f"will retry: {e}")
+            return self._requeue(batch, donor_rows, aliases)
+        finally:
+            self._writing_donors = None
+        self._failed_writes = 0
+        return True
+
+    def _requeue(self, batch, donor_rows, aliases):
+        # In front of whatever arrived meanwhile
+        self._pending = batch + self._pending
+        self._pending_donors = {**donor_rows, **self._pending_donors}
+        self._pending_aliases = {**aliases, **self._pending_aliases}
+        return False
+
+    def _write_each(self, batch, donor_rows, aliases):
+        # After repeated failures: each event in its own transaction. An
+        # event the database refuses (a constraint, a value that won't
+        # serialize) is set aside; if the database itself fails
+        # (OperationalError: locked, full, I/O) the rest is returned for a
+        # later retry.
+        try:
+            self._write([], donor_rows, aliases)
+        except sqlite3.OperationalError as e:
+            logger.error(f"Store still failing, will retry: {e}")
+            return batch, donor_rows, aliases
+        except Exception as e:
+            logger.error(f"Dropping {len(donor_rows or ())} donor names that can't be stored: {e}")
+        for i, row in enumerate(batch):
+            try:
+                self._write([row])
+            except sqlite3.OperationalError as e:
+                logger.error(f"Store still failing, will retry: {e}")
+                return batch[i:], {}, {}
+            except Exception as e:
+                logger.error(f"Setting aside event {row[0]}, it can't be stored: {e}")
+                self.rejected.append(row[4])
+        return [], {}, {}
+
+    def _write(self, batch, donor_rows=None, aliases=None):
+        # Events, their rollups and new donor aliases go in one transaction,
+        # so the archive totals always match the log
+        sessions = {}
+        rollups = {}
+        for _, session, user, ts, event in batch:
+            amount = event.get("amount") or 0
+            total, count = sessions.get(session, (0, 0))
+            sessions[session] = (total + amount, count + 1)
+            key = (user or "", donors.event_key(event))
+            totals = rollups.get(key)
+            if totals is None:
+                rollups[key] = [event.get("sender_user"), event.get("sender_name"), amount, 1, ts, ts]
+            else:
+                totals[0] = event.get("sender_user")
+                totals[1] = event.get("sender_name")
+                totals[2] += amount
+                totals[3] += 1
+                totals[5] = ts
+        with self._conn:
+            self._conn.executemany(
+                "INSERT INTO events (id, session_id, user_id, ts, data, donor, username, name, amount) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(id_, session, user, ts, codec.dumps(event), donors.event_key(event), event.get("sender_user"),
+                  event.get("sender_name"), event.get("amount") or 0)
+                 for id_, session, user, ts, event in batch]
+            )
+            self._conn.executemany(
+                "UPDATE sessions SET total = total + ?, count = count + ? WHERE id = ?",
+                [(total, count, session) for session, (total, count) in sessions.items()]
+            )
+            for (user, donor), (username, name, total, count, first_ts, last_ts) in rollups.items():
+                updated = self._conn.execute(
+                    "UPDATE donor_totals SET username = ?, name = ?, total = total + ?, count = count + ?, "
+                    "last_ts = ? WHERE user_id = ? AND donor = ?",
+                    (username, name, total, count, last_ts, user, donor)
+                ).rowcount
+                if not updated:
+                    self._conn.execute(
+                        "INSERT INTO donor_totals (user_id, donor, username, name, total, count, first_ts, "
+                        "last_ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        (user, donor, username, name, total, count, first_ts, last_ts))
+            if donor_rows:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO donors (key, username, name, account, updated_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(key, username, name, account, ts)
+                     for key, (username, name, account, ts) in donor_rows.items()])
+            if aliases:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO donor_aliases (alias, key) VALUES (?, ?)", list(aliases.items()))
+
+    async def query(self, since=None, before=None, limit=100, user_id=None):
+        # Page through the current session. `since` returns events after that
+        # id (oldest first), `before` pages backwards, neither returns the
+        # latest `limit` events. Results are always in chronological order.
+        # `user_id` restricts the page to one tracked user.
+        limit = max(1, min(limit, MAX_PAGE_SIZE))
+        events = self._from_recent(since, before, limit, user_id)
+        if events is not None:
+            return events
+
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._query, since, before, limit, user_id)
+
+    def _from_recent(self, since, before, limit, user_id):
+        # Returns None when the ring buffer can't answer the query on its own
+        complete = not self.recent or self.recent[0]["id"] <= self._session_first_id
+
+        def matches(e):
+            return user_id is None or e.get("user_id") == user_id
+
+        if since is not None:
+            if complete or since + 1 >= self.recent[0]["id"]:
+                return [e for e in self.recent if e["id"] > since and matches(e)][:limit]
+            return None
+
+        if before is None:
+            before = self._next_id
+        matching = [e for e in self.recent if e["id"] < before and matches(e)]
+        if complete or len(matching) >= limit:
+            return matching[-limit:]
+        return None
+
+    def _query(self, since, before, limit, user_id):
+        where = "session_id = ?"
+        params = [self.session_id]
+        if user_id is not None:
+            where += " AND user_id = ?"
+            params.append(user_id)
+
+        if since is not None:
+            rows = self._conn.execute(
+                f"SELECT data FROM events WHERE {where} AND id > ? ORDER BY id LIMIT ?",
+                (*params, since, limit)
+            ).fetchall()
+        else:
+            rows = self._conn.execute(
+                f"SELECT data FROM events WHERE {where} AND id < ? ORDER BY id DESC LIMIT ?",
+                (*params, before if before is not None else self._next_id, limit)
+            ).fetchall()
+            rows.reverse()
+        return [codec.loads(data) for (data,) in rows]
+
+    # Archive: every session ever recorded, not just the current one
+
+    async def _read(self, fn, *args):
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def sessions(self, limit=100, before=None):
+        # Newest first, with totals; `before` pages back by session id
+        return await self._read(self._sessions, max(1, min(limit, MAX_PAGE_SIZE)), before)
+
+    def _sessions(self, limit, before):
+        rows = self._conn.execute(
+            "SELECT id, started_at, ended_at, total, count FROM sessions WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (before if before is not None else 2 ** 62, limit)
+        ).fetchall()
+        return [{
+            "id": id_,
+            "started_at": started_at,
+            "ended_at": ended_at,
+            "total": total,
+            "count": count,
+            "current": id_ == self.session_id and ended_at is None,
+        } for id_, started_at, ended_at, total, count in rows]
+
+    async def top_donors(self, limit=10, user_id=None):
+        # All-time leaderboard from the per-donor rollups, no event scan
+        return await self._read(self._top_donors, max(1, min(limit, MAX_PAGE_SIZE)), user_id)
+
+    def _top_donors(self, limit, user_id):
+        if user_id is not None:
+            rows = self._conn.execute(
+                "SELECT donor, username, name, total, count, first_ts, last_ts FROM donor_totals "
+                "WHERE user_id = ? ORDER BY total DESC LIMIT ?", (user_id, limit)
+            ).fetchall()
+        else:
+            # Same donor across tracked users, named as on their latest donation;
+            # the rollup table stays small
+            rows = self._conn.execute(
+                "SELECT g.donor, latest.username, latest.name, g.sum_total, g.count, g.first_ts, g.last_ts "
+                "FROM (SELECT donor, SUM(total) AS sum_total, SUM(count) AS count, MIN(first_ts) AS first_ts, "
+                "MAX(last_ts) AS last_ts FROM donor_totals GROUP BY donor ORDER BY sum_total DESC LIMIT ?) g "
+                "JOIN donor_totals latest ON latest.donor = g.donor AND latest.last_ts = g.last_ts "
+                "GROUP BY g.donor ORDER BY g.sum_total DESC", (limit,)
+            ).fetchall()
+        return [{
+            "rank": rank,
+            "donor": donor,
+            "username": username,
+            "name": name,
+            "amount": total,
+            "count": count,
+            "first_ts": first_ts,
+            "last_ts": last_ts,
+        } for rank, (donor, username, name, total, count, first_ts, last_ts) in enumerate(rows, 1)]
+
+    @staticmethod
+    def _where(filters):
+        # filters: start/end (unix time), donor, session_id, min_amount, user_id.
+        # donor is a username (any name the donor has used) or a donor key.
+        clauses, params = [], []
+        for key, clause in (("start", "ts >= ?"), ("end", "ts < ?"),
+                            ("donor", "donor = COALESCE((SELECT key FROM donor_aliases WHERE alias = ?), ?)"),
+                            ("session_id", "session_id = ?"), ("min_amount", "amount >= ?"),
+                            ("user_id", "user_id = ?")):
+            value = filters.get(key)
+            if value is not None:
+                clauses.append(clause)
+                if key == "donor":
+                    key_given = value.startswith(("id:", "user:"))
+                    params.extend((value, value) if key_given else (donors.user_alias(value),) * 2)
+                else:
+                    params.append(value)
+        return " AND ".join(clauses) or "1", params
+
+    async def search(self, filters, before=None, limit=100):
+        # Newest first; pass the last id as `before` for the next page
+        return await self._read(self._search, filters, before, max(1, min(limit, MAX_PAGE_SIZE)))
+
+    def _search(self, filters, before, limit):
+        where, params = self._where(filters)
+        rows = self._conn.execute(
+            f"SELECT data FROM events WHERE {where} AND id < ? ORDER BY id DESC LIMIT ?",
+            (*params, before if before is not None else 2 ** 62, limit)
+        ).fetchall()
+        return [codec.loads(data) for (data,) in rows]
+
+    async def export(self, filters, fmt="jsonl"):
+        # Async generator of text chunks, oldest first. Reads EXPORT_CHUNK
+        # rows at a time, so an archive of any size streams in constant memory.
+        await self.flush()
+        loop = asyncio.get_running_loop()
+        after = 0
+        if fmt == "csv":
+            yield _csv_rows([EXPORT_FIELDS])
+        while True:
+            rows = await loop.run_in_executor(self._executor, self._export_page, filters, after)
+            if not rows:
+                return
+            after = rows[-1][0]
+            if fmt == "csv":
+                yield _csv_rows(rows)
+            else:
+                yield "".join(codec.dumps(dict(zip(EXPORT_FIELDS, row))) + "\n" for row in rows)
+
+    def _export_page(self, filters, after):
+        where, params = self._where(filters)
+        rows = self._conn.execute(
+            f"SELECT id, session_id, user_id, ts, donor, username, name, amount, data FROM events "
+            f"WHERE {where} AND id > ? ORDER BY id LIMIT ?", (*params, after, EXPORT_CHUNK)
+        ).fetchall()
+        return [(id_, session, user, datetime.fromtimestamp(ts).isoformat(timespec="seconds"), donor, username,
+                 name, amount, codec.loads(data).get("message") or "")
+                for id_, session, user, ts, donor, username, name, amount, data in rows]
+
+
+def _csv_rows(rows):
+    out = io.StringIO()
+    csv.writer(out).writerows(rows)
+    return out.getvalue()
@@ -0,0 +1,84 @@
+import bisect
+
+# Ranks past this point never show on an overlay, so changes there aren't pushed
+DEFAULT_WINDOW = 50
+
+
+class Leaderboard:
+    def __init__(self, window=DEFAULT_WINDOW):
+        self.window = window
+        self.donors = {}   # donor key -> {"username", "name", "amount"}
+        self._order = []   # sorted (-amount, donor key), rank 1 first
+        self.version = 0   # bumped on every change so clients can drop stale deltas
+
+    def __len__(self):
+        return len(self._order)
+
+    def add(self, username, name, amount, key=None):
+        # Apply a donation and return the rows (within the window) whose rank
+        # or contents changed. Position lookups are bisects on the sorted list.
+        # `key` is the donor registry's key; rows are per key, not per username.
+        if key is None:
+            key = username
+        donor = self.donors.get(key)
+        if donor is None:
+            donor = {"username": username, "name": name, "amount": 0}
+            self.donors[key] = donor
+            old_pos = None
+        else:
+            old_pos = bisect.bisect_left(self._order, (-donor["amount"], key))
+            del self._order[old_pos]
+
+        donor["amount"] += amount
+        # Update names in case they changed display name or username
+        donor["username"] = username
+        donor["name"] = name
+
+        entry = (-donor["amount"], key)
+        new_pos = bisect.bisect_left(self._order, entry)
+        self._order.insert(new_pos, entry)
+        self.version += 1
+
+        # Everyone between the new and old position shifted by one rank
+        last = len(self._order) - 1 if old_pos is None else max(old_pos, new_pos)
+        last = min(last, self.window - 1)
+        return [self.row(i) for i in range(new_pos, last + 1)]
+
+    def trim(self, max_donors):
+        # Forget the lowest ranks past `max_donors` (never inside the window)
+        # and return how many. A forgotten donor who gives again starts over.
+        keep = max(max_donors, self.window)
+        if len(self._order) <= keep:
+            return 0
+        dropped = self._order[keep:]
+        del self._order[keep:]
+        for _, key in dropped:
+            del self.donors[key]
+        return len(dropped)
+
+    def row(self, pos):
+        donor = self.donors[self._order[pos][1]]
+        return {
+            "rank": pos + 1,
+            "username": donor["username"],
+            "name": donor["name"],
+            "amount": donor["amount"],
+        }
+
+    def top(self, limit=10):
+        return [self.row(i) for i in range(min(limit, len(self._order)))]
+
+    def snapshot(self, limit=10):
+        return {
+            "version": self.version,
+            "size": len(self._order),
+            "rows": self.top(limit),
+        }
+
+    def delta(self, rows):
+        return {
+            "type": "leaderboard_delta",
+            "version": self.version,
+            "size": len(self._order),
+            "rows": rows,
+        }
@@ -0,0 +1,73 @@
+import atexit
+import logging
+import queue
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+
+# Lines kept for the GUI log view and /api/logs
+DEFAULT_CAPACITY = 2000
+
+
+class LogRing(logging.Handler):
+    # Last `capacity` formatted log lines, each with a sequence number so
+    # readers (the GUI timer, /api/logs) can ask for just what's new.
+    # Runs on the listener thread; readers take the lock only to copy.
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        super().__init__()
+        self.lines = deque(maxlen=capacity)  # (seq, levelno, line)
+        self.next_seq = 0
+        self._lock = threading.Lock()
+
+    def emit(self, record):
+        try:
+            line = self.format(record)
+        except Exception:
+            self.handleError(record)
+            return
+        with self._lock:
+            self.lines.append((self.next_seq, record.levelno, line))
+            self.next_seq += 1
+
+    def tail(self, since=None, limit=200, level=logging.NOTSET):
+        # Lines after `since` (or the newest `limit`), oldest first, and the
+        # seq to pass as `since` next time. A page cut short by `limit` ends
+        # at its last line, so the next call picks up the rest.
+        with self._lock:
+            lines = list(self.lines)
+            next_seq = self.next_seq
+        if since is not None:
+            lines = [entry for entry in lines if entry[0] >= since]
+        lines = [entry for entry in lines if entry[1] >= level]
+        if since is None:
+            lines = lines[-limit:]
+        elif len(lines) > limit:
+            lines = lines[:limit]
+            next_seq = lines[-1][0] + 1
+        return {"next": next_seq, "lines": [line for _, _, line in lines]}
+
+
+class DeferredQueueHandler(QueueHandler):
+    # The stock prepare() formats the record on the calling thread; here the
+    # record goes on the queue as is and the listener thread formats it.
+    # Fine for an in-process queue, where nothing has to be pickled.
+    def prepare(self, record):
+        return record
+
+
+def install(ring, fmt, level=logging.INFO):
+    # Route all logging through a queue: callers (the asyncio loop, the GUI)
+    # only enqueue, and one listener thread formats for the console and the ring
+    formatter = logging.Formatter(fmt)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+    ring.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, console, ring, respect_handler_level=True)
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(DeferredQueueHandler(log_queue))
+    listener.start()
+    atexit.register(listener.stop)  # Writes out whatever is still queued
+    return listener
@@ -0,0 +1,269 @@
+import bisect
+import os
+import sys
+import time
+
+# Stage timings are mostly microseconds; the top buckets catch stalls
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class CounterValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class GaugeValue:
+    __slots__ = ("value",)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+class HistogramValue:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        # Upper bound of the bucket holding the q-th observation
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return bound
+        return float("inf")
+
+
+class Metric:
+    type = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+
+    def labels(self, *values):
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            child = self._children[values] = self._new_child()
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def children(self):
+        return self._children.items()
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def _new_child(self):
+        return CounterValue()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class Gauge(Metric):
+    type = "gauge"
+
+    def __init__(self, name, help, labelnames=(), fn=None):
+        super().__init__(name, help, labelnames)
+        # fn is evaluated at scrape time and returns a number, or a dict of
+        # label-value tuples -> number for labelled gauges
+        self.fn = fn
+
+    def _new_child(self):
+        return GaugeValue()
+
+    def set(self, value):
+        self.labels().set(value)
+
+    def children(self):
+        if self.fn is None:
+            return self._children.items()
+        value = self.fn()
+        if isinstance(value, dict):
+            return [(tuple(str(v) for v in k), _Static(v)) for k, v in value.items()]
+        return [((), _Static(value))]
+
+
+class _Static:
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        self.value = value
+
+
+class Histogram(Metric):
+    type = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+
+    def _new_child(self):
+        return HistogramValue(self.buckets)
+
+    def observe(self, value):
+        self.labels().observe(value)
+
+
+class RateMeter:
+    # Events per second averaged over the last `window` complete seconds,
+    # O(1) per mark()
+    def __init__(self, window=10):
+        self.window = window
+        self.buckets = [0] * window
+        self.second = int(time.monotonic())
+
+    def mark(self, n=1):
+        now = int(time.monotonic())
+        if now != self.second:
+            self._advance(now)
+        self.buckets[now % self.window] += n
+
+    def _advance(self, now):
+        for second in range(self.second + 1, min(now, self.second + self.window) + 1):
+            self.buckets[second % self.window] = 0
+        if now - self.second > self.window:
+            self.buckets = [0] * self.window
+        self.second = now
+
+    def rate(self):
+        now = int(time.monotonic())
+        if now != self.second:
+            self._advance(now)
+        complete = sum(self.buckets) - self.buckets[now % self.window]
+        return complete / (self.window - 1)
+
+
+def resident_memory_bytes():
+    # Current RSS on Linux; elsewhere the peak, which is what the stdlib has
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return 0  # Windows
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def _format_value(value):
+    if value is None:
+        return "NaN"
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def _finite(value):
+    # JSON has no Infinity; past the last bucket we only know "more than that"
+    return None if value == float("inf") else value
+
+
+class Registry:
+    def __init__(self, prefix=""):
+        self.prefix = prefix
+        self.metrics = []
+
+    def _add(self, metric):
+        metric.name = self.prefix + metric.name
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._add(Counter(name, help, labelnames))
+
+    def gauge(self, name, help, labelnames=(), fn=None):
+        return self._add(Gauge(name, help, labelnames, fn))
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def render_prometheus(self):
+        # Prometheus text exposition format 0.0.4
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            for values, child in metric.children():
+                if metric.type == "histogram":
+                    cumulative = 0
+                    for bound, count in zip(metric.buckets, child.counts):
+                        cumulative += count
+                        labels = _format_labels(metric.labelnames, values, ("le", _format_value(bound)))
+                        lines.append(f"{metric.name}_bucket{labels} {cumulative}")
+                    labels = _format_labels(metric.labelnames, values, ("le", "+Inf"))
+                    lines.append(f"{metric.name}_bucket{labels} {child.count}")
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}_sum{labels} {_format_value(child.sum)}")
+                    lines.append(f"{metric.name}_count{labels} {child.count}")
+                else:
+                    labels = _format_labels(metric.labelnames, values)
+                    lines.append(f"{metric.name}{labels} {_format_value(child.value)}")
+        return "\n".join(lines) + "\n"
+
+    def to_json(self):
+        out = {}
+        for metric in self.metrics:
+            entries = {}
+            for values, child in metric.children():
+                key = ",".join(f"{k}={v}" for k, v in zip(metric.labelnames, values)) or "value"
+                if metric.type == "histogram":
+                    entries[key] = {
+                        "count": child.count,
+                        "sum": child.sum,
+                        "avg": child.sum / child.count if child.count else None,
+                        "p50": _finite(child.quantile(0.5)),
+                        "p95": _finite(child.quantile(0.95)),
+                        "p99": _finite(child.quantile(0.99)),
+                    }
+                else:
+                    entries[key] = child.value
+            out[metric.name] = entries.get("value") if list(entries) == ["value"] else entries
+        return out
@@ -0,0 +1,417 @@
+import asyncio
+import base64
+import hashlib
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import codec
+
+logger = logging.getLogger(__name__)
+
+# Per-sink queue size; when a sink falls this far behind its oldest events
+# are dropped so it can never hold up the listener or the other sinks
+MAX_QUEUE = 1000
+RETRY_DELAY = 1  # seconds, doubled after every failed attempt
+CLOSE_TIMEOUT = 2  # seconds to drain queues on shutdown
+
+
+class Envelope:
+    # One donation as handed to the sinks. The leaderboard delta is built
+    # when the donation is applied, so a sink running behind never sends a
+    # newer leaderboard state under an older version.
+    __slots__ = ("event", "stream", "delta", "received_at")
+
+    def __init__(self, event, stream=None, delta=None, received_at=None):
+        self.event = event
+        self.stream = stream
+        self.delta = delta
+        self.received_at = received_at if received_at is not None else time.perf_counter()
+
+
+class Sink:
+    # An output for donation events. Subclasses set `name` and implement
+    # handle(); handle_batch() can be overridden to write several at once.
+    # A failing handle() is retried `retries` times with backoff, then the
+    # batch is counted as failed and the sink moves on. max_queue = 0 means
+    # an unbounded queue, for sinks that must never drop an event.
+    name = None
+    max_queue = MAX_QUEUE
+    batch_size = 1
+    retries = 0
+
+    async def handle(self, envelope):
+        raise NotImplementedError
+
+    async def handle_batch(self, envelopes):
+        for envelope in envelopes:
+            await self.handle(envelope)
+
+    def dropped(self, envelope):
+        # Called for each envelope dropped because the queue was full
+        pass
+
+    async def close(self):
+        pass
+
+
+class SinkWorker:
+    # Bounded queue + worker task for one sink, same drop-oldest policy as
+    # the chat channels
+    def __init__(self, sink, latency=None):
+        self.sink = sink
+        self.latency = latency  # histogram child: publish -> handled
+        self.queue = asyncio.Queue(maxsize=sink.max_queue)
+        self.handled = 0
+        self.dropped = 0
+        self.retried = 0
+        self.failed = 0
+        self.last_error = None
+        self.task = asyncio.create_task(self._worker(), name=f"sink-{sink.name}")
+
+    def put(self, envelope):
+        if self.queue.full():
+            self.sink.dropped(self.queue.get_nowait())
+            self.queue.task_done()
+            self.dropped += 1
+        self.queue.put_nowait(envelope)
+
+    async def _worker(self):
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.sink.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            try:
+                await self._deliver(batch)
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _deliver(self, batch):
+        delay = RETRY_DELAY
+        for attempt in range(self.sink.retries + 1):
+            try:
+                await self.sink.handle_batch(batch)
+                break
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.last_error = str(e) or type(e).__name__
+                if attempt == self.sink.retries:
+                    self.failed += len(batch)
+                    logger.error(f"Sink {self.sink.name} failed, dropping {len(batch)} event(s): {e}")
+                    return
+                self.retried += 1
+                logger.warning(f"Sink {self.sink.name} failed, retrying in {delay}s: {e}")
+                await asyncio.sleep(delay)
+                delay *= 2
+
+        self.handled += len(batch)
+        if self.latency is not None:
+            now = time.perf_counter()
+            for envelope in batch:
+                self.latency.observe(now - envelope.received_at)
+
+    def stats(self):
+        return {
+            "queued": self.queue.qsize(),
+            "handled": self.handled,
+            "dropped": self.dropped,
+            "retried": self.retried,
+            "failed": self.failed,
+            "last_error": self.last_error,
+        }
+
+    async def close(self, timeout=CLOSE_TIMEOUT):
+        # Let queued events go out, but never hang shutdown on a dead
+        # integration; sinks that never drop (the log) always drain
+        if not self.sink.max_queue:
+            timeout = None
+        try:
+            await asyncio.wait_for(self.queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Sink {self.sink.name} still had {self.queue.qsize()} event(s) queued on shutdown")
+        self.task.cancel()
+        try:
+            await self.sink.close()
+        except Exception as e:
+            logger.error(f"Failed to close sink {self.sink.name}: {e}")
+
+
+class Pipeline:
+    # Fans each donation out to every registered sink. publish() only
+    # enqueues, so the listener never waits on an output, and each sink
+    # drains its own queue so a slow or failing one never delays the others.
+    def __init__(self, latency=None):
+        self.latency = latency  # histogram labelled by sink name
+        self.workers = {}  # name -> SinkWorker
+
+    def register(self, sink):
+        # Replaces a sink registered under the same name
+        old = self.workers.pop(sink.name, None)
+        if old is not None:
+            asyncio.create_task(old.close())
+        latency = self.latency.labels(sink.name) if self.latency is not None else None
+        self.workers[sink.name] = SinkWorker(sink, latency)
+
+    async def unregister(self, name):
+        worker = self.workers.pop(name, None)
+        if worker is not None:
+            await worker.close()
+
+    def get(self, name):
+        worker = self.workers.get(name)
+        return worker.sink if worker else None
+
+    def publish(self, envelope):
+        for worker in self.workers.values():
+            worker.put(envelope)
+
+    def stats(self):
+        return {name: worker.stats() for name, worker in self.workers.items()}
+
+    async def close(self):
+        workers = list(self.workers.values())
+        self.workers.clear()
+        await asyncio.gather(*(worker.close() for worker in workers))
+
+
+class LogSink(Sink):
+    # The persistent donation log; EventStore already batches the SQLite
+    # writes on its own thread, so this only hands events over in order.
+    # handle() only queues in memory and can't fall behind for long, so
+    # the queue is unbounded: the archive never loses a donation.
+    name = "log"
+    max_queue = 0
+
+    def __init__(self, event_store):
+        self.event_store = event_store
+
+    async def handle(self, envelope):
+        self.event_store.append(envelope.event, user_id=envelope.event.get("user_id"))
+
+
+class OverlaySink(Sink):
+    # /ws clients: the donation, the leaderboard delta and the alert queue.
+    # Worker processes get their alerts from the ingest process instead.
+    name = "overlays"
+
+    # Deltas only carry the rows that changed, so the rows of dropped ones
+    # are kept and sent along with the stream's next delta.
+    def __init__(self, broadcast, alerts=True):
+        self.broadcast = broadcast  # async def broadcast(message, stream)
+        self.alerts = alerts
+        self.lost = {}  # stream -> (newest dropped delta, {rank: row})
+
+    def dropped(self, envelope):
+        delta = envelope.delta
+        if delta is None:
+            return
+        _, rows = self.lost.get(envelope.stream, (None, {}))
+        for row in delta["rows"]:
+            rows[row["rank"]] = row
+        self.lost[envelope.stream] = (delta, rows)
+
+    async def handle(self, envelope):
+        stream = envelope.stream
+        await self.broadcast(envelope.event, stream)
+        delta = envelope.delta
+        lost = self.lost.pop(stream, None) if self.lost else None
+        if lost is not None:
+            # Newer rows replace lost ones of the same rank
+            rows = lost[1]
+            for row in (delta or lost[0])["rows"]:
+                rows[row["rank"]] = row
+            delta = dict(delta or lost[0], rows=[rows[rank] for rank in sorted(rows)])
+        if delta is not None:
+            await self.broadcast(delta, stream)
+        if self.alerts and stream is not None:
+            stream.alerts.push(envelope.event)
+
+
+class ChatSink(Sink):
+    # Thank-you messages; ChatManager rate limits and merges per platform
+    name = "chat"
+
+    def __init__(self, chat_manager, config):
+        self.chat_manager = chat_manager
+        self.config = config
+
+    async def handle(self, envelope):
+        if envelope.event.get("amount", 0) >= self.config.get("min_amount", 0):
+            self.chat_manager.send_message(envelope.event)
+
+
+class WebhookSink(Sink):
+    # POSTs each donation (without the upstream payload) as JSON. requests
+    # is blocking, so it runs with one reused session on its own thread.
+    name = "webhook"
+    max_queue = 500
+    retries = 3
+    timeout = 5
+
+    def __init__(self, url):
+        self.url = url
+        self._session = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="webhook")
+
+    async def handle(self, envelope):
+        body = codec.dumps(codec.without_raw(envelope.event))
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._post, body)
+
+    def _post(self, body):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        response = self._session.post(self.url, data=body, timeout=self.timeout,
+                                      headers={"Content-Type": "application/json"})
+        response.raise_for_status()
+
+    async def close(self):
+        self._executor.shutdown(wait=False)
+        if self._session is not None:
+            self._session.close()
+
+
+class FileSink(Sink):
+    # Appends donations to a JSON Lines file, a batch per write
+    name = "file"
+    max_queue = 5000
+    batch_size = 200
+    retries = 2
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="export")
+
+    async def handle_batch(self, envelopes):
+        lines = "".join(codec.dumps(codec.without_raw(e.event)) + "\n" for e in envelopes)
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._write, lines)
+
+    def _write(self, lines):
+        if self._file is None:
+            self._file = open(self.path, "a", encoding="utf-8")
+        try:
+            self._file.write(lines)
+            self._file.flush()
+        except OSError:
+            # Reopen on the next attempt, e.g. after the file was moved away
+            self._file.close()
+            self._file = None
+            raise
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._executor, self._close_file)
+        self._executor.shutdown(wait=False)
+
+    def _close_file(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class ObsSink(Sink):
+    # Switches OBS to a scene for donations of at least `min_amount` through
+    # obs-websocket (v5), then back to the previous scene after `seconds`.
+    # Donations arriving during that time wait in the (small) queue.
+    name = "obs"
+    max_queue = 20
+    retries = 1
+
+    def __init__(self, url, password, scene, min_amount=0, seconds=10):
+        self.url = url
+        self.password = password
+        self.scene = scene
+        self.min_amount = min_amount
+        self.seconds = seconds
+        self._ws = None
+        self._next_id = 0
+        self._restore = None  # Scene to switch back to while our switch is pending
+
+    async def handle(self, envelope):
+        if not self.scene or envelope.event.get("amount", 0) < self.min_amount:
+            return
+        try:
+            if self._restore is None:
+                previous = (await self._request("GetCurrentProgramScene")).get("currentProgramSceneName")
+                if previous == self.scene:
+                    return  # Switched there by someone else, not ours to switch back
+                self._restore = previous
+            await self._request("SetCurrentProgramScene", {"sceneName": self.scene})
+            await asyncio.sleep(self.seconds)
+        except Exception:
+            # Reconnect on the retry
+            await self.close()
+            raise
+        finally:
+            await self._switch_back()
+
+    async def _switch_back(self):
+        # Runs whatever happened to the switch (a failure, a dropped
+        # connection, shutdown) so OBS never stays on the alert scene. If
+        # OBS stays unreachable it's left pending and the next donation
+        # switches back.
+        delay = RETRY_DELAY
+        for attempt in range(3):
+            if self._restore is None:
+                return
+            try:
+                await self._request("SetCurrentProgramScene", {"sceneName": self._restore})
+                self._restore = None
+            except Exception as e:
+                await self.close()
+                logger.warning(f"Failed to switch OBS back to {self._restore}: {e}")
+                if attempt < 2:
+                    await asyncio.sleep(delay)
+                    delay *= 2
+
+    async def _connect(self):
+        import websockets
+        ws = await websockets.connect(self.url)
+        hello = codec.loads(await ws.recv())
+        identify = {"rpcVersion": 1, "eventSubscriptions": 0}
+        auth = hello.get("d", {}).get("authentication")
+        if auth:
+            secret = base64.b64encode(hashlib.sha256((self.password + auth["salt"]).encode()).digest()).decode()
+            identify["authentication"] = base64.b64encode(
+                hashlib.sha256((secret + auth["challenge"]).encode()).digest()).decode()
+        await ws.send(codec.dumps({"op": 1, "d": identify}))
+        identified = codec.loads(await ws.recv())
+        if identified.get("op") != 2:
+            await ws.close()
+            raise ConnectionError("OBS did not accept the connection (wrong password?)")
+        return ws
+
+    async def _request(self, request_type, data=None):
+        if self._ws is None:
+            self._ws = await self._connect()
+        self._next_id += 1
+        request_id = str(self._next_id)
+        await self._ws.send(codec.dumps({"op": 6, "d": {
+            "requestType": request_type, "requestId": request_id, "requestData": data or {}}}))
+        while True:
+            reply = codec.loads(await asyncio.wait_for(self._ws.recv(), 5))
+            d = reply.get("d", {})
+            if reply.get("op") == 7 and d.get("requestId") == request_id:
+                status = d.get("requestStatus", {})
+                if not status.get("result"):
+                    raise RuntimeError(f"OBS {request_type} failed: {status.get('comment') or status.get('code')}")
+                return d.get("responseData") or {}
+
+    async def close(self):
+        if self._ws is not None:
+            ws, self._ws = self._ws, None
+            try:
+                await ws.close()
+            except Exception:
+                pass
+
+
+def export_path(path, data_dir):
+    # Relative export paths are kept next to config.json
+    return path if os.path.isabs(path) else os.path.join(data_dir, path)
@@ -0,0 +1,61 @@
+import asyncio
+import logging
+import time
+
+from alerts import AlertScheduler
+from analytics import Analytics
+from broadcaster import Broadcaster
+from leaderboard import Leaderboard
+from upstream import UpstreamMonitor
+
+logger = logging.getLogger(__name__)
+
+
+class Stream:
+    # Everything scoped to one tracked Roblox user: their session leaderboard
+    # and stats, their alert queue, the overlay clients connected to
+    # /ws/<user_id> and upstream connection state
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.leaderboard = Leaderboard()
+        self.analytics = Analytics()
+        self.stats_key = None  # analytics state last pushed to clients
+        self.broadcaster = Broadcaster()
+        self.alerts = AlertScheduler(user_id)  # publish is set by the app
+        self.monitor = UpstreamMonitor(user_id)
+        self.last_used = time.monotonic()  # see housekeeping() in app.py
+
+    def reset(self):
+        # Drop session totals before they are rebuilt from the store
+        self.leaderboard = Leaderboard()
+        self.analytics = Analytics()
+        self.stats_key = None
+
+
+class ListenerSupervisor:
+    # Runs one upstream listener task per tracked user id on the current loop.
+    # sync() is called whenever the config changes: listeners for removed ids
+    # are cancelled immediately and new ids get a fresh task.
+    def __init__(self, listener):
+        self.listener = listener  # async def listener(user_id)
+        self.tasks = {}
+
+    def sync(self, user_ids):
+        wanted = set(user_ids)
+
+        for user_id in list(self.tasks):
+            if user_id not in wanted:
+                logger.info(f"Stopping listener for user {user_id}")
+                self.tasks.pop(user_id).cancel()
+
+        for user_id in wanted:
+            task = self.tasks.get(user_id)
+            if task is None or task.done():
+                self.tasks[user_id] = asyncio.create_task(self.listener(user_id), name=f"listener-{user_id}")
+
+    async def stop(self):
+        tasks = list(self.tasks.values())
+        self.tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
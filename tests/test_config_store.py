@@ -0,0 +1,46 @@
+import pytest
+
+from config_store import ConfigStore
+
+
+def store(tmp_path):
+    return ConfigStore(str(tmp_path / "config.json"))
+
+
+def test_validate_coerces_dashboard_values(tmp_path):
+    validated = store(tmp_path).validate({
+        "user_id": " 123 ",
+        "extra_user_ids": "4, 5,,",
+        "min_amount": "25",
+        "twitch_enabled": "on",
+        "alert_tiers": "100:8, 0:5",
+    })
+    assert validated == {
+        "user_id": "123",
+        "extra_user_ids": ["4", "5"],
+        "min_amount": 25,
+        "twitch_enabled": True,
+        "alert_tiers": [[0, 5], [100, 8]],
+    }
+
+
+def test_validate_blank_values(tmp_path):
+    assert store(tmp_path).validate({"user_id": "", "min_amount": "", "youtube_enabled": ""}) == {
+        "user_id": None, "min_amount": 0, "youtube_enabled": False}
+
+
+def test_validate_ignores_unknown_keys(tmp_path):
+    assert store(tmp_path).validate({"nope": 1}) == {}
+
+
+@pytest.mark.parametrize("key, value", [
+    ("min_amount", "-1"),
+    ("min_amount", True),
+    ("twitch_enabled", "maybe"),
+    ("alert_tiers", "0:0"),
+    ("extra_user_ids", {"a": 1}),
+    ("chat_template", ["x"]),
+])
+def test_validate_rejects_bad_values(tmp_path, key, value):
+    with pytest.raises(ValueError, match=key):
+        store(tmp_path).validate({key: value})
@@ -0,0 +1,55 @@
+import asyncio
+
+from donors import DonorRegistry
+from event_store import EventStore
+
+
+def resolve_all(registry, *senders):
+    async def run():
+        return [await registry.resolve(*sender) for sender in senders]
+    return asyncio.run(run())
+
+
+def test_usernames_match_regardless_of_case():
+    first, second = resolve_all(DonorRegistry(), (None, "Bob", "Bob"), (None, "bob ", "bob"))
+    assert first is second
+    assert second.name == "bob"
+
+
+def test_first_id_joins_the_donor_without_one():
+    before, after = resolve_all(DonorRegistry(), (None, "Bob", "Bob"), ("42", "bob", "Bobby"))
+    assert after is before
+    assert after.key == "user:bob"
+    assert after.account == "id:42"
+
+
+def test_username_of_another_account_is_a_new_donor():
+    registry = DonorRegistry()
+    first, second, renamed = resolve_all(registry, ("42", "bob", "bob"), ("7", "bob", "bob"), ("42", "robert", "Robert"))
+    assert first.key == "id:42"
+    assert second.key == "id:7"
+    assert renamed is first and renamed.username == "robert"
+    # Donations without an id go to whoever used the name last
+    assert registry.cache["user:bob"] is second
+
+
+def test_cold_registry_finds_stored_donors(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def run():
+        store = EventStore(path, flush_interval=60)
+        await store.start()
+        original = await DonorRegistry(store=store).resolve("42", "Bob", "Bob")
+        await store.flush()
+
+        # Not loaded: a cache miss is looked up in the store
+        registry = DonorRegistry(store=store)
+        found = await registry.resolve(None, "BOB", "Bob")
+        by_id = await registry.resolve("42", "bob", "Bob")
+        await store.close()
+        return original, found, by_id, registry
+
+    original, found, by_id, registry = asyncio.run(run())
+    assert found.key == original.key == "id:42"
+    assert by_id is found
+    assert registry.misses == 2 and registry.hits == 0
@@ -0,0 +1,86 @@
+import asyncio
+import sqlite3
+
+from event_store import EventStore, MAX_WRITE_ATTEMPTS
+
+
+def donation(username="bob", amount=5, **extra):
+    return {"type": "donation", "sender_user": username, "sender_name": username, "amount": amount, **extra}
+
+
+def stored(path):
+    conn = sqlite3.connect(path)
+    try:
+        ids = [id_ for (id_,) in conn.execute("SELECT id FROM events ORDER BY id")]
+        total = conn.execute("SELECT total FROM sessions").fetchone()[0]
+    finally:
+        conn.close()
+    return ids, total
+
+
+def test_flush_retries_a_failed_batch(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def run():
+        store = EventStore(path, flush_interval=60)
+        await store.start()
+        write = store._write
+        failures = []
+
+        def flaky(*args):
+            if len(failures) < 2:
+                failures.append(args)
+                raise sqlite3.OperationalError("database is locked")
+            return write(*args)
+
+        store._write = flaky
+        store.append(donation(amount=5))
+        assert await store.flush() is False
+        store.append(donation(amount=7))
+        assert await store.flush() is False
+        assert await store.flush() is True
+        await store.close()
+
+    asyncio.run(run())
+    # Written exactly once, in order, with the totals to match
+    assert stored(path) == ([1, 2], 12)
+
+
+def test_flush_sets_aside_rows_that_never_write(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def run():
+        store = EventStore(path, flush_interval=60)
+        await store.start()
+        store.append(donation(amount=1))
+        store.append(donation(amount=2, bad=object()))  # Won't serialize
+        store.append(donation(amount=3))
+        for _ in range(MAX_WRITE_ATTEMPTS):
+            assert await store.flush() is False
+        assert len(store._pending) == 3
+        # Then row by row: the bad one is set aside, not retried forever
+        assert await store.flush() is True
+        store.append(donation(amount=4))
+        assert await store.flush() is True
+        await store.close()
+        return [event["id"] for event in store.rejected]
+
+    assert asyncio.run(run()) == [2]
+    assert stored(path) == ([1, 3, 4], 8)
+
+
+def test_concurrent_flushes_keep_the_order(tmp_path):
+    path = str(tmp_path / "events.db")
+
+    async def run():
+        store = EventStore(path, flush_interval=60)
+        await store.start()
+        flushes = []
+        for i in range(20):
+            store.append(donation(amount=1))
+            flushes.append(asyncio.ensure_future(store.flush()))
+        assert all(await asyncio.gather(*flushes))
+        await store.close()
+
+    asyncio.run(run())
+    assert stored(path) == (list(range(1, 21)), 20)
@@ -0,0 +1,43 @@
+from leaderboard import Leaderboard
+
+
+def test_add_returns_changed_rows():
+    board = Leaderboard()
+    assert board.add("alice", "Alice", 10) == [{"rank": 1, "username": "alice", "name": "Alice", "amount": 10}]
+    # A new donor below only adds their own row
+    assert [row["username"] for row in board.add("bob", "Bob", 5)] == ["bob"]
+    # Overtaking shifts everyone between the old and new position
+    rows = board.add("bob", "Bob", 10)
+    assert [(row["rank"], row["username"], row["amount"]) for row in rows] == [(1, "bob", 15), (2, "alice", 10)]
+    assert board.version == 3
+
+
+def test_add_merges_by_key_and_updates_names():
+    board = Leaderboard()
+    board.add("Bob", "Bob", 5, key="id:1")
+    rows = board.add("Robert", "Rob", 7, key="id:1")
+    assert len(board) == 1
+    assert rows == [{"rank": 1, "username": "Robert", "name": "Rob", "amount": 12}]
+
+
+def test_add_outside_window_returns_nothing():
+    board = Leaderboard(window=2)
+    board.add("a", "a", 30)
+    board.add("b", "b", 20)
+    assert board.add("c", "c", 10) == []
+    assert board.snapshot(5)["size"] == 3
+
+
+def test_delta_carries_version_and_size():
+    board = Leaderboard()
+    rows = board.add("alice", "Alice", 10)
+    delta = board.delta(rows)
+    assert delta == {"type": "leaderboard_delta", "version": 1, "size": 1, "rows": rows}
+
+
+def test_trim_keeps_the_window():
+    board = Leaderboard(window=2)
+    for i, amount in enumerate((50, 40, 30, 20)):
+        board.add(f"d{i}", f"d{i}", amount)
+    assert board.trim(1) == 2
+    assert [row["username"] for row in board.top(10)] == ["d0", "d1"]
@@ -0,0 +1,56 @@
+import wire
+
+
+def donation(amount=5):
+    return {"type": "donation", "user_id": "1", "sender_user": "bob", "sender_name": "Bob", "amount": amount}
+
+
+def test_since_returns_entries_after_seq():
+    sequencer = wire.Sequencer(size=8)
+    sequencer.activate()
+    for _ in range(3):
+        sequencer.next(donation(), "donations")
+    entries = sequencer.since(sequencer.epoch, 1)
+    assert [entry[0] for entry in entries] == [2, 3]
+    assert entries[0][1] == "donations"
+    assert entries[0][3]["t"] == "d"
+
+
+def test_since_up_to_date_is_empty():
+    sequencer = wire.Sequencer()
+    sequencer.activate()
+    sequencer.next(donation(), "donations")
+    assert sequencer.since(sequencer.epoch, 1) == []
+
+
+def test_since_gap_past_the_ring_needs_a_snapshot():
+    sequencer = wire.Sequencer(size=2)
+    sequencer.activate()
+    for _ in range(5):
+        sequencer.next(donation(), "donations")
+    # 4 and 5 are still in the ring, 2 and 3 are gone
+    assert [entry[0] for entry in sequencer.since(sequencer.epoch, 3)] == [4, 5]
+    assert sequencer.since(sequencer.epoch, 2) is None
+
+
+def test_since_other_epoch_or_future_seq():
+    sequencer = wire.Sequencer()
+    sequencer.activate()
+    sequencer.next(donation(), "donations")
+    assert sequencer.since("0" * 8, 0) is None
+    assert sequencer.since(sequencer.epoch, 5) is None
+
+
+def test_since_before_activation():
+    sequencer = wire.Sequencer()
+    sequencer.next(donation(), "donations")
+    assert sequencer.since(sequencer.epoch, 0) is None
+
+
+def test_unsequenced_messages_keep_the_seq():
+    sequencer = wire.Sequencer()
+    sequencer.activate()
+    assert sequencer.next({"type": "stats"}, "stats") == (0, None)
+    seq, body = sequencer.next(donation(), "donations")
+    assert seq == 1 and body["s"] == 1
+    assert [entry[0] for entry in sequencer.since(sequencer.epoch, 0)] == [1]
@@ -0,0 +1,40 @@
+import asyncio
+import logging
+import time
+from twitchio.ext import commands
+
+logger = logging.getLogger(__name__)
+
+# How long a message waits for the bot to (re)join the channel before it's dropped
+CHANNEL_WAIT_TIMEOUT = 10
+
+class TwitchBot(commands.Bot):
+    def __init__(self, token, channel):
+        # Clean token if it includes "oauth:"
+        if token.startswith("oauth:"):
+            token = token.replace("oauth:", "")
+        channel = channel.strip().lstrip('#').lower()
+        super().__init__(token=token, prefix='!', initial_channels=[channel])
+        self.target_channel = channel
+        self.is_ready = False
+
+    async def event_ready(self):
+        self.is_ready = True
+        logger.info(f'Twitch Bot connected as {self.nick}')
+
+    async def wait_for_channel(self, timeout=CHANNEL_WAIT_TIMEOUT):
+        # The channel shows up in the cache once the bot has joined it
+        deadline = time.monotonic() + timeout
+        while True:
+            channel = self.get_channel(self.target_channel)
+            if channel or time.monotonic() >= deadline:
+                return channel
+            await asyncio.sleep(0.25)
+
+    async def send_to_channel(self, message):
+        # Get channel from cache or wait briefly for the join to finish
+        channel = await self.wait_for_channel()
+        if channel:
+            await channel.send(message)
+        else:
+            logger.warning(f"Twitch channel {self.target_channel} not joined after {CHANNEL_WAIT_TIMEOUT}s, message dropped.")
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import random
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+# PLS DONATE announces its keep-alive interval in {"ping_interval": N} frames.
+# No frame at all for STALL_FACTOR intervals means the stream is stuck even
+# if the TCP connection (and websocket pings) still look healthy.
+DEFAULT_PING_INTERVAL = 10
+STALL_FACTOR = 3
+# A connection that stayed up this long resets the backoff
+STABLE_AFTER = 30
+# Frames replayed after a reconnect arrive within this window
+REPLAY_WINDOW = 15
+MAX_DISCONNECTS = 100
+
+# Payload fields that uniquely identify a donation, if upstream sends them
+ID_FIELDS = ("id", "_id", "purchaseId", "transactionId", "receiptId")
+TIME_FIELDS = ("timestamp", "createdAt", "created", "time")
+
+
+class Backoff:
+    # Exponential backoff with full jitter, so many overlays reconnecting at
+    # once don't hammer upstream in lockstep
+    def __init__(self, base=1.0, cap=60.0, factor=2.0):
+        self.base = base
+        self.cap = cap
+        self.factor = factor
+        self.attempt = 0
+
+    def next(self):
+        delay = random.uniform(0, min(self.cap, self.base * self.factor ** self.attempt))
+        self.attempt += 1
+        return max(delay, self.base / 2)
+
+    def reset(self):
+        self.attempt = 0
+
+
+class DuplicateFilter:
+    # Remembers recent donations so frames replayed after a reconnect aren't
+    # counted twice. With an upstream id (or timestamp) any repeat within
+    # `ttl` is a duplicate. Without one, identical donations are legitimate
+    # (same person, same gamepass) so we only suppress repeats of donations
+    # seen on an earlier connection, arriving right after a reconnect.
+    def __init__(self, max_size=4096, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.seen_at = OrderedDict()  # key -> monotonic time
+        self.suppressed = 0
+
+    @staticmethod
+    def identity(raw):
+        for field in ID_FIELDS:
+            if raw.get(field) is not None:
+                return ("id", str(raw[field])), True
+        sender = raw.get("sender") or {}
+        key = (sender.get("id") or sender.get("username"), raw.get("amount"), raw.get("message"))
+        for field in TIME_FIELDS:
+            if raw.get(field) is not None:
+                return key + (str(raw[field]),), True
+        return key, False
+
+    def is_duplicate(self, raw, connected_at, in_replay_window):
+        key, strong = self.identity(raw)
+        now = time.monotonic()
+        previous = self.seen_at.get(key)
+        self.seen_at[key] = now
+        self.seen_at.move_to_end(key)
+        if len(self.seen_at) > self.max_size:
+            self.seen_at.popitem(last=False)
+
+        if previous is None or now - previous > self.ttl:
+            return False
+        if strong or (in_replay_window and previous < connected_at):
+            self.suppressed += 1
+            return True
+        return False
+
+
+class UpstreamMonitor:
+    # Connection state for one tracked user: liveness, backoff and a record
+    # of every disconnect window (when donations may have been missed)
+    def __init__(self, user_id):
+        self.user_id = user_id
+        self.state = "idle"
+        self.connected_at = None      # monotonic
+        self.connected_since = None   # wall clock, for reporting
+        self.last_frame = None
+        self.ping_interval = None
+        self.stall_reason = None
+        self.reconnects = 0
+        self.disconnects = deque(maxlen=MAX_DISCONNECTS)
+        self.backoff = Backoff()
+        self.duplicates = DuplicateFilter()
+
+    def connecting(self):
+        self.state = "connecting"
+
+    def connected(self):
+        now = time.monotonic()
+        self.state = "connected"
+        self.connected_at = now
+        self.connected_since = time.time()
+        self.last_frame = now
+        self.stall_reason = None
+        # Close the open disconnect window, if any
+        if self.disconnects and self.disconnects[-1]["end"] is None:
+            window = self.disconnects[-1]
+            window["end"] = _iso(self.connected_since)
+            window["duration_s"] = round(self.connected_since - window["_start"], 3)
+
+    def frame(self):
+        self.last_frame = time.monotonic()
+
+    def ping(self, data):
+        interval = data.get("ping_interval") if isinstance(data, dict) else None
+        if isinstance(interval, (int, float)) and interval > 0:
+            self.ping_interval = interval
+
+    def in_replay_window(self):
+        return self.connected_at is not None and time.monotonic() - self.connected_at < REPLAY_WINDOW
+
+    def is_duplicate(self, raw):
+        return self.duplicates.is_duplicate(raw, self.connected_at or 0, self.in_replay_window())
+
+    def disconnected(self, reason):
+        # Returns how long to wait before reconnecting
+        now = time.time()
+        if self.state == "connected" and time.monotonic() - self.connected_at >= STABLE_AFTER:
+            self.backoff.reset()
+        if self.state == "connected":
+            self.disconnects.append({
+                "_start": now,
+                "start": _iso(now),
+                "end": None,
+                "duration_s": None,
+                "reason": self.stall_reason or reason,
+            })
+        elif self.disconnects and self.disconnects[-1]["end"] is None:
+            # Still down; keep the latest failure reason on the open window
+            self.disconnects[-1]["reason"] = reason
+        self.state = "disconnected"
+        self.reconnects += 1
+        return self.backoff.next()
+
+    def stopped(self):
+        self.state = "stopped"
+
+    @property
+    def stall_timeout(self):
+        return (self.ping_interval or DEFAULT_PING_INTERVAL) * STALL_FACTOR
+
+    async def watch(self, ws):
+        # Close the socket if upstream goes quiet; the listener then reconnects
+        while True:
+            await asyncio.sleep(1)
+            silent = time.monotonic() - self.last_frame
+            if silent > self.stall_timeout:
+                self.stall_reason = f"no data for {silent:.0f}s"
+                logger.warning(f"Upstream for user {self.user_id} stalled ({self.stall_reason}), reconnecting")
+                await ws.close()
+                return
+
+    def status(self):
+        now = time.monotonic()
+        return {
+            "user_id": self.user_id,
+            "state": self.state,
+            "connected_since": _iso(self.connected_since) if self.state == "connected" else None,
+            "last_frame_age_s": round(now - self.last_frame, 3) if self.last_frame else None,
+            "ping_interval": self.ping_interval,
+            "reconnects": self.reconnects,
+            "duplicates_suppressed": self.duplicates.suppressed,
+            "disconnects": [{k: v for k, v in w.items() if not k.startswith("_")} for w in self.disconnects],
+        }
+
+
+def _iso(ts):
+    return datetime.fromtimestamp(ts).strftime("%Y-%m-%d %H:%M:%S") if ts else None
@@ -0,0 +1,149 @@
+import os
+from collections import deque
+
+import codec
+
+# Optional compact overlay protocol ("v2") for /ws. Clients opt in with a
+# WebSocket subprotocol (or ?proto=v2 / ?proto=msgpack where they can't set
+# one) and then get:
+#   - one snapshot of the leaderboard state with a sequence number,
+#   - after that only short-keyed deltas, never the upstream "raw" payload,
+#   - on reconnect (?resume=<epoch>:<seq>) just the messages they missed.
+# permessage-deflate is negotiated by Hypercorn whenever the client offers it.
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SUBPROTOCOL_JSON = "plsdonate.v2.json"
+SUBPROTOCOL_MSGPACK = "plsdonate.v2.msgpack"
+
+# Messages that change state get a sequence number and are kept for resume.
+# Stats are pushed as whole snapshots anyway and alerts are only worth
+# showing live, so those just carry the current one.
+SEQUENCED_TYPES = ("donation", "leaderboard_delta")
+REPLAY_SIZE = 1024
+
+
+def negotiate(requested, proto=None):
+    # Returns (format, subprotocol to accept); format None means the
+    # original JSON messages
+    for subprotocol in requested or ():
+        if subprotocol == SUBPROTOCOL_MSGPACK and msgpack is not None:
+            return "msgpack", subprotocol
+        if subprotocol == SUBPROTOCOL_JSON:
+            return "json", subprotocol
+    if proto == "msgpack" and msgpack is not None:
+        return "msgpack", None
+    if proto in ("v2", "json", "msgpack"):
+        return "json", None
+    return None, None
+
+
+def encode(fmt, obj):
+    if fmt == "msgpack":
+        return msgpack.packb(obj)
+    return codec.dumps(obj)
+
+
+def decode(fmt, msg):
+    # Client -> server messages: JSON text, or MessagePack binary from v2 clients
+    if fmt == "msgpack" and isinstance(msg, bytes):
+        return msgpack.unpackb(msg)
+    return codec.loads(msg)
+
+
+def compact_row(row):
+    return [row["rank"], row["username"], row["name"], row["amount"]]
+
+
+def compact(message, seq):
+    kind = message.get("type")
+    if kind == "donation":
+        return {
+            "t": "d",
+            "s": seq,
+            "id": message.get("id"),
+            "u": message.get("user_id"),
+            "n": message.get("sender_name"),
+            "un": message.get("sender_user"),
+            "a": message.get("amount"),
+            "m": message.get("message"),
+            "ts": message.get("timestamp"),
+        }
+    if kind == "leaderboard_delta":
+        return {
+            "t": "l",
+            "s": seq,
+            "u": message.get("user_id"),
+            "v": message["version"],
+            "z": message["size"],
+            "r": [compact_row(row) for row in message["rows"]],
+        }
+    # Stats, alerts and acks keep their normal shape
+    out = codec.without_raw(message)
+    out["s"] = seq
+    return out
+
+
+def snapshot(seq, epoch, leaderboards):
+    # leaderboards: user_id -> Leaderboard.snapshot()
+    return {
+        "t": "snap",
+        "s": seq,
+        "e": epoch,
+        "lb": {
+            user_id: {"v": lb["version"], "z": lb["size"], "r": [compact_row(row) for row in lb["rows"]]}
+            for user_id, lb in leaderboards.items()
+        },
+    }
+
+
+def parse_resume(value):
+    # "<epoch>:<seq>" -> (epoch, seq), or None
+    if not value or ":" not in value:
+        return None
+    epoch, _, seq = value.rpartition(":")
+    try:
+        return epoch, int(seq)
+    except ValueError:
+        return None
+
+
+class Sequencer:
+    # Sequence numbers and a replay ring for one broadcaster. The epoch
+    # changes every process start, so a stale resume falls back to a snapshot.
+    def __init__(self, size=REPLAY_SIZE):
+        self.epoch = os.urandom(4).hex()
+        self.seq = 0
+        self.size = size
+        self.replay = None  # deque of (seq, topic, amount, compact message), once a v2 client shows up
+
+    @property
+    def active(self):
+        return self.replay is not None
+
+    def activate(self):
+        if self.replay is None:
+            self.replay = deque(maxlen=self.size)
+
+    def next(self, message, topic):
+        # Returns (seq, compact message or None)
+        if message.get("type") not in SEQUENCED_TYPES:
+            return self.seq, None
+        self.seq += 1
+        if self.replay is None:
+            return self.seq, None
+        body = compact(message, self.seq)
+        self.replay.append((self.seq, topic, message.get("amount"), body))
+        return self.seq, body
+
+    def since(self, epoch, seq):
+        # Entries after `seq`, or None if they're no longer (or never were) here
+        if self.replay is None or epoch != self.epoch or seq > self.seq:
+            return None
+        if seq == self.seq:
+            return []
+        if not self.replay or self.replay[0][0] > seq + 1:
+            return None
+        return [entry for entry in self.replay if entry[0] > seq]